@@ -0,0 +1,75 @@
+import http.server
+import threading
+
+import pytest
+
+
+class LocalServer(object):
+    """
+    An HTTP/1.1 server on a local port that answers from a table of routes.
+    """
+
+    def __init__(self):
+        # Path -> (status, headers, body)
+        self.routes = {}
+
+        # The paths after which the connection is closed without telling the client
+        self.dropped = set()
+
+        self.connections = 0
+        self.requests = []
+
+        server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                server.connections += 1
+
+            def do_GET(self):
+                self.respond()
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                self.respond()
+
+            def respond(self):
+                server.requests.append((self.command, self.path))
+                status, headers, body = server.routes.get(self.path, (404, {}, b"Not found"))
+
+                if "ETag" in headers and self.headers.get("If-None-Match") == headers["ETag"]:
+                    status, body = 304, b""
+
+                self.send_response(status)
+
+                for name, value in headers.items():
+                    self.send_header(name, value)
+
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+                if self.path in server.dropped:
+                    self.close_connection = True
+
+            def log_message(self, *args):
+                pass
+
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True)
+
+    def url(self, path):
+        return "http://127.0.0.1:%d%s" % (self.server.server_port, path)
+
+
+@pytest.fixture
+def local_server():
+    server = LocalServer()
+    server.thread.start()
+
+    yield server
+
+    server.server.shutdown()
+    server.server.server_close()
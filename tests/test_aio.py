@@ -0,0 +1,192 @@
+import asyncio
+import urllib.error
+
+import pytest
+
+from textbrowser.aio import AsyncConnectionPool
+
+
+def run_with_server(respond, client):
+    """
+    Runs a client coroutine against a local asyncio server
+    :param respond: a function of the connection number, the request number on it and the request head,
+                    returning the raw response bytes, or None to close the connection without a response
+    :param client: a coroutine function of the pool and the server URL
+    :return: what the client returned, and the number of connections the server accepted
+    """
+
+    connections = []
+
+    async def handle(reader, writer):
+        connection = len(connections)
+        connections.append(connection)
+        request = 0
+
+        while True:
+            head = await reader.readuntil(b"\r\n\r\n")
+            response = respond(connection, request, head)
+            request += 1
+
+            if response is None:
+                break
+
+            writer.write(response)
+            await writer.drain()
+
+        writer.close()
+
+    async def main():
+        server = await asyncio.start_server(handle, "127.0.0.1", 0)
+        pool = AsyncConnectionPool(read_timeout=5.0)
+
+        try:
+            url = "http://127.0.0.1:%d" % server.sockets[0].getsockname()[1]
+            return await client(pool, url)
+        finally:
+            pool.close()
+            server.close()
+
+    return asyncio.run(main()), len(connections)
+
+
+def ok(body):
+    return b"HTTP/1.1 200 OK\r\nContent-Length: %d\r\n\r\n%s" % (len(body), body)
+
+
+async def read_all(pool, urls):
+    bodies = []
+
+    for url in urls:
+        response = await pool.open(url)
+        bodies.append(await response.read())
+
+    return bodies
+
+
+def test_keep_alive_connection_is_reused():
+    bodies, connections = run_with_server(lambda connection, request, head: ok(b"page %d" % request),
+                                          lambda pool, url: read_all(pool, [url + "/a", url + "/b", url + "/c"]))
+
+    assert bodies == [b"page 0", b"page 1", b"page 2"]
+    assert connections == 1
+
+
+def test_chunked_body():
+    response = b"HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n5\r\nhello\r\n6;x=y\r\n world\r\n0\r\nA: b\r\n\r\n"
+    bodies, connections = run_with_server(lambda connection, request, head: response,
+                                          lambda pool, url: read_all(pool, [url, url]))
+
+    assert bodies == [b"hello world"] * 2
+    assert connections == 1
+
+
+def test_interim_responses_are_skipped():
+    response = (b"HTTP/1.1 100 Continue\r\n\r\n"
+                b"HTTP/1.1 103 Early Hints\r\nLink: </style.css>; rel=preload\r\n\r\n" + ok(b"final"))
+    bodies, connections = run_with_server(lambda connection, request, head: response,
+                                          lambda pool, url: read_all(pool, [url, url]))
+
+    assert bodies == [b"final"] * 2
+    assert connections == 1
+
+
+def test_dropped_idle_connection_is_retried():
+    # Every connection only answers its first request, and is closed when the next one arrives
+    def respond(connection, request, head):
+        return ok(b"connection %d" % connection) if request == 0 else None
+
+    bodies, connections = run_with_server(respond, lambda pool, url: read_all(pool, [url, url]))
+
+    assert bodies == [b"connection 0", b"connection 1"]
+    assert connections == 2
+
+
+def test_redirects_are_followed():
+    def respond(connection, request, head):
+        if head.startswith(b"GET /old "):
+            return b"HTTP/1.1 301 Moved Permanently\r\nLocation: /new\r\nContent-Length: 5\r\n\r\nmoved"
+
+        return ok(b"new")
+
+    async def client(pool, url):
+        response = await pool.open(url + "/old")
+        return response.geturl(), await response.read()
+
+    (final_url, body), connections = run_with_server(respond, client)
+
+    assert final_url.endswith("/new")
+    assert body == b"new"
+    assert connections == 1
+
+
+def test_redirect_turns_a_post_into_a_get(local_server):
+    local_server.routes["/old"] = (302, {"Location": "/new"}, b"moved")
+    local_server.routes["/new"] = (200, {}, b"new")
+
+    async def client():
+        pool = AsyncConnectionPool()
+        response = await pool.open(local_server.url("/old"), b"q=1")
+        body = await response.read()
+        pool.close()
+
+        return response.geturl(), body
+
+    assert asyncio.run(client()) == (local_server.url("/new"), b"new")
+
+    # The redirect body was read, so the GET goes over the same connection
+    assert local_server.requests == [("POST", "/old"), ("GET", "/new")]
+    assert local_server.connections == 1
+
+
+def test_fetch_all_reads_every_url_at_most_max_concurrency_at_a_time():
+    def respond(connection, request, head):
+        if head.startswith(b"GET /missing "):
+            return b"HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\n\r\n"
+
+        return ok(head.split(b" ")[1])
+
+    async def client(pool, url):
+        pool.max_concurrency = 2
+        urls = [url + "/%d" % i for i in range(6)] + [url + "/missing"]
+
+        return {result_url[len(url):]: result async for result_url, result in pool.fetch_all(urls)}
+
+    results, connections = run_with_server(respond, client)
+
+    assert {path: results[path] for path in results if path != "/missing"} == \
+        {"/%d" % i: b"/%d" % i for i in range(6)}
+    assert isinstance(results["/missing"], urllib.error.HTTPError)
+    assert connections == 2
+
+
+def test_fetch_all_cancels_the_fetches_left_when_stopped():
+    async def client(pool, url):
+        async def read_slowly(response):
+            await asyncio.sleep(0.05 * int(response.url[-1]))
+            return await response.read()
+
+        fetches = pool.fetch_all([url + "/%d" % i for i in range(4)], read_slowly)
+        first = await fetches.__anext__()
+        await fetches.aclose()
+
+        # Nothing is left fetching in the background
+        running = [task for task in asyncio.all_tasks() if "fetch_all" in task.get_coro().__qualname__]
+        return first, running
+
+    (first, running), connections = run_with_server(lambda connection, request, head: ok(b"page"), client)
+
+    assert first[0].endswith("/0") and first[1] == b"page"
+    assert running == []
+
+
+def test_error_status_raises():
+    async def client(pool, url):
+        with pytest.raises(urllib.error.HTTPError) as error:
+            await pool.open(url)
+
+        return error.value.code
+
+    code, connections = run_with_server(
+        lambda connection, request, head: b"HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\n\r\n", client)
+
+    assert code == 404
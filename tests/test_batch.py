@@ -0,0 +1,114 @@
+import asyncio
+import concurrent.futures
+import gzip
+import io
+import json
+import threading
+
+from textbrowser import batch
+from textbrowser.aio import AsyncConnectionPool
+from textbrowser.batch import BatchRunner, render_page
+from textbrowser.budget import Budget
+
+
+def test_render_page_collects_links_and_forms():
+    result = render_page("http://example.com/", b"<p><a href='/a'>A</a></p><form action='/f'><input name='q'></form>")
+
+    assert result["links"] == ["http://example.com/a"]
+    assert result["forms"][0]["action"] == "http://example.com/f"
+    assert result["forms"][0]["inputs"][0]["name"] == "q"
+    assert result["truncated"] is None
+
+
+def test_render_page_stops_at_the_nesting_limit():
+    body = b"<div>" * 100 + b"deep" + b"</div>" * 100
+
+    for parse_processes in [None, 2]:
+        result = render_page("http://example.com/", body, budget=Budget(max_depth=10), parse_processes=parse_processes)
+
+        assert result["truncated"] == "more than 10 nested elements"
+        assert "Page truncated: more than 10 nested elements" in result["text"]
+
+
+def test_render_page_stops_at_the_token_limit():
+    result = render_page("http://example.com/", b"<p>x</p>" * 1000, budget=Budget(max_tokens=100))
+
+    assert result["truncated"] == "more than 100 tokens"
+    assert result["text"].count("x") == 33
+
+
+def test_fetch_stops_decompressing_at_the_body_limit(local_server):
+    local_server.routes["/bomb"] = (200, {"Content-Encoding": "gzip"}, gzip.compress(b"<p>" + b" " * 16 * 1024 * 1024))
+    runner = BatchRunner(io.StringIO(), budget=Budget(max_body_size=1024 * 1024))
+
+    async def fetch():
+        pool = AsyncConnectionPool()
+
+        try:
+            return await runner.read_body(await pool.open(local_server.url("/bomb")))
+        finally:
+            pool.close()
+
+    url, body, transfer_size, charset, truncated = asyncio.run(fetch())
+
+    assert len(body) == 1024 * 1024
+    assert transfer_size < 64 * 1024
+    assert truncated == "more than 1048576 bytes"
+
+
+def test_run_reports_a_page_that_couldnt_be_submitted(tmp_path, monkeypatch):
+    class BrokenExecutor(concurrent.futures.ThreadPoolExecutor):
+        def submit(self, *args, **kwargs):
+            raise concurrent.futures.process.BrokenProcessPool("A process terminated abruptly")
+
+    monkeypatch.setattr(batch.concurrent.futures, "ProcessPoolExecutor", BrokenExecutor)
+    page = tmp_path / "page.html"
+    page.write_bytes(b"<p>text</p>")
+
+    output = io.StringIO()
+    runner = BatchRunner(output)
+    stats = {}
+
+    # The runner used to wait forever for the page
+    thread = threading.Thread(target=lambda: stats.update(runner.run([str(page)])), daemon=True)
+    thread.start()
+    thread.join(10)
+
+    assert not thread.is_alive()
+    assert stats["failed"] == 1
+    assert "BrokenProcessPool" in output.getvalue()
+
+
+def test_missing_file_is_reported_per_source(tmp_path):
+    page = tmp_path / "page.html"
+    page.write_bytes(b"<p>text</p>")
+    missing = str(tmp_path / "missing.html")
+
+    output = io.StringIO()
+    stats = BatchRunner(output, processes=1).run([missing, str(page)])
+    results = [json.loads(line) for line in output.getvalue().splitlines()]
+
+    assert stats["pages"] == 1 and stats["failed"] == 1
+    assert {"url": missing, "error": "ValueError('Not an existing file or a URL: %s')" % missing} in results
+    assert batch.source_url("example.com/a") == "http://example.com/a"
+
+
+def test_pages_are_fetched_concurrently(local_server, tmp_path):
+    for name in "abcd":
+        local_server.routes["/" + name] = (200, {}, b"<p>page %s</p>" % name.encode())
+
+    page = tmp_path / "page.html"
+    page.write_bytes(b"<p>local</p>")
+
+    output = io.StringIO()
+    stats = BatchRunner(output, workers=2, processes=1).run([local_server.url("/" + name) for name in "abcd"] +
+                                                            [str(page), local_server.url("/missing")])
+    results = {result["url"]: result for result in map(json.loads, output.getvalue().splitlines())}
+
+    assert stats["pages"] == 5 and stats["failed"] == 1
+    assert "page c" in results[local_server.url("/c")]["text"]
+    assert "local" in results[batch.source_url(str(page))]["text"]
+    assert "HTTPError" in results[local_server.url("/missing")]["error"]
+
+    # The fetches share the two connections of the pool
+    assert local_server.connections <= 2
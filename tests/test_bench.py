@@ -0,0 +1,13 @@
+from textbrowser.bench import Fixture, generate_page, node_memory
+
+
+def test_node_memory_counts_what_the_tree_keeps():
+    fixture = Fixture("text", 64 * 1024, generate_page("text", 64 * 1024))
+
+    record = node_memory(fixture)
+
+    assert record["type"] == "node-memory" and record["nodes"] > 1000
+    assert record["bytes_per_node"] == record["tree_bytes"] / record["nodes"]
+
+    # A slotted node and its share of the page text, far from the size of an object with a __dict__
+    assert 50 < record["bytes_per_node"] < 400
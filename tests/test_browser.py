@@ -0,0 +1,173 @@
+import asyncio
+
+from textbrowser.bench import generate_page
+from textbrowser.browser import Browser
+from textbrowser.budget import Budget
+from textbrowser.layout import WordWrapLayout
+from textbrowser.pager import Pager
+from textbrowser.parser import HTMLParser
+
+
+class ChunkedResponse(object):
+    """
+    A response that hands out its body in given chunks, and calls back before every read.
+    """
+
+    def __init__(self, chunks, before_read):
+        self.chunks = list(chunks)
+        self.before_read = before_read
+        # With a header charset, decoding doesn't wait for a <meta> charset declaration
+        self.headers = {"Content-Type": "text/html; charset=utf-8"}
+
+    def geturl(self):
+        return "http://example.com/"
+
+    def read(self, amt=None):
+        self.before_read()
+        return self.chunks.pop(0) if self.chunks else b""
+
+
+def new_browser(**kwargs):
+    browser = Browser(layout=WordWrapLayout(80), **kwargs)
+    browser.url = "http://example.com/"
+    return browser
+
+
+def load(browser, chunks, before_read=lambda: None):
+    asyncio.run(browser.process_stream(ChunkedResponse(chunks, before_read)))
+
+
+def test_streamed_page_is_rendered_before_it_is_complete(capsys):
+    browser = new_browser()
+    printed = []
+    chunks = [b"<html><body><p>First paragraph</p>", b"<p><a href='/next'>Second", b"</a></p>", b"</body></html>"]
+
+    load(browser, chunks, lambda: printed.append(capsys.readouterr().out))
+
+    # Every paragraph is printed as soon as it is complete, long before </html>
+    assert "First paragraph" in printed[1]
+    assert "Second" not in printed[2]
+    assert "Second" in printed[3]
+    assert browser.hyperlinks == ["http://example.com/next"]
+
+
+def test_streamed_page_renders_like_the_whole_page():
+    text = ("<html><head><title>T</title></head><body><div><form action='/f'><p>Name <input name='n'></p>"
+            "<select name='s'><option value='a'>A</option></select></form><ul><li>one<li>two</ul></div>"
+            "<b>bold <i>both</i></b></body></html>")
+
+    whole = new_browser()
+    whole.render(HTMLParser.parse(text))
+
+    streamed = new_browser()
+    load(streamed, [text[i:i + 5].encode() for i in range(0, len(text), 5)])
+
+    assert streamed.rendered == whole.rendered
+    assert [list(form.inputs) for form in streamed.forms] == [list(form.inputs) for form in whole.forms]
+
+
+def test_first_screen_is_shown_before_the_page_is_complete(capsys):
+    browser = new_browser(pager=Pager(5, 5))
+    printed = []
+    chunks = [b"<html><body>"] + [b"<p>Paragraph %d</p>" % i for i in range(100)] + [b"</body></html>"]
+
+    load(browser, chunks, lambda: printed.append(capsys.readouterr().out))
+
+    # The screen and the lookahead are laid out after the tenth paragraph, the screen is printed right away
+    first_screen = next(i for i, text in enumerate(printed) if "Paragraph 0" in text)
+    assert first_screen < 15
+    assert "Paragraph 4" in printed[first_screen]
+    assert "Paragraph 5" not in printed[first_screen]
+
+    # The screen is cleared once for every screen shown
+    assert "".join(printed).count("\x1bc") == 1
+    browser.execute("next")
+    assert capsys.readouterr().out.count("\x1bc") == 1
+
+
+def test_bad_form_index_is_reported(capsys):
+    browser = new_browser()
+    browser.render(HTMLParser.parse("<form action='/f'><input name='q'></form>"))
+
+    browser.execute("#x")
+    browser.execute("!-1")
+    browser.execute("#5")
+
+    assert capsys.readouterr().out.count("Invalid form index!") == 3
+
+
+def test_command_loop_goes_on_after_a_failing_command(monkeypatch, capsys):
+    commands = iter(["boom", "help"])
+
+    def read_command(prompt):
+        try:
+            return next(commands)
+        except StopIteration:
+            raise EOFError
+
+    browser = new_browser()
+    executed = []
+    execute = browser.execute
+
+    def failing_execute(command):
+        executed.append(command)
+
+        if command == "boom":
+            raise ValueError("bad input")
+
+        execute(command)
+
+    monkeypatch.setattr("builtins.input", read_command)
+    monkeypatch.setattr(browser, "execute", failing_execute)
+    browser.run()
+
+    assert executed == ["boom", "help"]
+    assert "Couldn't run boom: ValueError('bad input')" in capsys.readouterr().out
+
+
+def test_forms_nested_hundreds_deep_are_rendered():
+    page = generate_page("deep-forms", 64 * 1024)
+    browser = new_browser()
+    browser.render(HTMLParser.parse(page))
+
+    assert len(browser.forms) == page.count("<form ")
+    assert browser.forms[0].action == "http://example.com/level0"
+    assert all(last is not None for first, last in browser.form_lines)
+    assert browser.current_form is None
+
+
+def test_unpaged_page_is_indexed():
+    browser = new_browser()
+    load(browser, [b"<html><head><title> The title </title></head><body><a href='/a'>A</a>"
+                   b"<form action='/f' method='POST'><input name='n' value='v'><select name='s'>"
+                   b"<option value='1'>One</option></select></form></body></html>"])
+
+    assert browser.title() == "The title"
+    assert browser.indexed_hyperlinks() == browser.hyperlinks == ["http://example.com/a"]
+
+    form, = browser.indexed_forms()
+    assert (form.action, form.method) == ("http://example.com/f", "post")
+    assert [(i.name, i.value) for i in form.get_inputs()] == [(i.name, i.value) for i in browser.forms[0].get_inputs()]
+
+
+def test_going_back_restores_the_state_of_the_page(local_server):
+    local_server.routes["/long"] = (200, {}, b"<title>Long</title>" + b"<p>paragraph</p>" * 100)
+    local_server.routes["/short"] = (200, {}, b"<title>Short</title><p>short</p>")
+
+    async def browse():
+        browser = Browser(layout=WordWrapLayout(80), budget=Budget(max_tokens=50))
+        await browser.go(local_server.url("/long"))
+        long_state = (browser.title(), browser.truncated, browser.transfer_size, browser.decoded_size)
+
+        await browser.go(local_server.url("/short"))
+        assert (browser.title(), browser.truncated) == ("Short", None)
+
+        browser.execute("back")
+        browser.pool.close()
+        return browser, long_state
+
+    browser, long_state = asyncio.run(browse())
+
+    assert (browser.title(), browser.truncated, browser.transfer_size, browser.decoded_size) == long_state
+    assert long_state[1] is not None and long_state[2] > 0
+    assert browser.rendered.count("Page truncated") == 1
@@ -0,0 +1,62 @@
+import asyncio
+
+from textbrowser.browser import Browser
+from textbrowser.budget import Budget
+from textbrowser.layout import WordWrapLayout
+from textbrowser.pager import Pager
+from textbrowser.parser import HTMLParser
+from textbrowser.prefetch import PrefetchedResponse
+
+PAGE = b"<html><body>" + b"<p>Paragraph of text</p>" * 1000 + b"</body></html>"
+
+
+def test_parser_stops_at_the_token_limit():
+    parser = HTMLParser(max_tokens=10)
+    elements = parser.feed("<p>a</p>" * 10) + parser.close()
+
+    assert parser.truncated == "more than 10 tokens"
+    assert len(elements) == 4
+    assert elements[-1].inner_elements == []
+
+
+def test_parser_stops_at_the_nesting_limit():
+    parser = HTMLParser(max_depth=3)
+    elements = parser.feed("<div><div><div><div>deep</div></div></div></div><p>after</p>") + parser.close()
+
+    assert parser.truncated == "more than 3 nested elements"
+    assert len(elements) == 1
+    assert elements[0].inner_elements[0].inner_elements[0].inner_elements == []
+
+
+def load(budget, pager=None):
+    browser = Browser(layout=WordWrapLayout(80), budget=budget, pager=pager)
+    browser.url = "http://example.com/"
+    asyncio.run(browser.process_stream(PrefetchedResponse(browser.url, {}, PAGE)))
+    return browser
+
+
+def test_page_is_cut_at_each_limit(capsys):
+    for budget, reason in [(Budget(max_body_size=1000), "more than 1000 bytes"),
+                           (Budget(max_tokens=100), "more than 100 tokens"),
+                           (Budget(max_depth=1), "more than 1 nested elements"),
+                           (Budget(max_rendered_size=1000), "more than 1000 rendered characters")]:
+        browser = load(budget)
+
+        assert browser.truncated == reason
+        assert browser.rendered.count("Page truncated") == 1
+        assert browser.rendered.count("Paragraph of text") < 1000
+
+
+def test_page_within_the_budget_is_complete(capsys):
+    browser = load(Budget())
+
+    assert browser.truncated is None
+    assert browser.rendered.count("Paragraph of text") == 1000
+
+
+def test_paged_page_is_cut_with_a_marker(capsys):
+    browser = load(Budget(max_tokens=100), Pager(10, 10))
+    browser.render_lazily(lambda: False)
+    browser.lay_out()
+
+    assert browser.pager.lines[-1].endswith("---- Page truncated: more than 100 tokens ----\x1b[21m\x1b[39m")
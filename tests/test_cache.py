@@ -0,0 +1,122 @@
+import asyncio
+import email.utils
+import inspect
+import time
+
+from textbrowser.aio import AsyncConnectionPool
+from textbrowser.cache import CachedResponse, HTTPCache, freshness_lifetime
+
+
+def run(client):
+    """
+    Runs a client coroutine with a new pool
+    :param client: a coroutine function of the AsyncConnectionPool
+    :return: what the client returned
+    """
+
+    async def main():
+        pool = AsyncConnectionPool()
+
+        try:
+            return await client(pool)
+        finally:
+            pool.close()
+
+    return asyncio.run(main())
+
+
+async def read(response, amt=None):
+    # Cached responses are read directly, network ones with asyncio
+    data = response.read(amt)
+    return await data if inspect.isawaitable(data) else data
+
+
+def test_freshness_lifetime():
+    now = time.time()
+
+    assert freshness_lifetime({"Cache-Control": "public, max-age=60"}) == 60
+    assert freshness_lifetime({"Cache-Control": "no-cache, max-age=60"}) == 0
+    assert freshness_lifetime({"Date": email.utils.formatdate(now),
+                               "Expires": email.utils.formatdate(now + 100)}) == 100
+    assert freshness_lifetime({"Date": email.utils.formatdate(now),
+                               "Last-Modified": email.utils.formatdate(now - 1000)}) == 100
+    assert freshness_lifetime({"Expires": "0"}) == 0
+    assert freshness_lifetime({}) == 0
+
+
+def test_fresh_response_is_served_from_the_cache(local_server, tmp_path):
+    local_server.routes["/page"] = (200, {"Cache-Control": "max-age=60"}, b"cached page")
+    cache = HTTPCache(str(tmp_path))
+
+    async def client(pool):
+        assert await read(await cache.open(pool, local_server.url("/page"))) == b"cached page"
+
+        response = await cache.open(pool, local_server.url("/page"))
+        assert isinstance(response, CachedResponse)
+        assert response.read() == b"cached page"
+        response.close()
+
+        # The entries are found again by a new cache on the same directory
+        response = await HTTPCache(str(tmp_path)).open(pool, local_server.url("/page"))
+        assert isinstance(response, CachedResponse)
+        response.close()
+
+    run(client)
+
+    assert local_server.requests == [("GET", "/page")]
+    assert cache.stats()["hits"] == 1
+
+
+def test_stale_response_is_revalidated(local_server, tmp_path):
+    local_server.routes["/page"] = (200, {"ETag": '"v1"'}, b"validated page")
+    cache = HTTPCache(str(tmp_path))
+
+    async def client(pool):
+        bodies = []
+
+        for _ in range(2):
+            response = await cache.open(pool, local_server.url("/page"))
+            bodies.append(await read(response))
+            response.close()
+
+        return bodies
+
+    assert run(client) == [b"validated page"] * 2
+    assert cache.stats()["revalidated"] == 1
+    assert len(local_server.requests) == 2
+
+
+def test_uncacheable_and_partly_read_responses_are_not_stored(local_server, tmp_path):
+    local_server.routes["/private"] = (200, {"Cache-Control": "no-store, max-age=60"}, b"private")
+    local_server.routes["/big"] = (200, {"Cache-Control": "max-age=60"}, b"x" * 100000)
+    cache = HTTPCache(str(tmp_path))
+
+    async def client(pool):
+        assert await read(await cache.open(pool, local_server.url("/private"))) == b"private"
+
+        response = await cache.open(pool, local_server.url("/big"))
+        await read(response, 10)
+        response.close()
+
+    run(client)
+
+    assert cache.stats()["entries"] == 0
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_least_recently_used_response_is_evicted(local_server, tmp_path):
+    for name in "abc":
+        local_server.routes["/" + name] = (200, {"Cache-Control": "max-age=60"}, name.encode() * 100)
+
+    cache = HTTPCache(str(tmp_path), max_size=250)
+
+    async def client(pool):
+        for name in "abac":
+            response = await cache.open(pool, local_server.url("/" + name))
+            await read(response)
+            response.close()
+
+        return [isinstance(await cache.open(pool, local_server.url("/" + name)), CachedResponse) for name in "ab"]
+
+    assert run(client) == [True, False]
+    assert cache.stats()["evicted"] == 1
@@ -0,0 +1,40 @@
+import codecs
+
+from textbrowser.charset import StreamDecoder, charset_from_headers, normalize_charset, sniff_charset
+
+META = b'<html><head><meta charset="iso-8859-2"></head>'
+
+
+def decode(decoder, data, chunk_size=3):
+    text = "".join(decoder.decode(data[i:i + chunk_size]) for i in range(0, len(data), chunk_size))
+    return text + decoder.decode(b"", True)
+
+
+def test_charsets_are_sniffed_from_a_bom_or_a_meta_tag():
+    assert sniff_charset(codecs.BOM_UTF8 + b"<p>") == ("utf-8-sig", True)
+    assert sniff_charset(codecs.BOM_UTF16_LE + "<p>".encode("utf-16-le")) == ("utf-16", True)
+    assert sniff_charset(META) == ("iso8859-2", False)
+    assert sniff_charset(b"<meta http-equiv='Content-Type' content='text/html; charset=Shift_JIS'>") == \
+        ("shift_jis", False)
+    assert sniff_charset(b"<p>no declaration</p>") is None
+
+    # An ASCII-compatible declaration can't be right about UTF-16
+    assert sniff_charset(b'<meta charset="utf-16">') == ("utf-8", False)
+
+
+def test_labels_are_resolved_like_browsers_do():
+    assert normalize_charset(" Latin1 ") == "cp1252"
+    assert normalize_charset("no-such-charset") is None
+    assert charset_from_headers({"Content-Type": 'text/html; charset="UTF-8"'}) == "utf-8"
+    assert charset_from_headers({}) is None
+
+
+def test_bom_wins_over_the_header_and_the_header_over_the_meta_tag():
+    text = "Žluťoučký"
+
+    assert decode(StreamDecoder("cp1252"), codecs.BOM_UTF8 + text.encode("utf-8")) == text
+    assert decode(StreamDecoder("utf-8"), META + text.encode("utf-8")) == META.decode() + text
+    assert decode(StreamDecoder(None), META + text.encode("iso-8859-2")) == META.decode() + text
+
+    # Without any declaration the page is read as UTF-8
+    assert decode(StreamDecoder(None), text.encode("utf-8")) == text
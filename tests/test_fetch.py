@@ -0,0 +1,19 @@
+import gzip
+import zlib
+
+import pytest
+
+from textbrowser.fetch import ContentDecoder
+
+
+def test_content_decoder_handles_gzip_members_and_raw_deflate():
+    decoder = ContentDecoder("gzip")
+    data = gzip.compress(b"one ") + gzip.compress(b"two")
+    assert decoder.decompress(data[:10]) + decoder.decompress(data[10:]) + decoder.flush() == b"one two"
+
+    raw = zlib.compressobj(wbits=-zlib.MAX_WBITS)
+    decoder = ContentDecoder("deflate")
+    assert decoder.decompress(raw.compress(b"raw") + raw.flush()) + decoder.flush() == b"raw"
+
+    with pytest.raises(ValueError):
+        ContentDecoder("br")
@@ -0,0 +1,71 @@
+from textbrowser.history import History, HistoryEntry
+from textbrowser.parser import ElementIndex, HTMLParser
+
+
+def entry(url, size=0):
+    entry = HistoryEntry(url, "x", [], [])
+    entry.size = size
+    return entry
+
+
+def urls(history):
+    return [entry.url for entry in history.entries]
+
+
+def test_back_and_forward_move_through_the_visited_pages():
+    history = History()
+
+    for url in ["a", "b", "c"]:
+        history.visit(entry(url))
+
+    assert history.back().url == "b"
+    assert history.back().url == "a"
+    assert history.back() is None
+    assert history.forward().url == "b"
+
+    # Visiting a page from the middle drops the forward history
+    history.visit(entry("d"))
+    assert urls(history) == ["a", "b", "d"]
+    assert history.forward() is None
+
+
+def test_oldest_url_is_forgotten_past_the_entry_limit():
+    history = History(max_entries=2)
+
+    for url in ["a", "b", "c"]:
+        history.visit(entry(url))
+
+    assert urls(history) == ["b", "c"]
+    assert history.back().url == "b"
+    assert history.back() is None
+
+
+def test_pages_farthest_from_the_current_one_are_dropped_first():
+    history = History(memory_budget=250)
+
+    for url in ["a", "b", "c", "d"]:
+        history.visit(entry(url, 100))
+
+    # Only the URLs of the dropped pages are kept, the current page is never dropped
+    assert [entry.is_loaded() for entry in history.entries] == [False, False, True, True]
+    assert history.size() == 200
+
+    history.back()
+    history.back()
+    history.back()
+    history.replace(entry("a", 300))
+
+    assert [entry.is_loaded() for entry in history.entries] == [True, False, False, False]
+
+
+def test_kept_index_is_counted_in_the_size():
+    index = ElementIndex()
+    parser = HTMLParser(index=index)
+    parser.feed("<p>" + "<a href='/x'>text</a>" * 100 + "</p>")
+    parser.close()
+
+    assert HistoryEntry("a", "x", [], [], element_index=index).size > HistoryEntry("a", "x", [], []).size
+
+    dropped = HistoryEntry("a", "x", [], [], element_index=index)
+    dropped.drop()
+    assert dropped.element_index is None
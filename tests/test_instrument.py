@@ -0,0 +1,54 @@
+import asyncio
+
+from textbrowser.browser import Browser
+from textbrowser.instrument import Instrumentation
+from textbrowser.layout import WordWrapLayout
+
+
+def test_laps_go_to_the_phase_just_ended():
+    instrumentation = Instrumentation()
+    finished = []
+    instrumentation.add_hook(finished.append)
+
+    navigation = instrumentation.begin("http://a.com/")
+    instrumentation.lap("read", 10)
+    instrumentation.lap("read", 5)
+    instrumentation.lap("parse", nodes=3)
+    instrumentation.end("ok", navigation)
+
+    assert finished == [navigation] and instrumentation.last() is navigation
+    assert [(phase, size, nodes) for phase, (seconds, size, nodes) in navigation.phases.items()] == \
+        [("read", 15, 0), ("parse", 0, 3)]
+    assert navigation.report()[0].startswith("http://a.com/ (ok, ")
+
+
+def test_a_new_navigation_interrupts_the_current_one():
+    instrumentation = Instrumentation(max_navigations=1)
+    first = instrumentation.begin("http://a.com/1")
+    second = instrumentation.begin("http://a.com/2")
+
+    # The stale end of the first navigation doesn't end the second one
+    instrumentation.end("ok", first)
+    assert first.status == "interrupted"
+    assert instrumentation.current is second
+
+    instrumentation.end("ok", second)
+    assert list(instrumentation.navigations) == [second]
+
+
+def test_every_phase_of_loading_a_page_is_recorded(local_server):
+    local_server.routes["/"] = (200, {"Content-Type": "text/html; charset=utf-8"}, b"<p>one</p><p>two</p>")
+
+    async def browse():
+        browser = Browser(layout=WordWrapLayout(80), instrumentation=Instrumentation(memory=True))
+        await browser.go(local_server.url("/"))
+        browser.pool.close()
+        return browser.instrumentation.last()
+
+    navigation = asyncio.run(browse())
+
+    assert navigation.status == "ok"
+    assert set(navigation.phases) >= {"fetch", "read", "decode", "parse", "render", "print"}
+    assert navigation.phases["read"][1] == len(b"<p>one</p><p>two</p>")
+    assert navigation.phases["parse"][2] == 4
+    assert navigation.peak_memory > 0
@@ -0,0 +1,37 @@
+from textbrowser.layout import CharWrapLayout, WordWrapLayout, display_width
+
+
+def test_display_width_counts_terminal_columns():
+    assert display_width("abc") == 3
+    assert display_width("\x1b[1mabc\x1b[21m") == 3
+
+    # Wide characters take two columns, combining ones none
+    assert display_width("日本") == 4
+    assert display_width("é") == 1
+
+
+def test_words_are_wrapped_at_the_width():
+    layout = WordWrapLayout(10)
+
+    assert layout.wrap("short", 0) == "short"
+    assert layout.wrap("one two three four", 0) == "one two\nthree four"
+
+    # The line goes on from the current column, and a word longer than a line is broken
+    assert layout.wrap("one two", 6) == "one\ntwo"
+    assert layout.wrap("abcdefghijklmno", 0) == "abcdefghij\nklmno"
+
+
+def test_wide_characters_are_wrapped_by_their_width():
+    layout = WordWrapLayout(4)
+
+    assert layout.wrap("日本語", 0) == "日本\n語"
+    assert layout.wrap("ab 日本", 0) == "ab\n日本"
+
+
+def test_characters_are_wrapped_at_the_width():
+    layout = CharWrapLayout(4)
+
+    assert layout.wrap("abcdefghij", 0) == "abcd\nefgh\nij"
+
+    # A line break counts as the first character of the next line
+    assert layout.wrap("ab\ncdefg", 0) == "ab\ncde\nfg"
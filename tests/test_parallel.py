@@ -0,0 +1,107 @@
+import concurrent.futures
+import random
+
+import pytest
+
+from textbrowser.parallel import is_tag_start, parse_parallel, split_points
+from textbrowser.parser import NO_ATTRIBUTES, NO_ELEMENTS, TOKENIZERS, HTMLParser
+
+PIECES = ["<p>", "</p>", "<div class=x>", "</div>", "text ", "more words\r\n", "<!-- c <b> -->", "<!--", "-->",
+          "<script>if (a < b) { x = '</p>'; }</script>", "<style>p{}</style>", "<a href='x!y'>", "</a>", "<br/>",
+          "<img src=a>", "<b>", "</b>", "<", ">", "a<b", "<?xml x?>", "<form action=/f>", "</form>", "!",
+          "<span title=\"a<b\">", "</span>"]
+
+
+@pytest.fixture(scope="module")
+def executor():
+    with concurrent.futures.ProcessPoolExecutor(2) as executor:
+        yield executor
+
+
+def dump(elements):
+    # The tree in document order, along with which elements share the empty attributes and inner elements
+    items = []
+    stack = list(reversed(elements))
+
+    while stack:
+        element = stack.pop()
+
+        if element is None:
+            items.append(")")
+        elif element.is_text:
+            items.append(element.text)
+        else:
+            items.append((element.name, dict(element.attributes), element.attributes is NO_ATTRIBUTES,
+                          element.inner_elements is NO_ELEMENTS))
+            stack.append(None)
+            stack.extend(reversed(element.inner_elements))
+
+    return items
+
+
+def parse_both(text, executor, capsys, max_tokens=None, max_depth=None, tokenizer="slice"):
+    # Returns the serial and the parallel result, with what was printed and why parsing stopped
+    results = []
+
+    for parse in [lambda parser: parser.feed(text) + parser.close(),
+                  lambda parser: parse_parallel(text, 4, tokenizer, executor, 16, parser)]:
+        parser = HTMLParser(tokenizer, max_tokens=max_tokens, max_depth=max_depth)
+
+        try:
+            tree = dump(parse(parser))
+        except Exception as ex:
+            tree = repr(ex)
+
+        results.append((tree, capsys.readouterr().out, parser.truncated))
+
+    return results
+
+
+def test_split_points_start_at_tags():
+    text = ("a" * 99 + "<") * 3
+
+    assert split_points(text, 3) == [0, 199, 299]
+    assert split_points(text, 30) == [0, 99, 199, 299]
+    assert split_points("no tags at all", 4) == [0]
+
+
+def test_tag_start_state():
+    for name, tokenizer in TOKENIZERS.items():
+        plain = tokenizer()
+        list(plain.feed("<p>text<"))
+        assert is_tag_start(plain, name)
+
+        comment = tokenizer()
+        list(comment.feed("<!-- <"))
+        assert not is_tag_start(comment, name)
+
+
+@pytest.mark.parametrize("tokenizer", list(TOKENIZERS))
+def test_parallel_tree_is_the_serial_one(executor, capsys, tokenizer):
+    rng = random.Random(tokenizer)
+
+    for _ in range(100):
+        text = "".join(rng.choice(PIECES) for _ in range(rng.randint(20, 200)))
+        serial, parallel = parse_both(text, executor, capsys, tokenizer=tokenizer)
+
+        assert parallel == serial, text
+
+
+def test_parallel_parse_stops_where_the_serial_one_does(executor, capsys):
+    rng = random.Random(1)
+
+    for _ in range(100):
+        text = "".join(rng.choice(PIECES) for _ in range(rng.randint(20, 200)))
+        max_tokens = rng.choice([None, rng.randint(1, 200)])
+        max_depth = rng.choice([None, rng.randint(1, 8)])
+        serial, parallel = parse_both(text, executor, capsys, max_tokens, max_depth)
+
+        assert parallel == serial, (text, max_tokens, max_depth)
+
+
+def test_fragment_too_deep_to_pickle_is_parsed_here(executor, capsys):
+    text = "<div>" * 20000 + "deep" + "</div>" * 20000
+
+    serial, parallel = parse_both(text, executor, capsys)
+
+    assert parallel == serial
@@ -0,0 +1,125 @@
+import pytest
+
+from textbrowser.bench import generate_page
+from textbrowser.parser import (NO_ATTRIBUTES, NO_ELEMENTS, TOKENIZERS, ElementIndex, HTMLElement, HTMLParser, HTMLTag,
+                                TagElement, TextElement)
+
+
+def names(elements):
+    return [element.text if element.is_text else element.name for element in elements]
+
+
+@pytest.mark.parametrize("tokenizer", list(TOKENIZERS))
+def test_parse_builds_the_tree(tokenizer):
+    elements = HTMLParser.parse('<p class="a">One <b>two</b></p><br><script>x</script>Three<hr>', tokenizer)
+
+    assert names(elements) == ["p", "br", "Three", "hr"]
+    assert elements[0].attributes == {"class": "a"}
+    assert names(elements[0].inner_elements) == ["One ", "b"]
+    assert names(elements[0].inner_elements[1].inner_elements) == ["two"]
+
+
+def test_tag_attributes_are_parsed():
+    tag = HTMLTag.parse("""INPUT Type="text" name='q' value=a&amp;b disabled data-x = "1 2" """)
+
+    assert (tag.name, tag.is_closing, tag.is_closed) == ("input", False, False)
+    assert tag.attributes == {"type": "text", "name": "q", "value": "a&b", "disabled": "disabled", "data-x": "1 2"}
+
+
+def test_closing_closed_and_unterminated_tags_are_parsed():
+    assert HTMLTag.parse("/div").is_closing
+    assert HTMLTag.parse("/div").attributes is NO_ATTRIBUTES
+
+    tag = HTMLTag.parse("br clear=all/")
+    assert (tag.name, tag.is_closed, tag.attributes) == ("br", True, {"clear": "all"})
+
+    # An unterminated quoted value runs until the end of the tag
+    assert HTMLTag.parse('a href="/x title=y').attributes == {"href": "/x title=y"}
+
+
+@pytest.mark.parametrize("tokenizer", list(TOKENIZERS))
+def test_feed_splits_tags_across_chunks(tokenizer):
+    text = '<div id="x"><a href="/y">link</a></div><p>end</p>'
+    parser = HTMLParser(tokenizer)
+    elements = []
+
+    for i in range(0, len(text), 3):
+        elements += parser.feed(text[i:i + 3])
+
+    elements += parser.close()
+
+    assert names(elements) == names(HTMLParser.parse(text, tokenizer)) == ["div", "p"]
+    assert elements[0].inner_elements[0].attributes == {"href": "/y"}
+
+
+def test_unexpected_closing_tag_is_ignored(capsys):
+    elements = HTMLParser.parse("<p>a</b>b</p>")
+
+    assert names(elements[0].inner_elements) == ["a", "b"]
+    assert "unexpected closing tag" in capsys.readouterr().out
+
+
+def test_open_elements_reach_complete_inner_elements():
+    parser = HTMLParser()
+
+    assert parser.feed("<html><body><p>one</p><p>tw") == []
+
+    html, body, p = parser.open_elements()
+    assert names([html, body, p]) == ["html", "body", "p"]
+    assert body.inner_elements[-1] is p
+    assert names(body.inner_elements[0].inner_elements) == ["one"]
+
+    assert parser.feed("o</p></body>") == []
+    assert parser.open_elements() == [html]
+    assert names(parser.feed("</html>")) == ["html"]
+    assert parser.open_elements() == []
+    assert parser.close() == []
+
+
+def test_create_takes_the_old_constructor_arguments():
+    text = HTMLElement.create(True, text="words")
+    tag = HTMLElement.create(False, name="p", attributes={"id": "x"}, inner_elements=[text])
+    empty = HTMLElement.create(False, name="br")
+
+    assert isinstance(text, TextElement) and text.text == "words" and text.is_text
+    assert isinstance(tag, TagElement) and tag.name == "p" and tag.attributes == {"id": "x"}
+    assert tag.inner_elements == [text]
+
+    # Unlike the shared sentinels, the created containers can be filled in
+    empty.attributes["class"] = "c"
+    empty.inner_elements.append(text)
+    assert NO_ATTRIBUTES == {} and NO_ELEMENTS == ()
+
+    with pytest.raises(TypeError):
+        HTMLElement(True, text="words")
+
+
+def test_tokenizers_give_the_same_tokens():
+    text = generate_page("mixed", 64 * 1024) + generate_page("nested", 64 * 1024) + "<p\nclass=x>a<br\n/></p>"
+
+    tokens = [[repr(token) for token in HTMLParser.iter_tokens(text, tokenizer)] for tokenizer in TOKENIZERS]
+
+    assert tokens[0] == tokens[1]
+
+
+def test_element_index_finds_elements_by_tag_id_and_form():
+    index = ElementIndex()
+    parser = HTMLParser(index=index)
+    parser.feed("<title>T</title><a href='/x'>x</a><a name='top'>t</a><p id='p1'>one</p><p id='p1'>two</p>"
+                "<form><input name='a'><form><input name='b'></form><select name='c'></select></form>")
+    parser.close()
+
+    assert [element.attributes["href"] for element in index.find_all("a", "href")] == ["/x"]
+    assert len(index.find_all("a")) == 2
+    assert index.find("title").name == "title"
+    assert index.find("table") is None
+
+    # The first element with an id wins, a elements are also targets by name
+    assert index.get_by_id("p1").inner_elements[0].text == "one"
+    assert index.get_by_id("top").name == "a"
+    assert index.get_by_id("missing") is None
+
+    # A nested form keeps its own inputs
+    outer, inner = index.get_forms()
+    assert [element.attributes["name"] for element in index.get_inputs(outer)] == ["a", "c"]
+    assert [element.attributes["name"] for element in index.get_inputs(inner)] == ["b"]
@@ -0,0 +1,82 @@
+import asyncio
+
+from textbrowser.prefetch import PrefetchedResponse, Prefetcher
+
+
+class Form(object):
+    def __init__(self, action):
+        self.action = action
+
+
+def test_only_same_origin_links_that_are_not_forms_are_candidates():
+    prefetcher = Prefetcher(max_links=3)
+    hyperlinks = ["http://a.com/", "http://a.com/1#top", "http://b.com/2", "http://a.com/1", "http://a.com/form",
+                  "http://a.com/3", "http://a.com/4", "http://a.com/5"]
+
+    assert prefetcher.candidates("http://a.com/#x", hyperlinks, [Form("http://a.com/form")]) == \
+        ["http://a.com/1", "http://a.com/3", "http://a.com/4"]
+
+
+def test_prefetched_pages_are_taken_and_other_ones_miss():
+    opened = []
+
+    async def open_url(url):
+        opened.append(url)
+        return PrefetchedResponse(url, {}, b"body of " + url.encode())
+
+    async def browse():
+        prefetcher = Prefetcher()
+        prefetcher.start("http://a.com/", ["http://a.com/1", "http://a.com/2"], [], open_url)
+
+        hit = await prefetcher.take("http://a.com/1#fragment")
+        miss = await prefetcher.take("http://a.com/3")
+        prefetcher.cancel()
+        return prefetcher, hit, miss
+
+    prefetcher, hit, miss = asyncio.run(browse())
+
+    assert hit.read() == b"body of http://a.com/1"
+    assert miss is None
+    assert prefetcher.stats() == {"started": 2, "cancelled": 0, "hits": 1, "misses": 1, "hit_rate": 0.5}
+    assert opened == ["http://a.com/1", "http://a.com/2"]
+
+
+def test_pages_over_the_budget_are_dropped():
+    async def open_url(url):
+        return PrefetchedResponse(url, {}, b"x" * 100)
+
+    async def browse():
+        prefetcher = Prefetcher(max_page_size=50)
+        prefetcher.start("http://a.com/", ["http://a.com/1"], [], open_url)
+        return prefetcher, await prefetcher.take("http://a.com/1")
+
+    prefetcher, response = asyncio.run(browse())
+
+    assert response is None
+    assert prefetcher.misses == 1
+
+
+def test_a_new_page_cancels_the_prefetches_of_the_previous_one():
+    released = []
+
+    async def open_url(url):
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            released.append(url)
+            raise
+
+    async def browse():
+        prefetcher = Prefetcher()
+        prefetcher.start("http://a.com/", ["http://a.com/1", "http://a.com/2"], [], open_url)
+        await asyncio.sleep(0)
+
+        prefetcher.start("http://a.com/3", [], [], open_url)
+        await asyncio.sleep(0)
+        return prefetcher
+
+    prefetcher = asyncio.run(browse())
+
+    assert prefetcher.stats()["cancelled"] == 2
+    assert sorted(released) == ["http://a.com/1", "http://a.com/2"]
+    assert prefetcher.tasks == {}
@@ -0,0 +1,48 @@
+from textbrowser.browser import Browser
+from textbrowser.layout import WordWrapLayout
+from textbrowser.parser import HTMLParser
+from textbrowser.search import LineIndex
+
+
+def test_lines_are_indexed_as_they_are_completed():
+    index = LineIndex()
+    index.feed("\x1b[1mOne\x1b[21m li")
+    index.feed("ne\nTwo\n")
+
+    # The escape sequences are stripped, and the incomplete line waits for its line break
+    assert index.line_count == 2
+    index.feed("Three", True)
+
+    assert [index.line(i) for i in range(index.line_count)] == ["One line", "Two", "Three"]
+
+
+def test_search_maps_matches_to_lines():
+    index = LineIndex()
+    index.feed("apple pie\nbanana\nApple juice, apple tart\n")
+
+    # Lowercase patterns ignore the case, a line with several matches counts once
+    assert index.search("apple") == [0, 2]
+    assert index.search("Apple") == [2]
+    assert index.find("apple", 1) == 2
+    assert index.find("apple", 3) is None
+
+    # Only the lines added since the last search are searched again
+    index.feed("crab apple\n")
+    assert index.search("apple") == [0, 2, 3]
+
+
+def test_hyperlinks_and_forms_are_found_on_their_lines():
+    browser = Browser(layout=WordWrapLayout(40))
+    browser.url = "http://a.com/"
+    browser.render(HTMLParser.parse("<p>intro <a href='/1'>first</a></p><p><a href='/2'>second</a> and "
+                                    "<a href='/3'>third</a></p><form action='/f'><p>Name <input name=q></p></form>"
+                                    "<p>end</p>"))
+    index = browser.line_index
+    index.feed(browser.rendered, True)
+
+    assert index.line(index.find("second")).startswith(" Hyperlink [1]")
+    assert list(index.hyperlinks_on(index.find("second"))) == [1, 2]
+    assert list(index.hyperlinks_on(index.line_count - 1)) == []
+    assert index.forms_on(index.find("name")) == [0]
+    assert index.forms_on(index.find("End form")) == [0]
+    assert index.forms_on(index.line_count - 1) == []
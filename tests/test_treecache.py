@@ -0,0 +1,157 @@
+import asyncio
+import gzip
+import os
+
+from textbrowser import treecache
+from textbrowser.browser import Browser
+from textbrowser.budget import Budget
+from textbrowser.fetch import ContentDecoder
+from textbrowser.instrument import count_nodes
+from textbrowser.layout import WordWrapLayout
+from textbrowser.parser import NO_ATTRIBUTES, NO_ELEMENTS, HTMLParser
+from textbrowser.prefetch import PrefetchedResponse
+from textbrowser.treecache import StoredTree, TreeCache, encode_tree, tree_key
+
+PAGE = "<html><body><p class='a' id=\"x\">One &amp; <b>two</b></p><br><ul><li>three</ul></body></html><hr>"
+
+
+def dump(elements):
+    # The tree as nested tuples, along with which elements share the empty attributes and inner elements
+    return [element.text if element.is_text else
+            (element.name, dict(element.attributes), element.attributes is NO_ATTRIBUTES,
+             element.inner_elements is NO_ELEMENTS, dump(element.inner_elements))
+            for element in elements]
+
+
+def test_stored_tree_is_the_parsed_tree():
+    elements = HTMLParser.parse(PAGE)
+    tree = StoredTree(encode_tree(elements))
+
+    assert len(tree) == 2
+    assert dump(tree.iter_elements()) == dump(elements)
+    assert tree.truncated is None
+
+
+def test_stored_tree_stops_at_the_limits():
+    elements = HTMLParser.parse("<div>" * 50 + "deep" + "</div>" * 50 + "<p>after</p>")
+    tree = StoredTree(encode_tree(elements))
+
+    built = list(tree.iter_elements(max_depth=10))
+    assert tree.truncated == "more than 10 nested elements"
+    assert len(built) == 1
+
+    depth = 0
+    element = built[0]
+
+    while element.inner_elements:
+        element = element.inner_elements[0]
+        depth += 1
+
+    assert depth == 9
+
+    built = list(tree.iter_elements(max_nodes=20))
+    assert tree.truncated == "more than 20 nodes"
+    assert count_nodes(built) == 20
+
+    assert len(list(tree.iter_elements())) == 2
+    assert tree.truncated is None
+
+
+def test_tree_cache_evicts_the_least_recently_used(tmp_path):
+    elements = HTMLParser.parse(PAGE)
+    size = len(encode_tree(elements))
+    cache = TreeCache(str(tmp_path), max_size=size * 2)
+
+    cache.store("a", elements)
+    cache.store("b", elements)
+    assert cache.load("a") is not None
+
+    cache.store("c", elements)
+
+    assert cache.load("b") is None
+    assert dump(cache.load("c").iter_elements()) == dump(elements)
+    assert cache.stats() == {"hits": 2, "misses": 1, "evicted": 1, "entries": 2, "size": size * 2}
+
+    # The entries are found again by a new cache on the same directory
+    assert sorted(TreeCache(str(tmp_path)).entries) == ["a", "c"]
+
+
+def test_damaged_tree_is_a_miss(tmp_path):
+    cache = TreeCache(str(tmp_path))
+    cache.store("a", HTMLParser.parse(PAGE))
+
+    with open(os.path.join(str(tmp_path), "a.tree"), "r+b") as f:
+        f.write(b"XXXX")
+
+    assert cache.load("a") is None
+    assert cache.stats()["entries"] == 0
+
+
+def load_page(tree_cache, body, headers, budget=None):
+    browser = Browser(layout=WordWrapLayout(80), tree_cache=tree_cache, budget=budget)
+    browser.url = "http://example.com/"
+    asyncio.run(browser.process_stream(PrefetchedResponse("http://example.com/", headers, body)))
+    return browser
+
+
+def test_cached_tree_is_shown_with_the_page_sizes(tmp_path, capsys):
+    tree_cache = TreeCache(str(tmp_path))
+    page = PAGE.encode() * 10
+    body = gzip.compress(page)
+    headers = {"Content-Encoding": "gzip", "Content-Type": "text/html; charset=utf-8"}
+
+    parsed = load_page(tree_cache, body, headers)
+    loaded = load_page(tree_cache, body, headers)
+
+    assert tree_cache.stats()["hits"] == 1
+    assert loaded.rendered == parsed.rendered
+    assert (loaded.transfer_size, loaded.decoded_size) == (parsed.transfer_size, parsed.decoded_size) == \
+        (len(body), len(page))
+
+
+def test_cached_tree_keeps_the_decoded_size(tmp_path, capsys, monkeypatch):
+    tree_cache = TreeCache(str(tmp_path))
+    page = PAGE.encode() * 10
+    body = gzip.compress(page)
+    headers = {"Content-Encoding": "gzip"}
+
+    load_page(tree_cache, body, headers)
+    assert tree_cache.load(tree_key(body, headers).hexdigest()).decoded_size == len(page)
+
+    # A tree loaded from the cache is shown without decompressing its body again
+    monkeypatch.setattr(ContentDecoder, "decompress", None)
+    loaded = load_page(tree_cache, body, headers)
+
+    assert tree_cache.stats()["hits"] == 2
+    assert loaded.decoded_size == len(page)
+    assert "Couldn't parse" not in capsys.readouterr().out
+
+
+def test_tree_key_covers_the_parser_and_the_decoding_headers(monkeypatch):
+    key = tree_key(b"<p>page</p>", {"Content-Type": "text/html"}).hexdigest()
+
+    assert tree_key(b"<p>page</p>", {"Content-Type": "text/html"}).hexdigest() == key
+    assert tree_key(b"<p>page</p>", {"Content-Type": "text/html; charset=cp1252"}).hexdigest() != key
+    assert tree_key(b"<p>page</p>", {"Content-Type": "text/html", "Date": "now"}).hexdigest() == key
+
+    monkeypatch.setattr(treecache, "PARSER_VERSION", treecache.PARSER_VERSION + 1)
+    assert tree_key(b"<p>page</p>", {"Content-Type": "text/html"}).hexdigest() != key
+
+
+def test_cached_tree_is_kept_within_the_budget(tmp_path, capsys):
+    tree_cache = TreeCache(str(tmp_path))
+    body = b"<div>" * 100 + b"deep" + b"</div>" * 100
+    headers = {"Content-Type": "text/html; charset=utf-8"}
+
+    load_page(tree_cache, body, headers)
+    loaded = load_page(tree_cache, body, headers, Budget(max_depth=10))
+
+    assert tree_cache.stats()["hits"] == 1
+    assert loaded.truncated == "more than 10 nested elements"
+    assert "Page truncated" in loaded.rendered
+
+    # A body over the budget is parsed up to the limit instead
+    loaded = load_page(tree_cache, body, headers, Budget(max_body_size=100))
+
+    assert loaded.truncated == "more than 100 bytes"
+    assert tree_cache.stats()["hits"] == 2
@@ -1,4 +1,27 @@
+import argparse
+import os
+
 from textbrowser.browser import Browser
+from textbrowser.cache import HTTPCache, default_cache_directory
+from textbrowser.instrument import Instrumentation
+from textbrowser.pager import Pager
+from textbrowser.treecache import TreeCache
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(prog="python -m textbrowser", description="Browse the web in the terminal.")
+    parser.add_argument("url", nargs="?", help="the page to open, asked for if it is missing")
+    parser.add_argument("--pager", action="store_true", help="show long pages a screen at a time")
+    parser.add_argument("--cache", action="store_true", help="keep the fetched pages in an on-disk HTTP cache")
+    parser.add_argument("--tree-cache", action="store_true", help="keep the parsed trees of the pages on disk")
+    parser.add_argument("--stats", action="store_true", help="time every phase of loading a page, see 'stats'")
+    options = parser.parse_args(args)
+
+    url = options.url if options.url else input("Enter URL: ")
+    Browser(url, cache=HTTPCache(default_cache_directory()) if options.cache else None,
+            tree_cache=TreeCache(os.path.join(default_cache_directory(), "trees")) if options.tree_cache else None,
+            instrumentation=Instrumentation() if options.stats else None, pager=Pager() if options.pager else None)
+
 
-url = input("Enter URL: ")
-Browser(url)
+if __name__ == "__main__":
+    main()
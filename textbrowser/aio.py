@@ -0,0 +1,405 @@
+import asyncio
+import email.parser
+import http.client
+import ssl
+import time
+import urllib.error
+import urllib.parse
+
+from textbrowser.fetch import DEFAULT_HEADERS, MAX_REDIRECTS, REDIRECT_STATUSES
+
+
+class AsyncResponse(object):
+    """
+    A response read from a pooled asyncio connection.
+    The connection goes back to the pool as soon as the body was read completely.
+    """
+
+    def __init__(self, pool, key, reader, writer, url, status, reason, headers, will_close, has_body):
+        """
+        Initializes this AsyncResponse object
+        :param pool: the pool the connection belongs to
+        :param key: the pool key of the connection
+        :param reader: the asyncio stream reader
+        :param writer: the asyncio stream writer
+        :param url: the URL this response was fetched from
+        :param status: the status code
+        :param reason: the status reason
+        :param headers: the response headers
+        :param will_close: whether the server closes the connection after the response
+        :param has_body: whether the response has a body
+        """
+
+        self.pool, self.key, self.reader, self.writer, self.url = pool, key, reader, writer, url
+        self.status, self.reason, self.headers, self.will_close = status, reason, headers, will_close
+
+        self.chunked = "chunked" in headers.get("Transfer-Encoding", "").lower()
+        self.length = None
+        self.chunk_left = 0
+        self.finished = not has_body
+
+        if not self.chunked and "Content-Length" in headers:
+            try:
+                self.length = int(headers["Content-Length"])
+            except ValueError:
+                self.will_close = True
+
+        if self.length == 0:
+            self.finished = True
+        elif self.length is None and not self.chunked:
+            # The body runs until the server closes the connection
+            self.will_close = True
+
+        if self.finished:
+            self.release()
+
+    def geturl(self):
+        """
+        Gets the URL of this response, after the redirects
+        :return: the URL
+        """
+
+        return self.url
+
+    async def read_line(self):
+        """
+        Reads a line of the chunked framing
+        :return: the line
+        """
+
+        return await asyncio.wait_for(self.reader.readline(), self.pool.read_timeout)
+
+    async def read(self, amt=None):
+        """
+        Reads the body of this response
+        :param amt: the maximum number of bytes to read, everything if None
+        :return: the bytes read, empty once the body was read completely
+        """
+
+        if amt is None:
+            data = []
+
+            while True:
+                chunk = await self.read(65536)
+
+                if not chunk:
+                    return b"".join(data)
+
+                data.append(chunk)
+
+        if self.finished or self.writer is None:
+            return b""
+
+        if self.chunked:
+            if not self.chunk_left:
+                size = await self.read_line()
+                self.chunk_left = int(size.split(b";")[0].strip() or b"0", 16)
+
+                if not self.chunk_left:
+                    # Skip the trailers
+                    while (await self.read_line()).strip():
+                        pass
+
+                    self.finished = True
+                    self.release()
+                    return b""
+
+            data = await asyncio.wait_for(self.reader.read(min(amt, self.chunk_left)), self.pool.read_timeout)
+            self.chunk_left -= len(data)
+
+            if not self.chunk_left:
+                await self.read_line()
+        elif self.length is not None:
+            data = await asyncio.wait_for(self.reader.read(min(amt, self.length)), self.pool.read_timeout)
+            self.length -= len(data)
+
+            if not self.length:
+                self.finished = True
+        else:
+            data = await asyncio.wait_for(self.reader.read(amt), self.pool.read_timeout)
+
+        if not data:
+            self.finished = True
+
+        if self.finished:
+            self.release()
+
+        return data
+
+    def release(self):
+        """
+        Returns the connection to the pool, or closes it if it can't be reused
+        """
+
+        if self.writer is None:
+            return
+
+        if self.finished and not self.will_close:
+            self.pool.put(self.key, self.reader, self.writer)
+        else:
+            self.writer.close()
+
+        self.reader, self.writer = None, None
+
+    def close(self):
+        """
+        Closes this response without reading the rest of the body
+        """
+
+        if self.writer is not None:
+            if not self.finished:
+                self.will_close = True
+
+            self.release()
+
+
+class AsyncConnectionPool(object):
+    """
+    A pool of persistent asyncio HTTP connections, kept alive per (scheme, host, port),
+    with timeouts for connecting and for every read.
+    """
+
+    def __init__(self, max_size=8, idle_timeout=30.0, connect_timeout=10.0, read_timeout=30.0, max_concurrency=8):
+        """
+        Initializes this AsyncConnectionPool object
+        :param max_size: the maximum number of idle connections to keep
+        :param idle_timeout: the number of seconds after which an idle connection is closed
+        :param connect_timeout: the number of seconds to wait for a connection
+        :param read_timeout: the number of seconds to wait for every read
+        :param max_concurrency: the maximum number of concurrent requests made by fetch_all
+        """
+
+        self.max_size, self.idle_timeout = max_size, idle_timeout
+        self.connect_timeout, self.read_timeout, self.max_concurrency = connect_timeout, read_timeout, max_concurrency
+
+        # A list of (key, reader, writer, last used time), the most recently used last
+        self.idle = []
+
+        self.created = 0
+        self.reused = 0
+
+    async def get(self, key):
+        """
+        Gets a connection, reusing an idle one if there is one
+        :param key: the (scheme, host, port) to connect to
+        :return: the reader, the writer and whether the connection was reused
+        """
+
+        self.expire()
+
+        for i in range(len(self.idle) - 1, -1, -1):
+            if self.idle[i][0] == key:
+                _, reader, writer, _ = self.idle.pop(i)
+
+                if not reader.at_eof():
+                    self.reused += 1
+                    return reader, writer, True
+
+                writer.close()
+
+        scheme, host, port = key
+        context = ssl.create_default_context() if scheme == "https" else None
+
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port, ssl=context),
+                                                self.connect_timeout)
+
+        self.created += 1
+        return reader, writer, False
+
+    def put(self, key, reader, writer):
+        """
+        Keeps a connection for reuse
+        :param key: the (scheme, host, port) of the connection
+        :param reader: the asyncio stream reader
+        :param writer: the asyncio stream writer
+        """
+
+        self.idle.append((key, reader, writer, time.monotonic()))
+
+        while len(self.idle) > self.max_size:
+            self.idle.pop(0)[2].close()
+
+    def expire(self):
+        """
+        Closes the connections that were idle for too long
+        """
+
+        deadline = time.monotonic() - self.idle_timeout
+
+        while self.idle and self.idle[0][3] < deadline:
+            self.idle.pop(0)[2].close()
+
+    def close(self):
+        """
+        Closes all the idle connections
+        """
+
+        while self.idle:
+            self.idle.pop()[2].close()
+
+    def stats(self):
+        """
+        Gets the connection counters
+        :return: a dict with the number of new and reused connections
+        """
+
+        return {"new": self.created, "reused": self.reused, "idle": len(self.idle)}
+
+    async def open(self, url, data=None, headers=None):
+        """
+        Requests a URL, following redirects
+        :param url: the URL to request
+        :param data: the urlencoded body to POST, or None to GET
+        :param headers: additional request headers
+        :return: the AsyncResponse
+        """
+
+        method = "POST" if data is not None else "GET"
+
+        for _ in range(MAX_REDIRECTS + 1):
+            response = await self.request(method, url, data, headers)
+
+            if response.status not in REDIRECT_STATUSES or "Location" not in response.headers:
+                break
+
+            # Read the rest of the redirect body so that the connection can be reused
+            await response.read()
+            url = urllib.parse.urljoin(url, response.headers["Location"])
+
+            if response.status in [301, 302, 303]:
+                method, data = "GET", None
+        else:
+            raise urllib.error.HTTPError(url, response.status, "Too many redirects", response.headers, None)
+
+        if response.status >= 400:
+            response.close()
+            raise urllib.error.HTTPError(url, response.status, response.reason, response.headers, None)
+
+        return response
+
+    async def fetch_all(self, urls, read=None):
+        """
+        Fetches several URLs concurrently, at most max_concurrency at a time
+        :param urls: the URLs to fetch
+        :param read: a coroutine function that reads a response into the result, or None to read the whole body
+        :return: an async iterator of the (URL, result or exception) pairs, in the order the fetches finish
+        """
+
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def fetch(url):
+            async with semaphore:
+                try:
+                    response = await self.open(url)
+
+                    try:
+                        return url, await (read(response) if read else response.read())
+                    finally:
+                        response.close()
+                except Exception as ex:
+                    return url, ex
+
+        tasks = [asyncio.ensure_future(fetch(url)) for url in urls]
+
+        try:
+            for task in asyncio.as_completed(tasks):
+                yield await task
+        finally:
+            # The fetches a caller didn't wait for are cancelled, and their connections closed
+            for task in tasks:
+                task.cancel()
+
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def request(self, method, url, data=None, headers=None):
+        """
+        Sends a single request
+        :param method: the HTTP method
+        :param url: the URL to request
+        :param data: the request body
+        :param headers: additional request headers
+        :return: the AsyncResponse
+        """
+
+        parts = urllib.parse.urlsplit(url)
+        scheme = parts.scheme.lower()
+        port = parts.port or (443 if scheme == "https" else 80)
+        key = (scheme, parts.hostname, port)
+
+        path = parts.path or "/"
+
+        if parts.query:
+            path += "?" + parts.query
+
+        request_headers = dict(DEFAULT_HEADERS)
+        request_headers["Host"] = parts.netloc.rpartition("@")[2]
+
+        if data is not None:
+            request_headers["Content-Type"] = "application/x-www-form-urlencoded"
+            request_headers["Content-Length"] = str(len(data))
+
+        if headers:
+            request_headers.update(headers)
+
+        head = "%s %s HTTP/1.1\r\n" % (method, path)
+        head += "".join("%s: %s\r\n" % (name, value) for name, value in request_headers.items())
+        head = (head + "\r\n").encode("latin-1")
+
+        while True:
+            reader, writer, reused = await self.get(key)
+
+            try:
+                writer.write(head + (data or b""))
+                await asyncio.wait_for(writer.drain(), self.read_timeout)
+
+                version, status, reason, header_lines = await self.read_head(reader)
+            except (http.client.RemoteDisconnected, ConnectionError):
+                writer.close()
+
+                # The server may have dropped an idle connection, so try once more with a new one
+                if reused:
+                    continue
+
+                raise
+            except BaseException:
+                writer.close()
+                raise
+
+            break
+
+        response_headers = email.parser.BytesParser(_class=http.client.HTTPMessage).parsebytes(b"".join(header_lines))
+
+        will_close = version == "HTTP/1.0" or "close" in response_headers.get("Connection", "").lower()
+        has_body = method != "HEAD" and status not in [204, 304] and not 100 <= status < 200
+
+        return AsyncResponse(self, key, reader, writer, url, status, reason, response_headers, will_close, has_body)
+
+    async def read_head(self, reader):
+        """
+        Reads the status line and the headers of a response, skipping the interim responses before it
+        :param reader: the asyncio stream reader
+        :return: the HTTP version, the status code, the reason and the header lines
+        """
+
+        while True:
+            status_line = await asyncio.wait_for(reader.readline(), self.read_timeout)
+
+            if not status_line:
+                raise http.client.RemoteDisconnected("Remote end closed connection without response")
+
+            header_lines = []
+
+            while True:
+                line = await asyncio.wait_for(reader.readline(), self.read_timeout)
+
+                if not line.strip():
+                    break
+
+                header_lines.append(line)
+
+            version, status, reason = (status_line.decode("latin-1").rstrip("\r\n").split(" ", 2) + [""])[:3]
+            status = int(status)
+
+            # A 100 Continue or a 103 Early Hints comes before the final response, 101 switches protocols instead
+            if not 100 <= status < 200 or status == 101:
+                return version, status, reason, header_lines
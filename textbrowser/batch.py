@@ -0,0 +1,327 @@
+import argparse
+import asyncio
+import concurrent.futures
+import contextlib
+import json
+import os
+import sys
+import time
+import urllib.parse
+import urllib.request
+
+from textbrowser.aio import AsyncConnectionPool
+from textbrowser.browser import Browser
+from textbrowser.budget import Budget
+from textbrowser.charset import StreamDecoder, charset_from_headers
+from textbrowser.fetch import ContentDecoder
+from textbrowser.layout import ESCAPE_SEQUENCE, LAYOUTS
+from textbrowser.parallel import parse_parallel
+from textbrowser.parser import HTMLParser
+
+
+def source_url(source):
+    """
+    Gets the URL of a batch source, raises a ValueError if it is neither an existing file nor a URL with a host
+    :param source: a URL or a local file path
+    :return: the URL, file:// for local files
+    """
+
+    if source.startswith("file://") or os.path.exists(source):
+        if source.startswith("file://"):
+            return source
+
+        return "file://" + urllib.request.pathname2url(os.path.abspath(source))
+
+    url = source
+
+    if not (source.startswith("http://") or source.startswith("https://")):
+        url = "http://" + source
+
+    # A path to a missing file would become a URL without a host
+    if not urllib.parse.urlsplit(url).hostname:
+        raise ValueError("Not an existing file or a URL: %s" % source)
+
+    return url
+
+
+# The number of bytes read from a response at a time
+CHUNK_SIZE = 65536
+
+
+def render_page(url, body, width=80, ansi=False, charset=None, parse_processes=None, layout="word", budget=None,
+                truncated=None):
+    """
+    Parses and renders a page, meant to run in a worker process
+    :param url: the URL of the page
+    :param body: the page bytes
+    :param width: the line width
+    :param ansi: whether to keep the ANSI escape sequences in the text
+    :param charset: the charset from the Content-Type header, sniffed from the page if None
+    :param parse_processes: the number of processes to parse a large page in, or None to parse it in this one
+    :param layout: the name of the layout to break the lines with, one of LAYOUTS
+    :param budget: the Budget to parse and render the page within, or None for the default one
+    :param truncated: why the body was cut short, or None if it is complete
+    :return: a dict with the text, the hyperlinks, the forms, the size of the page and why it was cut short
+    """
+
+    if budget is None:
+        budget = Budget()
+
+    browser = Browser(layout=LAYOUTS[layout](width), budget=budget)
+    browser.url = url
+    text = StreamDecoder(charset).decode(body, True)
+    parser = HTMLParser(max_tokens=budget.max_tokens, max_depth=budget.max_depth)
+
+    # The parser reports errors on stdout, which carries the results
+    with contextlib.redirect_stdout(sys.stderr):
+        if parse_processes:
+            elements = parse_parallel(text, parse_processes, parser=parser)
+        else:
+            elements = parser.feed(text) + parser.close()
+
+    browser.render([])
+
+    for reason in [truncated, parser.truncated]:
+        if reason:
+            browser.truncate(reason)
+
+    browser.render(elements, False)
+    browser.mark_truncation()
+
+    text = browser.rendered
+
+    if not ansi:
+        text = ESCAPE_SEQUENCE.sub("", text)
+
+    forms = []
+
+    for form in browser.forms:
+        forms.append({
+            "action": form.action,
+            "method": form.method,
+            "inputs": [{"name": form_input.name, "type": form_input.input_type, "value": form_input.value,
+                        "options": form_input.options} for form_input in form.get_inputs()]
+        })
+
+    return {"url": url, "bytes": len(body), "text": text, "links": browser.hyperlinks, "forms": forms,
+            "truncated": browser.truncated}
+
+
+class BatchRunner(object):
+    """
+    Fetches many pages concurrently and renders them in a process pool, streaming the results as JSON lines.
+    """
+
+    def __init__(self, output, workers=8, processes=None, width=80, ansi=False, parse_processes=None, layout="word",
+                 budget=None):
+        """
+        Initializes this BatchRunner object
+        :param output: the text stream to write the JSON lines to
+        :param workers: the number of concurrent fetches
+        :param processes: the number of rendering processes, defaults to the number of CPUs
+        :param width: the line width of the rendered text
+        :param ansi: whether to keep the ANSI escape sequences in the text
+        :param parse_processes: the number of processes to parse every large page in, or None
+        :param layout: the name of the layout to break the lines with, one of LAYOUTS
+        :param budget: the Budget to fetch, parse and render every page within, or None for the default one
+        """
+
+        self.output, self.workers, self.processes, self.width, self.ansi = output, workers, processes, width, ansi
+        self.parse_processes, self.layout = parse_processes, layout
+        self.budget = budget if budget is not None else Budget()
+
+        self.pages = 0
+        self.failed = 0
+        self.bytes = 0
+        self.transferred = 0
+
+    def read_file(self, url):
+        """
+        Reads a local page, up to the maximum body size of the budget
+        :param url: the file:// URL of the page
+        :return: the URL, the page bytes, the number of bytes read, no header charset and why the body was cut short,
+                 or None if it is complete
+        """
+
+        max_body_size = self.budget.max_body_size
+        truncated = None
+
+        with open(urllib.request.url2pathname(urllib.parse.urlsplit(url).path), "rb") as f:
+            body = f.read() if max_body_size is None else f.read(max_body_size + 1)
+
+        if max_body_size is not None and len(body) > max_body_size:
+            body = body[:max_body_size]
+            truncated = "more than %d bytes" % max_body_size
+
+        return url, body, len(body), None, truncated
+
+    async def read_body(self, response):
+        """
+        Reads the body of a response, up to the maximum body size of the budget
+        :param response: the AsyncResponse
+        :return: the final URL, the decoded page bytes, the number of bytes transferred, the header charset
+                 and why the body was cut short, or None if it is complete
+        """
+
+        max_body_size = self.budget.max_body_size
+        truncated = None
+
+        decoder = ContentDecoder(response.headers.get("Content-Encoding", ""))
+        pieces = []
+        transfer_size, size = 0, 0
+
+        # The body is decoded as it is read, so that a compressed one can't grow past the budget
+        while True:
+            chunk = await response.read(CHUNK_SIZE)
+            transfer_size += len(chunk)
+
+            data = decoder.decompress(chunk) if chunk else decoder.flush()
+            size += len(data)
+
+            if max_body_size is not None and size > max_body_size:
+                pieces.append(data[:len(data) - (size - max_body_size)])
+                truncated = "more than %d bytes" % max_body_size
+                response.close()
+                break
+
+            pieces.append(data)
+
+            if not chunk:
+                break
+
+        return response.geturl(), b"".join(pieces), transfer_size, charset_from_headers(response.headers), truncated
+
+    def report(self, result):
+        """
+        Counts a result and writes it as a JSON line
+        :param result: the result dict of a page, with an "error" key if the page failed
+        """
+
+        if "error" in result:
+            self.failed += 1
+        else:
+            self.pages += 1
+            self.bytes += result["bytes"]
+            self.transferred += result["transferred"]
+
+        self.output.write(json.dumps(result) + "\n")
+        self.output.flush()
+
+    async def render(self, url, fetched, renderers):
+        """
+        Renders a fetched page in the process pool and reports the result
+        :param url: the URL the page was requested from
+        :param fetched: what read_file() or read_body() returned, or the exception fetching the page failed with
+        :param renderers: the ProcessPoolExecutor to render the page in
+        """
+
+        if isinstance(fetched, Exception):
+            self.report({"url": url, "error": repr(fetched)})
+            return
+
+        final_url, body, transfer_size, charset, truncated = fetched
+
+        # Submitting fails too once a rendering process died
+        try:
+            result = await asyncio.wrap_future(renderers.submit(render_page, final_url, body, self.width, self.ansi,
+                                                                charset, self.parse_processes, self.layout,
+                                                                self.budget, truncated))
+            result["transferred"] = transfer_size
+        except Exception as ex:
+            result = {"url": final_url, "error": repr(ex)}
+
+        self.report(result)
+
+    async def render_all(self, sources, renderers):
+        """
+        Fetches the pages concurrently and renders every one as soon as it was fetched
+        :param sources: an iterable of URLs and local file paths
+        :param renderers: the ProcessPoolExecutor to render the pages in
+        """
+
+        pool = AsyncConnectionPool(max_concurrency=self.workers)
+        urls = []
+        renders = []
+
+        for source in sources:
+            try:
+                url = source_url(source)
+            except ValueError as ex:
+                self.report({"url": source, "error": repr(ex)})
+                continue
+
+            if not url.startswith("file://"):
+                urls.append(url)
+                continue
+
+            try:
+                fetched = self.read_file(url)
+            except OSError as ex:
+                fetched = ex
+
+            renders.append(asyncio.ensure_future(self.render(url, fetched, renderers)))
+
+        try:
+            async for url, fetched in pool.fetch_all(urls, self.read_body):
+                renders.append(asyncio.ensure_future(self.render(url, fetched, renderers)))
+
+            await asyncio.gather(*renders)
+        finally:
+            pool.close()
+
+    def run(self, sources):
+        """
+        Renders all the given sources
+        :param sources: an iterable of URLs and local file paths
+        :return: a dict with the throughput statistics
+        """
+
+        started = time.perf_counter()
+
+        with concurrent.futures.ProcessPoolExecutor(self.processes) as renderers:
+            asyncio.run(self.render_all(sources, renderers))
+
+        elapsed = time.perf_counter() - started
+
+        return {
+            "pages": self.pages,
+            "failed": self.failed,
+            "bytes": self.bytes,
+            "transferred": self.transferred,
+            "seconds": elapsed,
+            "pages_per_second": self.pages / elapsed if elapsed else 0.0,
+            "mb_per_second": self.bytes / 1024 / 1024 / elapsed if elapsed else 0.0,
+        }
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(prog="python -m textbrowser.batch",
+                                     description="Render many pages to text without the interactive prompt.")
+    parser.add_argument("sources", nargs="*", help="URLs or local HTML files")
+    parser.add_argument("-i", "--input", help="a file with one URL or path per line, - for stdin")
+    parser.add_argument("-j", "--workers", type=int, default=8, help="the number of concurrent fetches")
+    parser.add_argument("-p", "--processes", type=int, default=None, help="the number of rendering processes")
+    parser.add_argument("-w", "--width", type=int, default=80, help="the line width of the rendered text")
+    parser.add_argument("-l", "--layout", choices=list(LAYOUTS), default="word",
+                        help="break the lines between words or after every character")
+    parser.add_argument("--ansi", action="store_true", help="keep the ANSI escape sequences in the text")
+    parser.add_argument("--parse-processes", type=int, default=None,
+                        help="parse every large page in this many processes, for a few very large pages")
+    options = parser.parse_args(args)
+
+    sources = list(options.sources)
+
+    if options.input:
+        with (sys.stdin if options.input == "-" else open(options.input, "r")) as f:
+            sources += [line.strip() for line in f if line.strip()]
+
+    runner = BatchRunner(sys.stdout, options.workers, options.processes, options.width, options.ansi,
+                         options.parse_processes, options.layout)
+    stats = runner.run(sources)
+
+    print("%(pages)d pages (%(failed)d failed), %(bytes)d bytes (%(transferred)d transferred) in %(seconds).2fs: "
+          "%(pages_per_second).1f pages/s, %(mb_per_second).2f MB/s" % stats, file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,561 @@
+import argparse
+import collections
+import concurrent.futures
+import contextlib
+import json
+import math
+import os
+import platform
+import random
+import re
+import sys
+import time
+import tracemalloc
+
+from textbrowser.browser import Browser
+from textbrowser.instrument import count_nodes
+from textbrowser.layout import CharWrapLayout, WordWrapLayout
+from textbrowser.parallel import parse_parallel
+from textbrowser.parser import HTMLParser, HTMLTag
+from textbrowser.treecache import StoredTree, encode_tree
+
+DEFAULT_SIZES = [64, 256, 1024]
+
+# The large pages are only measured at multi-MB sizes
+LARGE_SIZES = [2048, 4096]
+
+WORDS = ["lorem", "ipsum", "dolor", "sit", "amet", "consectetur", "adipiscing", "elit", "sed", "do", "eiusmod",
+         "tempor", "incididunt", "ut", "labore", "et", "dolore", "magna", "aliqua", "&amp;", "&lt;tag&gt;",
+         "Ärger", "naïve", "日本語", "テキスト"]
+
+TAG = re.compile(r"<([^<>!][^<>]*)>")
+
+CHUNK_SIZE = 16384
+
+
+def words(rng, count):
+    """
+    Makes up a run of words
+    :param rng: the random generator
+    :param count: the number of words
+    :return: the words, separated by spaces
+    """
+
+    return " ".join(rng.choice(WORDS) for _ in range(count))
+
+
+def text_block(rng):
+    # Paragraphs of prose with a few inline elements
+    parts = []
+
+    for _ in range(rng.randint(3, 8)):
+        parts.append(words(rng, rng.randint(5, 25)))
+        parts.append(rng.choice(["<b>%s</b>", "<i>%s</i>", "<a href=\"/page/%d\">%%s</a>" % rng.randint(0, 999),
+                                 "<span>%s</span>"]) % words(rng, rng.randint(1, 4)))
+
+    return "<p>%s</p>\n" % " ".join(parts)
+
+
+def attribute_block(rng):
+    # Elements carrying many attributes, in all the quoting styles
+    attributes = ['class="c%d c%d"' % (rng.randint(0, 50), rng.randint(0, 50)), "id=e%d" % rng.randint(0, 10 ** 6),
+                  "data-x='%d'" % rng.randint(0, 999), 'title="%s"' % words(rng, 3), "hidden",
+                  'href="/x?a=%d&amp;b=%d"' % (rng.randint(0, 99), rng.randint(0, 99)),
+                  "tabindex=%d" % rng.randint(0, 9),
+                  'style="color: red; margin: 0"', "lang=en", 'aria-label="%s"' % words(rng, 2)]
+    rng.shuffle(attributes)
+
+    return "<div %s><span %s>%s</span></div>\n" % (" ".join(attributes[:6]), " ".join(attributes[6:]), words(rng, 3))
+
+
+def nested_block(rng):
+    # Deeply nested elements, beyond what a recursive walk could handle
+    depth = rng.randint(200, 1500)
+    names = [rng.choice(["div", "span", "b", "i", "em"]) for _ in range(depth)]
+
+    return "".join("<%s>" % name for name in names) + words(rng, 5) + \
+        "".join("</%s>" % name for name in reversed(names)) + "\n"
+
+
+def form_block(rng):
+    # Forms with inputs, selects and the occasional nested form
+    inputs = []
+
+    for i in range(rng.randint(2, 8)):
+        kind = rng.random()
+
+        if kind < 0.5:
+            inputs.append('<input name="f%d" type="%s" value="%s">' % (i, rng.choice(["text", "hidden", "submit"]),
+                                                                       words(rng, 1)))
+        elif kind < 0.7:
+            inputs.append('<input name="c%d" type="checkbox" checked>' % i)
+        elif kind < 0.9:
+            options = "".join('<option value="%d">%s</option>' % (j, words(rng, 2)) for j in range(rng.randint(2, 6)))
+            inputs.append('<select name="s%d" value="1">%s</select>' % (i, options))
+        else:
+            inputs.append('<form action="/inner"><input name="n%d" type="text"></form>' % i)
+
+    return '<form action="/submit%d" method="%s"><div>%s</div></form>\n' % \
+        (rng.randint(0, 99), rng.choice(["get", "post"]), "".join(inputs))
+
+
+def deep_form_block(rng):
+    # Forms nested several hundred levels deep, each with inputs of its own before the next one
+    depth = rng.randint(300, 800)
+    parts = []
+
+    for i in range(depth):
+        parts.append('<form action="/level%d"><div><input name="l%d" type="text">' % (i, i))
+
+        if rng.random() < 0.2:
+            parts.append('<select name="s%d"><option value="1">%s</option></select>' % (i, words(rng, 2)))
+
+    parts.append(words(rng, 5))
+    parts.append("</div></form>" * depth)
+
+    return "".join(parts) + "\n"
+
+
+def mixed_block(rng):
+    return rng.choice([text_block, text_block, text_block, attribute_block, form_block])(rng)
+
+
+KINDS = collections.OrderedDict([
+    ("text", text_block),
+    ("attributes", attribute_block),
+    ("nested", nested_block),
+    ("forms", form_block),
+    ("deep-forms", deep_form_block),
+    ("mixed", mixed_block),
+    ("large", mixed_block),
+])
+
+
+def generate_page(kind, size, seed=0):
+    """
+    Generates a page of the corpus, the same arguments always give the same page
+    :param kind: the kind of page, one of KINDS
+    :param size: the approximate size of the page in bytes
+    :param seed: the random seed
+    :return: the page text
+    """
+
+    rng = random.Random("%s-%d-%d" % (kind, size, seed))
+    block = KINDS[kind]
+
+    parts = ["<html><head><title>%s %d</title></head><body>\n" % (kind, size)]
+    length = len(parts[0])
+
+    while length < size:
+        part = block(rng)
+        parts.append(part)
+        length += len(part)
+
+    parts.append("</body></html>\n")
+
+    return "".join(parts)
+
+
+class Fixture(object):
+    """
+    A page of the corpus, with what the stages need prepared on first use.
+    """
+
+    def __init__(self, kind, size, text):
+        """
+        Initializes this Fixture object
+        :param kind: the kind of page
+        :param size: the requested size in bytes
+        :param text: the page text
+        """
+
+        self.kind, self.size, self.text = kind, size, text
+        self.bytes = len(text.encode("utf-8"))
+
+        self._elements = None
+        self._tags = None
+        self._tree = None
+
+    @property
+    def elements(self):
+        if self._elements is None:
+            self._elements = HTMLParser.parse(self.text)
+
+        return self._elements
+
+    @property
+    def tags(self):
+        if self._tags is None:
+            self._tags = TAG.findall(self.text)
+
+        return self._tags
+
+    @property
+    def tree(self):
+        if self._tree is None:
+            self._tree = encode_tree(self.elements)
+
+        return self._tree
+
+
+def tokenize(tokenizer):
+    def run(fixture):
+        return sum(1 for _ in HTMLParser.iter_tokens(fixture.text, tokenizer))
+
+    return run
+
+
+def parse_tags(fixture):
+    for tag in fixture.tags:
+        HTMLTag.parse(tag)
+
+    return len(fixture.tags)
+
+
+def parse(fixture):
+    return count_nodes(HTMLParser.parse(fixture.text))
+
+
+def feed(fixture):
+    parser = HTMLParser()
+    elements = []
+
+    for i in range(0, len(fixture.text), CHUNK_SIZE):
+        elements += parser.feed(fixture.text[i:i + CHUNK_SIZE])
+
+    return count_nodes(elements + parser.close())
+
+
+def render(layout_class):
+    def run(fixture):
+        browser = Browser(layout=layout_class(80))
+        browser.url = "http://bench.invalid/"
+        browser.render(fixture.elements)
+        return count_nodes(fixture.elements)
+
+    return run
+
+
+def load_tree(fixture):
+    return count_nodes(list(StoredTree(fixture.tree).iter_elements()))
+
+
+# Stage name -> the function running it on a fixture and returning the number of items it processed
+STAGES = collections.OrderedDict([
+    ("tokenize-slice", tokenize("slice")),
+    ("tokenize-char", tokenize("char")),
+    ("tag-parse", parse_tags),
+    ("parse", parse),
+    ("feed", feed),
+    ("render-word", render(WordWrapLayout)),
+    ("render-char", render(CharWrapLayout)),
+    ("tree-load", load_tree),
+])
+
+
+def peak_memory(run):
+    """
+    Measures the peak memory a function allocates
+    :param run: the function, called without arguments
+    :return: the peak size of the traced allocations in bytes
+    """
+
+    tracemalloc.start()
+
+    try:
+        run()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def measure(stage, fixture, repeat=3, memory=True):
+    """
+    Runs a stage on a fixture
+    :param stage: the stage name, one of STAGES
+    :param fixture: the Fixture
+    :param repeat: the number of timed runs, the best one counts
+    :param memory: whether to measure the peak memory in an extra run
+    :return: a dict with the results
+    """
+
+    run = STAGES[stage]
+
+    # An untimed run prepares what the stage needs and warms up the caches
+    items = run(fixture)
+    seconds = float("inf")
+
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run(fixture)
+        seconds = min(seconds, time.perf_counter() - started)
+
+    result = {
+        "type": "result",
+        "kind": fixture.kind,
+        "size": fixture.size,
+        "bytes": fixture.bytes,
+        "stage": stage,
+        "items": items,
+        "seconds": seconds,
+        "mb_per_second": fixture.bytes / 1024 / 1024 / seconds if seconds else 0.0,
+        "items_per_second": items / seconds if seconds else 0.0,
+    }
+
+    if memory:
+        result["peak_memory"] = peak_memory(lambda: run(fixture))
+
+    return result
+
+
+def token_memory(fixture, tokenizer="slice"):
+    """
+    Compares the peak memory of going through the tokens of a fixture as they are made with collecting them first
+    :param fixture: the Fixture
+    :param tokenizer: the name of the tokenizer to use, one of TOKENIZERS
+    :return: a dict with both peaks in bytes
+    """
+
+    streamed = peak_memory(lambda: sum(1 for _ in HTMLParser.iter_tokens(fixture.text, tokenizer)))
+    listed = peak_memory(lambda: len(list(HTMLParser.iter_tokens(fixture.text, tokenizer))))
+
+    return {"type": "token-memory", "kind": fixture.kind, "size": fixture.size, "bytes": fixture.bytes,
+            "tokenizer": tokenizer, "streamed_peak": streamed, "listed_peak": listed,
+            "ratio": listed / streamed if streamed else 0.0}
+
+
+def node_memory(fixture):
+    """
+    Measures how much memory the parsed tree of a fixture keeps, per node
+    :param fixture: the Fixture
+    :return: a dict with the size of the tree in bytes, the number of nodes and the bytes per node
+    """
+
+    tracemalloc.start()
+
+    try:
+        # Only what the tree keeps is still allocated once parsing is done
+        elements = HTMLParser.parse(fixture.text)
+        tree_size = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+
+    nodes = count_nodes(elements)
+
+    return {"type": "node-memory", "kind": fixture.kind, "size": fixture.size, "bytes": fixture.bytes,
+            "nodes": nodes, "tree_bytes": tree_size, "bytes_per_node": tree_size / nodes if nodes else 0.0}
+
+
+def parallel_speedup(fixture, processes, repeat=3):
+    """
+    Measures how much faster parsing a fixture in a process pool is than parsing it in one go
+    :param fixture: the Fixture
+    :param processes: the pool sizes to try
+    :param repeat: the number of timed runs, the best one counts
+    :return: a list of dicts with the results, one for every pool size
+    """
+
+    def best(run):
+        seconds = float("inf")
+
+        for _ in range(repeat):
+            started = time.perf_counter()
+            run()
+            seconds = min(seconds, time.perf_counter() - started)
+
+        return seconds
+
+    serial = best(lambda: HTMLParser.parse(fixture.text))
+    results = []
+
+    for count in processes:
+        # The pool is started and warmed up outside of the timed runs
+        with concurrent.futures.ProcessPoolExecutor(count) as executor:
+            run = lambda: parse_parallel(fixture.text, count, executor=executor)
+            run()
+            seconds = best(run)
+
+        results.append({"type": "parallel", "kind": fixture.kind, "size": fixture.size, "bytes": fixture.bytes,
+                        "processes": count, "cpus": os.cpu_count(), "seconds": seconds, "serial_seconds": serial,
+                        "speedup": serial / seconds if seconds else 0.0})
+
+    return results
+
+
+def scaling(results):
+    """
+    Works out how the run time of every stage grows with the page size
+    :param results: the result dicts
+    :return: a list of dicts with the exponent of the fitted power law, 1.0 for linear time
+    """
+
+    curves = collections.OrderedDict()
+
+    for result in results:
+        curves.setdefault((result["kind"], result["stage"]), []).append((result["bytes"], result["seconds"]))
+
+    fitted = []
+
+    for (kind, stage), points in curves.items():
+        points = [(math.log(size), math.log(seconds)) for size, seconds in points if seconds > 0]
+
+        if len(points) < 2:
+            continue
+
+        mean_x = sum(x for x, _ in points) / len(points)
+        mean_y = sum(y for _, y in points) / len(points)
+        variance = sum((x - mean_x) ** 2 for x, _ in points)
+
+        if not variance:
+            continue
+
+        exponent = sum((x - mean_x) * (y - mean_y) for x, y in points) / variance
+        fitted.append({"type": "scaling", "kind": kind, "stage": stage, "exponent": exponent})
+
+    return fitted
+
+
+def compare(results, baseline, threshold):
+    """
+    Compares results with the ones of an earlier run
+    :param results: the result dicts
+    :param baseline: the result dicts of the earlier run
+    :param threshold: the relative slowdown that counts as a regression, e.g. 0.1 for 10%
+    :return: a list of dicts with the speed ratios, below 1.0 means slower
+    """
+
+    earlier = {(result["kind"], result["size"], result["stage"]): result
+               for result in baseline if result.get("type") == "result"}
+
+    comparisons = []
+
+    for result in results:
+        old = earlier.get((result["kind"], result["size"], result["stage"]))
+
+        if not old or not result["seconds"]:
+            continue
+
+        ratio = old["seconds"] / result["seconds"]
+        comparisons.append({"type": "comparison", "kind": result["kind"], "size": result["size"],
+                            "stage": result["stage"], "speedup": ratio, "regression": ratio < 1 - threshold})
+
+    return comparisons
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(prog="python -m textbrowser.bench",
+                                     description="Measure the parse and render throughput on a generated corpus.")
+    parser.add_argument("-k", "--kinds", default=",".join(KINDS), help="the kinds of pages, comma-separated")
+    parser.add_argument("-s", "--sizes", help="the page sizes in KB, comma-separated, "
+                                              "defaults to %s and %s for the large pages" %
+                                              (",".join(map(str, DEFAULT_SIZES)), ",".join(map(str, LARGE_SIZES))))
+    parser.add_argument("-t", "--stages", default=",".join(STAGES), help="the stages to run, comma-separated")
+    parser.add_argument("-r", "--repeat", type=int, default=3, help="the number of timed runs, the best one counts")
+    parser.add_argument("--no-memory", action="store_true", help="skip measuring the peak memory")
+    parser.add_argument("-p", "--processes", help="also measure parallel parsing with these pool sizes, "
+                                                  "comma-separated")
+    parser.add_argument("-o", "--output", help="a file to write the JSON lines to instead of stdout")
+    parser.add_argument("-c", "--compare", help="a JSON lines file of an earlier run to compare with")
+    parser.add_argument("--threshold", type=float, default=0.1, help="the slowdown that counts as a regression")
+    parser.add_argument("--write-corpus", metavar="DIRECTORY", help="write the corpus pages to a directory and exit")
+    options = parser.parse_args(args)
+
+    kinds = options.kinds.split(",")
+    stages = options.stages.split(",")
+
+    def sizes_of(kind):
+        if options.sizes:
+            sizes = options.sizes.split(",")
+        else:
+            sizes = LARGE_SIZES if kind == "large" else DEFAULT_SIZES
+
+        return [int(size) * 1024 for size in sizes]
+
+    for name, known in [("kind", kinds), ("stage", stages)]:
+        unknown = [value for value in known if value not in (KINDS if name == "kind" else STAGES)]
+
+        if unknown:
+            parser.error("unknown %s: %s" % (name, ", ".join(unknown)))
+
+    if options.write_corpus:
+        os.makedirs(options.write_corpus, exist_ok=True)
+
+        for kind in kinds:
+            for size in sizes_of(kind):
+                path = os.path.join(options.write_corpus, "%s-%dk.html" % (kind, size // 1024))
+
+                with open(path, "w", encoding="utf-8") as f:
+                    f.write(generate_page(kind, size))
+
+        return
+
+    output = open(options.output, "w") if options.output else sys.stdout
+    results = []
+
+    def emit(record):
+        output.write(json.dumps(record) + "\n")
+        output.flush()
+
+    emit({"type": "environment", "python": platform.python_version(),
+          "implementation": platform.python_implementation(), "machine": platform.machine(), "time": time.time()})
+
+    # The parser reports errors on stdout, which may carry the results
+    with contextlib.redirect_stdout(sys.stderr):
+        for kind in kinds:
+            for size in sizes_of(kind):
+                fixture = Fixture(kind, size, generate_page(kind, size))
+
+                for stage in stages:
+                    result = measure(stage, fixture, options.repeat, not options.no_memory)
+                    results.append(result)
+                    emit(result)
+
+                    print("%-10s %6d KB %-15s %8.2f MB/s %12.0f items/s" % (kind, size // 1024, stage,
+                                                                           result["mb_per_second"],
+                                                                           result["items_per_second"]))
+
+                if not options.no_memory:
+                    record = token_memory(fixture)
+                    emit(record)
+
+                    print("%-10s %6d KB tokens %9.1f KB streamed, %9.1f KB in a list (%.0fx)" %
+                          (kind, size // 1024, record["streamed_peak"] / 1024, record["listed_peak"] / 1024,
+                           record["ratio"]))
+
+                    record = node_memory(fixture)
+                    emit(record)
+
+                    print("%-10s %6d KB tree   %9.1f bytes per node, %d nodes" %
+                          (kind, size // 1024, record["bytes_per_node"], record["nodes"]))
+
+                if options.processes:
+                    processes = [int(count) for count in options.processes.split(",")]
+
+                    for record in parallel_speedup(fixture, processes, options.repeat):
+                        emit(record)
+
+                        print("%-10s %6d KB parse in %2d processes %6.2fx as fast (%d CPUs)" %
+                              (kind, size // 1024, record["processes"], record["speedup"], record["cpus"]))
+
+    for record in scaling(results):
+        emit(record)
+        print("%-10s %-15s time grows with size^%.2f" % (record["kind"], record["stage"], record["exponent"]),
+              file=sys.stderr)
+
+    if options.compare:
+        with open(options.compare, "r") as f:
+            baseline = [json.loads(line) for line in f if line.strip()]
+
+        for record in compare(results, baseline, options.threshold):
+            emit(record)
+
+            if record["regression"]:
+                print("Regression: %(kind)s %(size)d bytes %(stage)s is %(speedup).2fx as fast" % record,
+                      file=sys.stderr)
+
+    if output is not sys.stdout:
+        output.close()
+
+
+if __name__ == "__main__":
+    main()
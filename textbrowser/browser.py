@@ -1,8 +1,62 @@
+import asyncio
+import collections
 import html
+import inspect
+import threading
 import urllib.parse
-import urllib.request
 
+from textbrowser.aio import *
+from textbrowser.budget import *
+from textbrowser.cache import *
+from textbrowser.charset import *
+from textbrowser.fetch import *
+from textbrowser.history import *
+from textbrowser.instrument import *
+from textbrowser.layout import *
+from textbrowser.pager import *
 from textbrowser.parser import *
+from textbrowser.prefetch import *
+from textbrowser.search import *
+from textbrowser.treecache import *
+
+CHUNK_SIZE = 16384
+
+PROMPT = "Type address or hyperlink/form index (or 'help'): "
+
+# The number of lines a paged page is laid out by at a time while searching it
+SEARCH_LINES = 1000
+
+# The elements whose handlers read their inner elements, so they are only rendered once they are complete
+COMPLETE_ELEMENTS = ["select"]
+
+# Render stack entries for entering an element that is still being parsed, and for finishing it once it is complete
+ENTER_ELEMENT = object()
+FINISH_ELEMENT = object()
+
+# The prefix and the suffix of the elements that are rendered the same way every time
+TAG_STYLES = {
+    "title": ("\x1b[36mDocument Title: \x1b[0m", "\n"),
+    "b": ("\x1b[1m", "\x1b[21m"),
+    "strong": ("\x1b[1m", "\x1b[21m"),
+    "em": ("\x1b[1m", "\x1b[21m"),
+    "h1": ("\x1b[1m", "\x1b[21m\n"),
+    "h2": ("\x1b[1m", "\x1b[21m\n"),
+    "h3": ("\x1b[1m", "\x1b[21m\n"),
+    "h4": ("\x1b[1m", "\x1b[21m\n"),
+    "i": ("\x1b[3m", "\x1b[23m"),
+    "u": ("\x1b[4m", "\x1b[24m"),
+    "s": ("\x1b[9m", "\x1b[29m"),
+    "strike": ("\x1b[9m", "\x1b[29m"),
+    "ul": ("", "\n"),
+    "ol": ("", "\n"),
+    "br": ("", "\n"),
+    "p": ("", "\n"),
+    "td": ("", "\n"),
+    "div": ("\n", "\n"),
+    "span": ("\t", ""),
+    "tr": ("\t", ""),
+    "li": ("\n* ", ""),
+}
 
 
 class FormInput(object):
@@ -35,26 +89,180 @@ class Form(object):
 
 
 class Browser(object):
-    def __init__(self, url=None):
+    def __init__(self, url=None, layout=None, cache=None, history=None, pool=None, prefetcher=None, pager=None,
+                 tree_cache=None, instrumentation=None, budget=None):
+        if layout is None:
+            layout = WordWrapLayout()
+
+        if budget is None:
+            budget = Budget()
+
+        if history is None:
+            history = History()
+
+        self.layout = layout
+        self.pool = pool if pool else AsyncConnectionPool()
+        self.cache = cache
+        self.history = history
+        self.prefetcher = prefetcher
+        self.pager = pager
+        self.tree_cache = tree_cache
+        self.instrumentation = instrumentation
+        self.budget = budget
         self.url = None
         self.hyperlinks = []
         self.forms = []
-        self.page = None
-        self.rendered = ""
+
+        # The bytes of the current page as transferred and after decompression
+        self.transfer_size = 0
+        self.decoded_size = 0
+
+        # Only kept when the history keeps the element trees
+        self.elements = None
+
+        # The form whose inputs are being rendered, and the ones it is nested in
+        self.current_form = None
+        self.outer_forms = []
+
+        self.tag_handlers = {
+            "a": self.enter_hyperlink,
+            "img": self.enter_image,
+            "form": self.enter_form,
+            "input": self.enter_input,
+            "select": self.enter_select,
+        }
+
+        self.exit_handlers = {
+            "form": self.exit_form,
+        }
+
+        # The rendered output is kept as a list of pieces, along with the current column,
+        # so checking the line length never has to look back at the output
+        self.output = []
+        self.column = 0
+        self.line_count = 0
+        self.rendered_size = 0
+
+        # Why the page was cut short, None if it wasn't, and whether the marker saying so was written
+        self.truncated = None
+        self.truncation_marked = False
+
+        # With the pager, the page is rendered lazily: the walk stops when enough lines are laid out,
+        # and the render stack entries that weren't reached yet wait in a queue
+        self.paged = False
+        self.parsing = False
+        self.render_stack = []
+        self.pending_elements = collections.deque()
+
+        # The elements entered while they were still being parsed, outermost first, each with the number of its
+        # inner elements already rendered, and the suffixes to finish them with
+        self.open_path = []
+        self.open_suffixes = []
+        self.hyperlink_lines = []
+        self.form_lines = []
+
+        # The plain text of the rendered lines, the last searched pattern and the line of its last match
+        self.line_index = LineIndex(self.hyperlink_lines, self.form_lines)
+        self.search_pattern = None
+        self.search_line = -1
+
+        # The index of the paged page, and the lines of the anchor targets the walk went past
+        self.element_index = None
+        self.anchors = None
+        self.anchor_lines = {}
+
+        # The page being loaded, and whether the command prompt is waiting for input
+        self.navigation = None
+        self.prompting = False
+
+        if url:
+            self.run(url)
+
+    def run(self, url=None):
+        asyncio.run(self.command_loop(url))
+
+    async def command_loop(self, url=None):
+        loop = asyncio.get_running_loop()
+        commands = asyncio.Queue()
+        prompt_ready = threading.Event()
+
+        # Commands are read in a thread, so that a page can load while the prompt waits for the next one
+        def read_commands():
+            while True:
+                prompt_ready.wait()
+                prompt_ready.clear()
+
+                self.prompting = True
+
+                try:
+                    command = input(PROMPT)
+                except EOFError:
+                    command = None
+
+                self.prompting = False
+                loop.call_soon_threadsafe(commands.put_nowait, command)
+
+                if command is None:
+                    break
+
+        threading.Thread(target=read_commands, daemon=True).start()
 
         if url:
-            self.go(url)
+            self.navigate(url)
+
+        while True:
+            prompt_ready.set()
+            command = await commands.get()
+
+            if command is None:
+                break
 
-    def go(self, url, data=None):
+            # A bad command is reported and the loop goes on with the next one
+            try:
+                self.execute(command)
+            except Exception as ex:
+                print("Couldn't run %s: %r" % (command, ex))
+
+        self.stop_loading()
+
+        if self.prefetcher:
+            self.prefetcher.cancel()
+
+        self.pool.close()
+
+    def stop_loading(self):
+        if self.navigation and not self.navigation.done():
+            self.navigation.cancel()
+
+    def navigate(self, url, data=None, remember=True):
+        # Only one page loads at a time, a new navigation cancels the previous one
+        self.stop_loading()
+        self.navigation = asyncio.ensure_future(self.go(url, data, remember))
+
+    async def go(self, url, data=None, remember=True):
         print("Loading %s..." % url)
         if not (url.startswith("http://") or url.startswith("https://")):
             url = "http://" + url
 
         self.url = url
+        response = None
+
+        timer = self.instrumentation
+        navigation_stats = timer.begin(url) if timer else None
+        status = "error"
 
         try:
-            response = urllib.request.urlopen(url, data=data)
-            self.page = response.read().decode("utf-8", errors="replace")
+            if self.prefetcher and data is None:
+                response = await self.prefetcher.take(url)
+
+            if self.prefetcher:
+                self.prefetcher.cancel()
+
+            if not response:
+                response = await self.open_url(url, data)
+
+            if timer:
+                timer.lap("fetch")
 
             old_url = self.url
             self.url = response.geturl()
@@ -62,288 +270,945 @@ class Browser(object):
             if not old_url == self.url:
                 print("Redirect: ", self.url)
 
-            self.process()
+            await self.process_stream(response)
+
+            fragment = urllib.parse.urldefrag(url)[1]
+
+            if self.paged and fragment:
+                self.show_anchor(fragment)
+
+            if self.prefetcher:
+                # A paged page is only partly rendered, but the index has all of its hyperlinks and forms
+                self.prefetcher.start(self.url, self.indexed_hyperlinks(), self.indexed_forms(), self.open_url)
+
+            if self.paged:
+                # A paged page is never completely rendered, so only its URL is remembered
+                entry = HistoryEntry(self.url)
+            else:
+                entry = HistoryEntry(self.url, self.rendered, self.hyperlinks, self.forms, self.elements,
+                                     self.line_index, self.element_index, self.current_form, self.truncated,
+                                     self.transfer_size, self.decoded_size)
+
+            if remember:
+                self.history.visit(entry)
+            else:
+                self.history.replace(entry)
+
+            status = "ok"
+        except asyncio.CancelledError:
+            status = "cancelled"
+            print("Stopped loading %s" % url)
+            raise
         except Exception as ex:
             print("Error loading the page: %r" % ex)
+        finally:
+            if response:
+                response.close()
 
-        stop = False
-        while not stop:
-            command = input("Type address or hyperlink/form index (or 'help'): ")
+            if timer:
+                timer.end(status, navigation_stats)
 
-            if command == "help":
-                print()
-                print("Navigation help")
-                print("Enter a hyperlink index (e.g. 1) to follow it.")
-                print("Enter a form index starting from # to edit it and ! to submit (e.g. #0 or !5).")
-            elif command[0] not in ["!", "#"]:
-                try:
-                    hyperlink_index = int(command, 10)
-                    if hyperlink_index < len(self.hyperlinks):
-                        self.go(self.hyperlinks[hyperlink_index])
-                    else:
-                        print("Invalid hyperlink index!")
-                except ValueError:
-                    stop = True
-                    self.go(command)
+        # The page output clears the screen, so show the prompt again
+        if self.prompting:
+            print(PROMPT, end="", flush=True)
+
+    async def open_url(self, url, data=None):
+        if self.cache:
+            return await self.cache.open(self.pool, url, data)
+        else:
+            return await self.pool.open(url, data=data)
+
+    def execute(self, command):
+        if self.paged and (command in ["", "next", "prev", "top"] or command.startswith("link ")):
+            self.page_command(command)
+        elif not command:
+            pass
+        elif command.startswith("/"):
+            self.search(command[1:])
+        elif command == "help":
+            print()
+            print("Navigation help")
+            print("Enter a hyperlink index (e.g. 1) to follow it.")
+            print("Enter a form index starting from # to edit it and ! to submit (e.g. #0 or !5).")
+            print("Enter 'back' or 'forward' to move through the history.")
+            print("Enter / and some text (e.g. /price) to find it on the page, and / alone for the next match.")
+            print("Enter 'info' to show the size of the current page.")
+            print("Enter 'stats' to show where the time went while loading the last page.")
+            print("Enter 'cache' to show the cache statistics.")
+            print("Enter 'prefetch' to show the prefetch statistics.")
+            print("Entering a new address or index while a page is loading stops loading it.")
+
+            if self.pager:
+                print("Press Enter or enter 'next' for the next screen, 'prev' for the previous one and 'top' "
+                      "for the first one.")
+                print("Enter 'link' and a hyperlink index (e.g. link 12) to show the screen with that hyperlink.")
+        elif command in ["back", "forward"]:
+            self.stop_loading()
+
+            if command == "back":
+                entry = self.history.back()
+            else:
+                entry = self.history.forward()
+
+            if not entry:
+                print("Nothing to go %s to!" % command)
+            elif entry.is_loaded():
+                self.restore(entry)
+            else:
+                self.navigate(entry.url, remember=False)
+        elif command == "info":
+            if self.url:
+                print("%s: %d bytes transferred, %d bytes decoded" % (self.url, self.transfer_size, self.decoded_size))
+
+                if self.title():
+                    print("Title: %s" % self.title())
+            else:
+                print("No page is loaded.")
+        elif command == "stats":
+            if not self.instrumentation:
+                print("Instrumentation is disabled, start the browser with --stats to enable it.")
+            elif not self.instrumentation.last():
+                print("No page was loaded yet.")
             else:
+                print("\n".join(self.instrumentation.last().report()))
+        elif command == "prefetch":
+            if self.prefetcher:
+                stats = self.prefetcher.stats()
+                stats["hit_rate"] *= 100
+
+                print("Prefetch: %(started)d started, %(cancelled)d cancelled, %(hits)d hits, %(misses)d misses, "
+                      "%(hit_rate).0f%% hit rate" % stats)
+            else:
+                print("Prefetching is disabled.")
+        elif command == "cache":
+            if self.cache:
+                print("Cache: %(hits)d hits, %(misses)d misses, %(revalidated)d revalidated, "
+                      "%(evicted)d evicted, %(entries)d entries, %(size)d bytes" % self.cache.stats())
+            else:
+                print("The cache is disabled, start the browser with --cache to enable it.")
+
+            if self.tree_cache:
+                print("Parse tree cache: %(hits)d hits, %(misses)d misses, %(evicted)d evicted, "
+                      "%(entries)d entries, %(size)d bytes" % self.tree_cache.stats())
+        elif command[0] not in ["!", "#"]:
+            try:
+                hyperlink_index = int(command, 10)
+
+                if self.paged:
+                    self.render_lazily(lambda: len(self.hyperlinks) > hyperlink_index)
+
+                if 0 <= hyperlink_index < len(self.hyperlinks):
+                    url, fragment = urllib.parse.urldefrag(self.hyperlinks[hyperlink_index])
+
+                    # An anchor on the paged page is shown without loading the page again
+                    if self.paged and fragment and url == urllib.parse.urldefrag(self.url)[0]:
+                        self.show_anchor(fragment)
+                    else:
+                        self.navigate(self.hyperlinks[hyperlink_index])
+                else:
+                    print("Invalid hyperlink index!")
+            except ValueError:
+                self.navigate(command)
+        else:
+            try:
                 form_index = int(command[1:], 10)
+            except ValueError:
+                print("Invalid form index!")
+                return
 
-                if form_index < len(self.forms):
-                    form = self.forms[form_index]
+            if self.paged:
+                self.render_lazily(lambda: self.form_rendered(form_index))
 
-                    if command[0] == "#":
-                        print("Editing form %d" % form_index)
-                        print("Available inputs:")
+            if 0 <= form_index < len(self.forms):
+                form = self.forms[form_index]
 
-                        available_inputs = []
+                if command[0] == "#":
+                    print("Editing form %d" % form_index)
+                    print("Available inputs:")
 
-                        for form_input in form.get_inputs():
-                            if form_input.input_type not in ["button", "submit", "hidden"]:
-                                if not form_input.input_type == "select":
-                                    print("| %s <%s> [%s]" % (form_input.name, form_input.input_type, form_input.value))
-                                else:
-                                    print("| %s <select>" % form_input.name)
+                    available_inputs = []
 
-                                    allowed_values = []
+                    for form_input in form.get_inputs():
+                        if form_input.input_type not in ["button", "submit", "hidden"]:
+                            if not form_input.input_type == "select":
+                                print("| %s <%s> [%s]" % (form_input.name, form_input.input_type, form_input.value))
+                            else:
+                                print("| %s <select>" % form_input.name)
+
+                                allowed_values = []
 
-                                    for value, text in form_input.options:
-                                        if value == form_input.value:
-                                            print("-> * %s [%s]" % (text, value))
-                                        else:
-                                            print("-> . %s [%s]" % (text, value))
+                                for value, text in form_input.options:
+                                    if value == form_input.value:
+                                        print("-> * %s [%s]" % (text, value))
+                                    else:
+                                        print("-> . %s [%s]" % (text, value))
 
-                                        allowed_values.append(value)
+                                    allowed_values.append(value)
 
-                                available_inputs.append(form_input.name)
+                            available_inputs.append(form_input.name)
 
-                        input_name = None
+                    input_name = None
 
-                        while input_name not in available_inputs:
-                            input_name = input("Input name: ")
+                    while input_name not in available_inputs:
+                        input_name = input("Input name: ")
 
-                            if not input_name:
-                                break
+                        if not input_name:
+                            break
 
-                        if input_name:
-                            available_values = None
-                            form_input = self.forms[form_index].inputs[input_name]
+                    if input_name:
+                        available_values = None
+                        form_input = self.forms[form_index].inputs[input_name]
 
-                            if form_input.input_type == "select":
-                                available_values = [k for k, v in form_input.options]
+                        if form_input.input_type == "select":
+                            available_values = [k for k, v in form_input.options]
 
-                            input_value = None
+                        input_value = None
 
-                            while (available_values and input_value not in available_values) or not input_value:
-                                input_value = input("Value: ")
+                        while (available_values and input_value not in available_values) or not input_value:
+                            input_value = input("Value: ")
 
-                            self.forms[form_index].set_input(input_name, input_value)
+                        self.forms[form_index].set_input(input_name, input_value)
+                else:
+                    form = self.forms[form_index]
+                    action = form.action
+
+                    input_values = {}
+                    for form_input in form.get_inputs():
+                        if not (not form_input.value and form_input.input_type == "checkbox"):
+                            input_values[form_input.name] = form_input.value
+
+                    params = urllib.parse.urlencode([(k, v) for k, v in input_values.items()])
+
+                    if form.method == "get":
+                        action += "?" + params
+                        self.navigate(action)
                     else:
-                        form = self.forms[form_index]
-                        action = form.action
+                        self.navigate(action, params.encode("utf-8"))
+            else:
+                print("Invalid form index!")
 
-                        input_values = {}
-                        for form_input in form.get_inputs():
-                            if not (not form_input.value and form_input.input_type == "checkbox"):
-                                input_values[form_input.name] = form_input.value
+    async def process_stream(self, response):
+        # Render and print the elements as soon as they are parsed instead of waiting for the whole body
+        content_decoder = ContentDecoder(response.headers.get("Content-Encoding", ""))
+        decoder = StreamDecoder(charset_from_headers(response.headers))
 
-                        params = urllib.parse.urlencode([(k, v) for k, v in input_values.items()])
+        self.render([])
+        self.elements = [] if self.history.keep_elements else None
+        self.transfer_size, self.decoded_size = 0, 0
 
-                        if form.method == "get":
-                            action += "?" + params
-                            self.go(action)
-                        else:
-                            self.go(action, params.encode("utf-8"))
+        self.paged = self.pager is not None
+        self.parsing = True
+        shown = False
 
-    def process(self):
-        print("\x1bc")
+        # A paged page clears the screen once it shows its first screen
+        if not self.paged:
+            print("\x1bc")
+
+        # Every page is indexed, so that its hyperlinks, forms and title are found without walking the tree
+        self.element_index = ElementIndex()
+
+        if self.paged:
+            self.pager.reset()
+            self.anchors = self.element_index.targets
+
+        parser = HTMLParser(index=self.element_index, max_tokens=self.budget.max_tokens,
+                            max_depth=self.budget.max_depth)
+        max_body_size = self.budget.max_body_size
+
+        # With the parse tree cache, the body is hashed so that the tree parsed from it can be stored
+        tree, tree_hash, hashing = None, None, False
+
+        if self.tree_cache:
+            tree_elements = []
+
+            if isinstance(response, (CachedResponse, PrefetchedResponse)):
+                # The body is already here, so the tree of the same bytes can be looked up before parsing
+                body = response.read()
+                tree_hash = tree_key(body, response.headers)
+                tree = self.tree_cache.load(tree_hash.hexdigest())
+                response = PrefetchedResponse(response.geturl(), response.headers, body)
+            else:
+                tree_hash = tree_key(b"", response.headers)
+                hashing = True
+
+        timer = self.instrumentation
 
         try:
-            elements = HTMLParser.parse(self.page)
-            self.render(elements)
-            print(self.rendered)
+            if tree and max_body_size is not None and tree.decoded_size > max_body_size:
+                # The page is over the budget, so it is parsed up to the limit instead
+                tree = None
+
+            if tree:
+                self.parsing = False
+                self.transfer_size, self.decoded_size = len(body), tree.decoded_size
+                elements = list(tree.iter_elements(self.element_index, self.budget.max_tokens, self.budget.max_depth))
+
+                if tree.truncated:
+                    self.truncate(tree.truncated)
+
+                if timer:
+                    timer.lap("tree-load", len(body), count_nodes(elements))
+
+                self.show_elements(elements, None, shown)
+
+            while not tree:
+                chunk = response.read(CHUNK_SIZE)
+
+                # Cached responses are read directly, network ones with asyncio
+                if inspect.isawaitable(chunk):
+                    chunk = await chunk
+
+                if timer:
+                    timer.lap("read", len(chunk))
+
+                self.transfer_size += len(chunk)
+
+                if hashing:
+                    tree_hash.update(chunk)
+
+                data = content_decoder.decompress(chunk) if chunk else content_decoder.flush()
+                self.decoded_size += len(data)
+                final = not chunk
+
+                if max_body_size is not None and self.decoded_size > max_body_size:
+                    # Drop what is over the budget and stop fetching
+                    data = data[:len(data) - (self.decoded_size - max_body_size)]
+                    self.truncate("more than %d bytes" % max_body_size)
+                    final = True
+
+                text = decoder.decode(data, final=final)
+
+                if timer:
+                    timer.lap("decode", len(data))
+
+                elements = parser.feed(text)
+
+                if parser.truncated:
+                    self.truncate(parser.truncated)
+                    final = True
+
+                if final:
+                    elements += parser.close()
+                    self.parsing = False
+
+                if timer:
+                    timer.lap("parse", nodes=count_nodes(elements))
+
+                if tree_hash:
+                    tree_elements += elements
+
+                shown = self.show_elements(elements, None if final else parser, shown)
+
+                # Once the output is over the budget, the rest of the page isn't needed either
+                if self.truncated:
+                    self.parsing = False
+                    break
+
+                if final:
+                    if tree_hash:
+                        self.tree_cache.store(tree_hash.hexdigest(), tree_elements, self.decoded_size)
+
+                    break
+
+            if not self.paged:
+                # The marker goes after what was rendered before the page was cut short
+                printed = len(self.output)
+                self.mark_truncation()
+
+                text = "".join(self.output[printed:])
+                print(text)
+                self.line_index.feed(text, True)
+        except (asyncio.TimeoutError, ConnectionError):
+            # Network errors mean the page couldn't be loaded, not parsed
+            raise
         except Exception as ex:
             print("Couldn't parse the page: %r" % ex)
 
+    def show_elements(self, elements, parser, shown):
+        # Shows newly parsed elements along with what is complete inside of the open ones,
+        # the parser is None once parsing is over, returns whether the first screen of a paged page was shown
+        if self.elements is not None:
+            self.elements += elements
+
+        entries = self.stream_entries(elements, parser)
+        final = parser is None
+        timer = self.instrumentation
+
+        if not self.paged:
+            printed = len(self.output)
+            entries.reverse()
+            self.walk(entries)
+
+            if timer:
+                timer.lap("render")
+
+            text = "".join(self.output[printed:])
+            print(text, end="", flush=True)
+            self.line_index.feed(text)
+
+            if timer:
+                timer.lap("print")
+
+            return shown
+
+        self.pending_elements.extend(entries)
+
+        # Show the first screen as soon as it is laid out, the rest of the page is only parsed
+        if not shown:
+            self.render_lines(self.pager.needed())
+
+            if timer:
+                timer.lap("render")
+
+            if self.line_count >= self.pager.needed() or final:
+                self.show_screen()
+
+                if timer:
+                    timer.lap("print")
+
+                return True
+
+        return shown
+
+    def stream_entries(self, elements, parser):
+        # Gets the render stack entries for the finished top-level elements, and for the open elements
+        # and their complete inner elements, in document order
+        entries = []
+        path = self.open_path
+
+        for element in elements:
+            if path and element is path[0][0]:
+                self.finish_open_element(0, entries)
+            else:
+                entries.append((element, None))
+
+        open_elements = parser.open_elements() if parser is not None else []
+
+        for depth, element in enumerate(open_elements):
+            if depth == len(path):
+                if element.name in COMPLETE_ELEMENTS:
+                    break
+
+                entries.append((element, ENTER_ELEMENT))
+                path.append([element, 0])
+
+            # The last inner element is still being parsed if there is a deeper open element
+            end = len(element.inner_elements)
+
+            if depth + 1 < len(open_elements):
+                end -= 1
+
+            self.take_inner_elements(depth, end, entries)
+
+        return entries
+
+    def take_inner_elements(self, depth, end, entries):
+        # Adds the entries for the inner elements of an open element up to the given one, which weren't added yet
+        entry = self.open_path[depth]
+        inner_elements = entry[0].inner_elements
+
+        for i in range(entry[1], end):
+            inner_element = inner_elements[i]
+
+            if depth + 1 < len(self.open_path) and inner_element is self.open_path[depth + 1][0]:
+                self.finish_open_element(depth + 1, entries)
+            else:
+                entries.append((inner_element, None))
+
+        entry[1] = end
+
+    def finish_open_element(self, depth, entries):
+        # Adds the entries for the rest of an element entered while it was open, and for finishing it
+        element = self.open_path[depth][0]
+
+        self.take_inner_elements(depth, len(element.inner_elements), entries)
+        entries.append((element, FINISH_ELEMENT))
+        del self.open_path[depth:]
+
+    def restore(self, entry):
+        print("\x1bc")
+
+        self.url = entry.url
+        self.rendered = entry.rendered
+        self.transfer_size, self.decoded_size = entry.transfer_size, entry.decoded_size
+        self.hyperlinks, self.forms, self.elements = entry.hyperlinks, entry.forms, entry.elements
+        self.element_index, self.current_form = entry.element_index, entry.current_form
+        self.paged = False
+        self.anchors = None
+
+        # The truncation mark is already part of the rendered page
+        self.truncated = entry.truncated
+        self.truncation_marked = entry.truncated is not None
+
+        if entry.line_index is None:
+            entry.line_index = LineIndex()
+            entry.line_index.feed(entry.rendered, True)
+
+        self.line_index = entry.line_index
+        self.hyperlink_lines, self.form_lines = self.line_index.hyperlink_lines, self.line_index.form_lines
+        self.search_line = -1
+
+        print(self.rendered)
+
+    @property
+    def rendered(self):
+        if len(self.output) > 1:
+            self.output[:] = ["".join(self.output)]
+
+        return "".join(self.output)
+
+    @rendered.setter
+    def rendered(self, rendered):
+        self.output = []
+        self.column = 0
+        self.line_count = 0
+        self.rendered_size = 0
+        self.write(rendered)
+
+    def write(self, text):
+        if text:
+            self.output.append(text)
+            self.rendered_size += len(text)
+            line_break = text.rfind("\n")
+
+            if line_break == -1:
+                self.column += display_width(text)
+            else:
+                self.column = display_width(text[line_break + 1:])
+                self.line_count += text.count("\n")
+
     def register_hyperlink(self, url):
         self.hyperlinks.append(urllib.parse.urljoin(self.url, url))
+        self.hyperlink_lines.append(self.line_count)
         return len(self.hyperlinks) - 1
 
     def register_form(self, form):
         form.action = urllib.parse.urljoin(self.url, form.action)
         self.forms.append(form)
+
+        # The form header starts on a new line, the last line is known once the form is rendered
+        self.form_lines.append([self.line_count + 1, None])
         return len(self.forms) - 1
 
+    def indexed_hyperlinks(self):
+        # The resolved hyperlinks of the whole page, rendered or not
+        if self.element_index is None:
+            return list(self.hyperlinks)
+
+        return [urllib.parse.urljoin(self.url, element.attributes["href"])
+                for element in self.element_index.find_all("a", "href")]
+
+    def indexed_forms(self):
+        # The forms of the whole page, rendered or not, with their inputs
+        if self.element_index is None:
+            return list(self.forms)
+
+        forms = []
+
+        for element in self.element_index.get_forms():
+            form = Form(urllib.parse.urljoin(self.url, element.attributes.get("action", "")),
+                        element.attributes.get("method", "get").lower())
+
+            for input_element in self.element_index.get_inputs(element):
+                input_name = input_element.attributes.get("name", "")
+
+                if input_element.name == "select":
+                    form.add_select(input_name, input_element.attributes.get("value", ""),
+                                    self.select_options(input_element))
+                elif input_element.name == "input" and input_name:
+                    form.add_input(input_name, input_element.attributes.get("type", ""),
+                                   self.input_value(input_element))
+
+            forms.append(form)
+
+        return forms
+
+    def title(self):
+        # The text of the first title element, or None if the page has none
+        if self.element_index is None:
+            return None
+
+        element = self.element_index.find("title")
+
+        if element is None:
+            return None
+
+        return "".join(inner.text for inner in element.inner_elements if inner.is_text).strip()
+
     def render(self, elements, initial=True):
         if initial:
             self.rendered = ""
             self.hyperlinks = []
+            self.hyperlink_lines = []
+            self.form_lines = []
+            self.line_index = LineIndex(self.hyperlink_lines, self.form_lines)
+            self.search_line = -1
             self.forms = []
+            self.current_form = None
+            self.outer_forms = []
+            self.render_stack = []
+            self.pending_elements = collections.deque()
+            self.open_path = []
+            self.open_suffixes = []
+            self.element_index = None
+            self.anchors = None
+            self.anchor_lines = {}
+            self.truncated = None
+            self.truncation_marked = False
+
+        self.walk([(element, None) for element in reversed(elements)])
+
+    def walk(self, stack, condition=None):
+        # Walk the tree with an explicit stack, so that deeply nested pages can't exhaust the Python stack.
+        # An entry is either (element, None) for an element to render, or (element, suffix) for one to finish.
+        # The walk stops early once the condition holds, and can be resumed with the same stack.
+        anchors = self.anchors
+        max_rendered_size = self.budget.max_rendered_size
+
+        if max_rendered_size is None:
+            max_rendered_size = float("inf")
+
+        while stack:
+            if self.rendered_size > max_rendered_size:
+                # Nothing more is rendered, the rest of the page is dropped
+                self.truncate("more than %d rendered characters" % max_rendered_size)
+                self.mark_truncation()
+
+                del stack[:]
+                self.pending_elements.clear()
+                return True
+
+            if condition is not None and condition():
+                return False
+
+            element, suffix = stack.pop()
+
+            if suffix is FINISH_ELEMENT:
+                suffix = self.open_suffixes.pop()
+
+            if suffix is not None and suffix is not ENTER_ELEMENT:
+                self.write(suffix)
+
+                exit_handler = self.exit_handlers.get(element.name)
+
+                if exit_handler:
+                    exit_handler(element)
+            elif element.is_text:
+                line = html.unescape(element.text.replace("\n", "").replace("\t", ""))
 
-        for element in elements:
-            self.render_element(element)
-
-    def render_element(self, element):
-        # For any HTML element, simply render its internals
-        if isinstance(element, HTMLElement):
-            prefix = ""
-            suffix = ""
-
-            if not element.is_text:
-                if element.name == "a":
-                    title = element.attributes.get("title", "")
-
-                    if "href" in element.attributes:
-                        hyperlink_index = self.register_hyperlink(element.attributes["href"])
-                        if title:
-                            prefix = " \x1b[34m\x1b[1mHyperlink [%d] \x1b[21m\x1b[39m <%s>" % (hyperlink_index, title)
-                        else:
-                            prefix = " \x1b[34m\x1b[1mHyperlink [%d] \x1b[21m\x1b[39m<" % hyperlink_index
-                            suffix = "> "
-                    else:
-                        prefix = " \x1b[34m\x1b[1mHyperlink: \x1b[21m\x1b[39m<"
-                        suffix = "> "
-                elif element.name == "title":
-                    prefix = "\x1b[36mDocument Title: \x1b[0m"
-                    suffix = "\n"
-                elif element.name in ["b", "strong", "em"]:
-                    prefix = "\x1b[1m"
-                    suffix = "\x1b[21m"
-                elif element.name in ["h1", "h2", "h3", "h4"]:
-                    prefix = "\x1b[1m"
-                    suffix = "\x1b[21m\n"
-                elif element.name == "i":
-                    prefix = "\x1b[3m"
-                    suffix = "\x1b[23m"
-                elif element.name == "u":
-                    prefix = "\x1b[4m"
-                    suffix = "\x1b[24m"
-                elif element.name in ["s", "strike"]:
-                    prefix = "\x1b[9m"
-                    suffix = "\x1b[29m"
-                elif element.name in ["ul", "ol", "br", "p", "td"]:
-                    suffix = "\n"
-                elif element.name == "div":
-                    prefix = "\n"
-                    suffix = "\n"
-                elif element.name in ["span", "tr"]:
-                    prefix = "\t"
-                elif element.name == "li":
-                    prefix = "\n* "
-                elif element.name == "img":
-                    if "alt" in element.attributes and element.attributes["alt"]:
-                        prefix = " \x1b[32m\x1b[1mImage [%s]\x1b[21m\x1b[39m " % \
-                                 html.unescape(element.attributes["alt"])
-                    else:
-                        prefix = " \x1b[32m\x1b[1mImage\x1b[21m\x1b[39m "
+                self.write(self.layout.wrap(line, self.column))
+            else:
+                if anchors is not None and element in anchors:
+                    self.anchor_lines[element] = self.line_count
 
-                if element.name == "form":
-                    self.render_form(element)
+                handler = self.tag_handlers.get(element.name)
+
+                if handler:
+                    styles = handler(element)
                 else:
-                    self.rendered += prefix
-                    self.render(element.inner_elements, False)
-                    self.rendered += suffix
-            else:
-                line = html.unescape(element.text.replace("\n", "").replace("\t", ""))
+                    styles = TAG_STYLES.get(element.name, ("", ""))
 
-                broken_line = ""
-                line_len = 0
+                # The handler rendered the element by itself
+                if styles is None:
+                    self.break_long_line()
+                    continue
 
-                for char in line:
-                    if char == "\n":
-                        line_len = 0
+                # The inner elements of an element that is still being parsed follow in later entries
+                entering = suffix is ENTER_ELEMENT
+                prefix, suffix = styles
 
-                    if line_len == 80:
-                        broken_line += "\n"
-                        line_len = 0
+                self.write(prefix)
 
-                    broken_line += char
-                    line_len += 1
+                if entering:
+                    self.open_suffixes.append(suffix)
+                    continue
 
-                self.rendered += broken_line
+                stack.append((element, suffix))
+                stack.extend((inner_element, None) for inner_element in reversed(element.inner_elements))
+                continue
 
-            if "\n" in self.rendered:
-                last_break = self.rendered[::-1].index("\n")
-            else:
-                last_break = 0
+            self.break_long_line()
 
-            if last_break > 80:
-                self.rendered += "\n"
+        return True
 
-    def render_form(self, element, initial=True, current_form=None):
-        if initial:
-            action = element.attributes.get("action", "")
-            method = element.attributes.get("method", "get").lower()
+    def render_lazily(self, condition):
+        # Renders the pending elements until the condition holds, returns whether everything was rendered
+        stack, pending = self.render_stack, self.pending_elements
+
+        while stack or pending:
+            if not stack:
+                stack.append(pending.popleft())
+
+            if not self.walk(stack, condition):
+                return False
+
+        if not self.parsing:
+            self.mark_truncation()
+
+        return True
+
+    def truncate(self, reason):
+        if not self.truncated:
+            self.truncated = reason
+
+    def mark_truncation(self):
+        if self.truncated and not self.truncation_marked:
+            self.truncation_marked = True
+            self.write("\n\x1b[31m\x1b[1m---- Page truncated: %s ----\x1b[21m\x1b[39m\n" % self.truncated)
+
+    def render_lines(self, count):
+        return self.render_lazily(lambda: self.line_count >= count)
+
+    def form_rendered(self, form_index):
+        # A form is complete once all of its inputs were collected
+        if form_index >= len(self.forms):
+            return False
 
-            current_form = Form(action, method)
+        form = self.forms[form_index]
+        return form is not self.current_form and form not in self.outer_forms
 
-            # Render the form differently if one can't submit it
-            if "action" in element.attributes:
-                prefix = "\n\x1b[36m\x1b[1m---- Form [#%d] ----\x1b[21m\x1b[39m\n" % \
-                         len(self.forms)
+    def lay_out(self, count=None):
+        # Lays out the current screen and the lookahead, or the given number of lines,
+        # returns whether the whole page is laid out
+        if count is None:
+            count = self.pager.needed()
+
+        finished = self.render_lines(count) and not self.parsing
+        self.pager.collect(self.output, finished)
+        self.line_index.add_lines(self.pager.lines[self.line_index.line_count:])
+        return finished
+
+    def show_screen(self):
+        finished = self.lay_out()
+
+        print("\x1bc")
+        print(self.pager.screen())
+        print(self.pager.status(self.pager.has_next() or not finished))
+
+    def show_anchor(self, fragment):
+        target = self.element_index.get_by_id(urllib.parse.unquote(fragment))
+
+        if target is not None:
+            self.render_lazily(lambda: target in self.anchor_lines)
+
+        # The target may be somewhere that isn't rendered, like a select option
+        if target not in self.anchor_lines:
+            print("No anchor named %s on this page." % fragment)
+            return
+
+        self.pager.top = self.anchor_lines[target]
+        self.show_screen()
+
+    def page_command(self, command):
+        pager = self.pager
+
+        if command in ["", "next"]:
+            if not self.lay_out() and not pager.has_next():
+                print("The rest of the page is still loading.")
+                return
+
+            if not pager.has_next():
+                print("End of the page.")
+                return
+
+            pager.top += pager.height
+        elif command == "prev":
+            pager.top = max(0, pager.top - pager.height)
+        elif command == "top":
+            pager.top = 0
+        else:
+            try:
+                hyperlink_index = int(command[5:], 10)
+            except ValueError:
+                print("Invalid hyperlink index!")
+                return
+
+            self.render_lazily(lambda: len(self.hyperlinks) > hyperlink_index)
+
+            if not 0 <= hyperlink_index < len(self.hyperlinks):
+                print("Invalid hyperlink index!")
+                return
+
+            pager.top = self.hyperlink_lines[hyperlink_index]
+
+        self.show_screen()
+
+    def search(self, pattern):
+        # A new pattern is searched for from the top of the screen, an empty one goes to the next match
+        if pattern:
+            self.search_pattern = pattern
+            start = self.pager.top if self.paged else 0
+        elif self.search_pattern:
+            pattern = self.search_pattern
+            start = self.search_line + 1
+        else:
+            print("Nothing to search for!")
+            return
+
+        line = self.find_line(pattern, start)
+
+        if line is None:
+            # The rest of the page was searched by now, but a new pattern may still be above the top of the screen
+            if self.line_index.find(pattern) is not None:
+                print("No more matches for %s." % pattern)
             else:
-                prefix = "\n\x1b[36m\x1b[1m---- Form ----\x1b[21m\x1b[39m\n"
+                print("%s isn't on this page." % pattern)
+
+            if self.paged and self.parsing:
+                print("The rest of the page is still loading.")
+
+            return
+
+        self.search_line = line
+
+        if self.paged:
+            self.pager.top = line
+            self.show_screen()
+
+        message = "Line %d: %s" % (line + 1, self.line_index.line(line).strip())
+        hyperlinks = self.line_index.hyperlinks_on(line)
+        forms = self.line_index.forms_on(line)
+
+        if hyperlinks:
+            message += " (hyperlinks %s)" % ", ".join("[%d]" % i for i in hyperlinks)
+
+        if forms:
+            message += " (form %s)" % ", ".join("[#%d]" % i for i in forms)
+
+        print(message)
+
+    def find_line(self, pattern, start):
+        # Only the laid out lines of a paged page are indexed, so more of it is laid out until the pattern is found
+        while True:
+            line = self.line_index.find(pattern, start)
+
+            if line is not None or not self.paged:
+                return line
+
+            line_count = self.line_index.line_count
+            self.lay_out(line_count + SEARCH_LINES)
 
-            suffix = "\n\x1b[36m\x1b[1m---- End form ----\x1b[21m\x1b[39m\n"
+            if self.line_index.line_count == line_count:
+                return None
 
-            self.rendered += prefix
-            self.render_form(element, False, current_form)
-            self.rendered += suffix
+    def break_long_line(self):
+        if self.column > self.layout.width:
+            self.write("\n")
 
-            self.register_form(current_form)
+    def enter_hyperlink(self, element):
+        title = element.attributes.get("title", "")
+
+        if "href" in element.attributes:
+            hyperlink_index = self.register_hyperlink(element.attributes["href"])
+            if title:
+                return " \x1b[34m\x1b[1mHyperlink [%d] \x1b[21m\x1b[39m <%s>" % (hyperlink_index, title), ""
+            else:
+                return " \x1b[34m\x1b[1mHyperlink [%d] \x1b[21m\x1b[39m<" % hyperlink_index, "> "
         else:
-            for inner_element in element.inner_elements:
-                if inner_element.name == "input":
-                    input_name = inner_element.attributes.get("name", "")
-                    input_type = inner_element.attributes.get("type", "")
-                    input_value = inner_element.attributes.get("value", "")
+            return " \x1b[34m\x1b[1mHyperlink: \x1b[21m\x1b[39m<", "> "
 
-                    if input_type == "checkbox" and "checked" in inner_element.attributes:
-                        input_value = input_name
+    def enter_image(self, element):
+        if "alt" in element.attributes and element.attributes["alt"]:
+            return " \x1b[32m\x1b[1mImage [%s]\x1b[21m\x1b[39m " % html.unescape(element.attributes["alt"]), ""
+        else:
+            return " \x1b[32m\x1b[1mImage\x1b[21m\x1b[39m ", ""
 
-                    if input_name:
-                        current_form.add_input(input_name, input_type, input_value)
+    def enter_form(self, element):
+        action = element.attributes.get("action", "")
+        method = element.attributes.get("method", "get").lower()
 
-                    if not input_type == "hidden":
-                        if not input_type == "checkbox":
-                            if input_name:
-                                self.rendered += "\x1b[35m\x1b[1mInput [%s: %s]\x1b[21m\x1b[39m\n" %\
-                                                 (input_name, input_type)
-                            else:
-                                self.rendered += "\x1b[35m\x1b[1mInput [%s]\x1b[21m\x1b[39m\n" % input_type
-                        else:
-                            if input_value:
-                                self.rendered += "\x1b[35m\x1b[1mCheckbox [%s] [x]\x1b[21m\x1b[39m\n" % input_name
-                            else:
-                                self.rendered += "\x1b[35m\x1b[1mCheckbox [%s] [ ]\x1b[21m\x1b[39m\n" % input_name
-                elif inner_element.name == "select":
-                    input_name = inner_element.attributes.get("name", "")
-                    input_value = inner_element.attributes.get("value", "")
+        current_form = Form(action, method)
 
-                    self.rendered += "\n\x1b[33m\x1b[1m---- Select ----\x1b[21m\x1b[39m\n"
+        # Register the form before its contents, so that a nested form can't take its index
+        form_index = self.register_form(current_form)
 
-                    # Handle the select options
-                    options = []
+        # Render the form differently if one can't submit it
+        if "action" in element.attributes:
+            prefix = "\n\x1b[36m\x1b[1m---- Form [#%d] ----\x1b[21m\x1b[39m\n" % form_index
+        else:
+            prefix = "\n\x1b[36m\x1b[1m---- Form ----\x1b[21m\x1b[39m\n"
 
-                    for option_element in inner_element.inner_elements:
-                        option_value = html.unescape(option_element.attributes.get("value", ""))
-                        option_text = ""
+        suffix = "\n\x1b[36m\x1b[1m---- End form ----\x1b[21m\x1b[39m\n"
 
-                        # Extract the option text
-                        for option_inner in option_element.inner_elements:
-                            if option_inner.is_text:
-                                option_text += html.unescape(option_inner.text)
+        # The inputs are collected while the form contents are rendered, however deep they are nested
+        self.outer_forms.append(self.current_form)
+        self.current_form = current_form
 
-                        option_text = option_text.strip().replace("\n", "")
-                        options.append((option_value, option_text))
+        return prefix, suffix
 
-                        if option_value == input_value:
-                            self.rendered += "\x1b[33m* %s [%s]\x1b[39m\n" % (option_text, option_value)
-                        else:
-                            self.rendered += "\x1b[33m. %s [%s]\x1b[39m\n" % (option_text, option_value)
+    def exit_form(self, element):
+        self.current_form = self.outer_forms.pop()
 
-                    current_form.add_select(input_name, input_value, options)
-                    self.rendered += "\x1b[33m\x1b[1m---- End select ----\x1b[21m\x1b[39m\n"
+        # The innermost open form ends on the line of its suffix
+        for form_lines in reversed(self.form_lines):
+            if form_lines[1] is None:
+                form_lines[1] = self.line_count - 1
+                break
 
+    def enter_input(self, element):
+        if not self.current_form:
+            return "", ""
+
+        input_name = element.attributes.get("name", "")
+        input_type = element.attributes.get("type", "")
+        input_value = self.input_value(element)
+
+        if input_name:
+            self.current_form.add_input(input_name, input_type, input_value)
+
+        if not input_type == "hidden":
+            if not input_type == "checkbox":
+                if input_name:
+                    self.write("\x1b[35m\x1b[1mInput [%s: %s]\x1b[21m\x1b[39m\n" % (input_name, input_type))
                 else:
-                    self.render_element(inner_element)
-                    self.render_form(inner_element, False, current_form)
+                    self.write("\x1b[35m\x1b[1mInput [%s]\x1b[21m\x1b[39m\n" % input_type)
+            else:
+                if input_value:
+                    self.write("\x1b[35m\x1b[1mCheckbox [%s] [x]\x1b[21m\x1b[39m\n" % input_name)
+                else:
+                    self.write("\x1b[35m\x1b[1mCheckbox [%s] [ ]\x1b[21m\x1b[39m\n" % input_name)
+
+    def input_value(self, element):
+        # A checked checkbox submits its name, other inputs their value
+        if element.attributes.get("type", "") == "checkbox" and "checked" in element.attributes:
+            return element.attributes.get("name", "")
+
+        return element.attributes.get("value", "")
+
+    def select_options(self, element):
+        options = []
+
+        for option_element in element.inner_elements:
+            option_value = html.unescape(option_element.attributes.get("value", ""))
+            option_text = ""
+
+            # Extract the option text
+            for option_inner in option_element.inner_elements:
+                if option_inner.is_text:
+                    option_text += html.unescape(option_inner.text)
+
+            option_text = option_text.strip().replace("\n", "")
+            options.append((option_value, option_text))
+
+        return options
+
+    def enter_select(self, element):
+        if not self.current_form:
+            return "", ""
+
+        input_name = element.attributes.get("name", "")
+        input_value = element.attributes.get("value", "")
+
+        self.write("\n\x1b[33m\x1b[1m---- Select ----\x1b[21m\x1b[39m\n")
+
+        # Handle the select options
+        options = self.select_options(element)
+
+        for option_value, option_text in options:
+            if option_value == input_value:
+                self.write("\x1b[33m* %s [%s]\x1b[39m\n" % (option_text, option_value))
+            else:
+                self.write("\x1b[33m. %s [%s]\x1b[39m\n" % (option_text, option_value))
+
+        self.current_form.add_select(input_name, input_value, options)
+        self.write("\x1b[33m\x1b[1m---- End select ----\x1b[21m\x1b[39m\n")
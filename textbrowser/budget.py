@@ -0,0 +1,18 @@
+class Budget(object):
+    """
+    Limits on how much of a page is downloaded, parsed and rendered.
+    A page over a limit is cut short and rendered up to that point with a marker, None means no limit.
+    """
+
+    def __init__(self, max_body_size=64 * 1024 * 1024, max_tokens=4 * 1024 * 1024, max_depth=4096,
+                 max_rendered_size=32 * 1024 * 1024):
+        """
+        Initializes this Budget object
+        :param max_body_size: the maximum size of the decoded body in bytes
+        :param max_tokens: the maximum number of tags and text runs to parse
+        :param max_depth: the maximum nesting depth of the elements
+        :param max_rendered_size: the maximum number of rendered characters
+        """
+
+        self.max_body_size, self.max_tokens = max_body_size, max_tokens
+        self.max_depth, self.max_rendered_size = max_depth, max_rendered_size
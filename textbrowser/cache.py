@@ -0,0 +1,468 @@
+import collections
+import email.utils
+import hashlib
+import http.client
+import json
+import os
+import re
+import time
+
+MAX_AGE = re.compile(r"max-age\s*=\s*\"?(\d+)")
+
+
+def default_cache_directory():
+    """
+    Gets the default cache directory
+    :return: the directory path
+    """
+
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "text-browser")
+
+
+def parse_date(value):
+    """
+    Parses an HTTP date
+    :param value: the header value
+    :return: the timestamp, or None if it can't be parsed
+    """
+
+    try:
+        return email.utils.parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+def freshness_lifetime(headers):
+    """
+    Works out for how long a response may be used without revalidating it
+    :param headers: the response headers
+    :return: the lifetime in seconds
+    """
+
+    cache_control = headers.get("Cache-Control", "").lower()
+
+    if "no-cache" in cache_control:
+        return 0
+
+    match = MAX_AGE.search(cache_control)
+
+    if match:
+        return int(match.group(1))
+
+    date = parse_date(headers.get("Date")) or time.time()
+
+    if "Expires" in headers:
+        expires = parse_date(headers["Expires"])
+        return max(0, expires - date) if expires else 0
+
+    # Heuristic freshness, a tenth of the time since the last modification
+    last_modified = parse_date(headers.get("Last-Modified"))
+
+    if last_modified:
+        return max(0, (date - last_modified) / 10)
+
+    return 0
+
+
+class CacheEntry(object):
+    """
+    The metadata of a cached response.
+    """
+
+    def __init__(self, url, headers, stored, size):
+        """
+        Initializes this CacheEntry object
+        :param url: the URL of the response, after the redirects
+        :param headers: a list of the (name, value) response headers
+        :param stored: when the response was stored or last revalidated
+        :param size: the body size in bytes
+        """
+
+        self.url, self.headers, self.stored, self.size = url, headers, stored, size
+
+    def get_headers(self):
+        """
+        Gets the stored response headers
+        :return: the headers as an HTTPMessage
+        """
+
+        message = http.client.HTTPMessage()
+
+        for name, value in self.headers:
+            message[name] = value
+
+        return message
+
+    def is_fresh(self):
+        """
+        Checks whether this entry can be used without revalidating it
+        :return: whether the entry is fresh
+        """
+
+        headers = self.get_headers()
+
+        try:
+            age = int(headers.get("Age", 0))
+        except ValueError:
+            age = 0
+
+        return age + time.time() - self.stored < freshness_lifetime(headers)
+
+    def validators(self):
+        """
+        Gets the headers that make a request conditional on this entry
+        :return: a dict of the request headers
+        """
+
+        headers = self.get_headers()
+        validators = {}
+
+        if "ETag" in headers:
+            validators["If-None-Match"] = headers["ETag"]
+
+        if "Last-Modified" in headers:
+            validators["If-Modified-Since"] = headers["Last-Modified"]
+
+        return validators
+
+
+class CachedResponse(object):
+    """
+    A response read back from the cache.
+    """
+
+    def __init__(self, url, headers, path):
+        """
+        Initializes this CachedResponse object
+        :param url: the URL of the response
+        :param headers: the response headers
+        :param path: the path of the stored body
+        """
+
+        self.url, self.headers = url, headers
+        self.status = 200
+        self.reason = "OK"
+        self.file = open(path, "rb")
+
+    def geturl(self):
+        """
+        Gets the URL of this response, after the redirects
+        :return: the URL
+        """
+
+        return self.url
+
+    def read(self, amt=None):
+        """
+        Reads the body of this response
+        :param amt: the maximum number of bytes to read, everything if None
+        :return: the bytes read, empty once the body was read completely
+        """
+
+        if self.file.closed:
+            return b""
+
+        data = self.file.read(amt) if amt is not None else self.file.read()
+
+        if not data:
+            self.file.close()
+
+        return data
+
+    def close(self):
+        """
+        Closes this response
+        """
+
+        self.file.close()
+
+
+class StoringResponse(object):
+    """
+    A network response that is stored in the cache as its body is read.
+    """
+
+    def __init__(self, cache, key, response):
+        """
+        Initializes this StoringResponse object
+        :param cache: the cache to store the response in
+        :param key: the cache key
+        :param response: the network response
+        """
+
+        self.cache, self.key, self.response = cache, key, response
+        self.status, self.reason, self.headers = response.status, response.reason, response.headers
+        self.temp_path = cache.path(key, ".tmp")
+        self.file = open(self.temp_path, "wb")
+        self.size = 0
+
+    def geturl(self):
+        """
+        Gets the URL of this response, after the redirects
+        :return: the URL
+        """
+
+        return self.response.geturl()
+
+    async def read(self, amt=None):
+        """
+        Reads the body of this response
+        :param amt: the maximum number of bytes to read, everything if None
+        :return: the bytes read, empty once the body was read completely
+        """
+
+        return self.store(await self.response.read(amt), amt)
+
+    def store(self, data, amt):
+        """
+        Writes the bytes read from the network to the cache
+        :param data: the bytes read
+        :param amt: the maximum number of bytes that were asked for
+        :return: the bytes read
+        """
+
+        if self.file.closed:
+            return data
+
+        if data:
+            self.file.write(data)
+            self.size += len(data)
+
+        if not data or amt is None:
+            self.file.close()
+            self.cache.commit(self.key, self.response, self.temp_path, self.size)
+
+        return data
+
+    def close(self):
+        """
+        Closes this response, a partially read body isn't stored
+        """
+
+        if not self.file.closed:
+            self.file.close()
+            os.remove(self.temp_path)
+
+        self.response.close()
+
+
+class HTTPCache(object):
+    """
+    An on-disk HTTP response cache with validation and LRU eviction.
+    """
+
+    def __init__(self, directory, max_size=64 * 1024 * 1024):
+        """
+        Initializes this HTTPCache object
+        :param directory: the directory to keep the responses in
+        :param max_size: the maximum total size of the stored bodies in bytes
+        """
+
+        self.directory, self.max_size = directory, max_size
+        os.makedirs(directory, exist_ok=True)
+
+        # Key -> body size, the least recently used first
+        self.entries = collections.OrderedDict()
+        self.total_size = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        self.evicted = 0
+
+        metadata = []
+
+        for name in os.listdir(directory):
+            if name.endswith(".json"):
+                path = os.path.join(directory, name)
+                metadata.append((os.path.getmtime(path), name[:-5]))
+            elif name.endswith(".tmp"):
+                os.remove(os.path.join(directory, name))
+
+        for _, key in sorted(metadata):
+            entry = self.load(key)
+
+            if entry:
+                self.entries[key] = entry.size
+                self.total_size += entry.size
+
+    @staticmethod
+    def key(url):
+        """
+        Gets the cache key for a URL
+        :param url: the URL
+        :return: the key
+        """
+
+        return hashlib.sha256(url.encode("utf-8")).hexdigest()
+
+    def path(self, key, extension):
+        """
+        Gets the path of a cache file
+        :param key: the cache key
+        :param extension: the file extension
+        :return: the path
+        """
+
+        return os.path.join(self.directory, key + extension)
+
+    def load(self, key):
+        """
+        Loads the metadata of an entry
+        :param key: the cache key
+        :return: the CacheEntry, or None if it is missing or broken
+        """
+
+        try:
+            with open(self.path(key, ".json"), "r", encoding="utf-8") as f:
+                metadata = json.load(f)
+
+            return CacheEntry(metadata["url"], metadata["headers"], metadata["stored"], metadata["size"])
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def save(self, key, entry):
+        """
+        Saves the metadata of an entry
+        :param key: the cache key
+        :param entry: the CacheEntry
+        """
+
+        with open(self.path(key, ".json"), "w", encoding="utf-8") as f:
+            json.dump({"url": entry.url, "headers": entry.headers, "stored": entry.stored, "size": entry.size}, f)
+
+    def touch(self, key):
+        """
+        Marks an entry as the most recently used one
+        :param key: the cache key
+        """
+
+        self.entries.move_to_end(key)
+        os.utime(self.path(key, ".json"))
+
+    def remove(self, key):
+        """
+        Removes an entry
+        :param key: the cache key
+        """
+
+        self.total_size -= self.entries.pop(key, 0)
+
+        for extension in [".json", ".body"]:
+            try:
+                os.remove(self.path(key, extension))
+            except OSError:
+                pass
+
+    def commit(self, key, response, temp_path, size):
+        """
+        Stores a completely read response
+        :param key: the cache key
+        :param response: the network response
+        :param temp_path: the path the body was written to
+        :param size: the body size in bytes
+        """
+
+        self.remove(key)
+
+        if size > self.max_size:
+            os.remove(temp_path)
+            return
+
+        os.replace(temp_path, self.path(key, ".body"))
+        self.save(key, CacheEntry(response.geturl(), list(response.headers.items()), time.time(), size))
+
+        self.entries[key] = size
+        self.total_size += size
+
+        while self.total_size > self.max_size:
+            self.remove(next(iter(self.entries)))
+            self.evicted += 1
+
+    def lookup(self, url):
+        """
+        Looks a URL up in the cache
+        :param url: the URL
+        :return: the cache key, the stored CacheEntry or None, and a CachedResponse if the entry is fresh
+        """
+
+        key = self.key(url)
+        entry = self.load(key) if key in self.entries else None
+
+        if entry and entry.is_fresh():
+            self.hits += 1
+            self.touch(key)
+            return key, entry, CachedResponse(entry.url, entry.get_headers(), self.path(key, ".body"))
+
+        return key, entry, None
+
+    def update(self, key, entry, response):
+        """
+        Handles a network response to a cached URL, the body of a 304 response must already be read
+        :param key: the cache key
+        :param entry: the stored CacheEntry, or None
+        :param response: the network response
+        :return: the response to use
+        """
+
+        if response.status == 304 and entry:
+            self.revalidated += 1
+
+            # The 304 response updates the stored headers
+            stored = entry.get_headers()
+
+            for name, value in response.headers.items():
+                del stored[name]
+                stored[name] = value
+
+            entry.headers = list(stored.items())
+            entry.stored = time.time()
+            self.save(key, entry)
+            self.touch(key)
+
+            return CachedResponse(entry.url, stored, self.path(key, ".body"))
+
+        self.misses += 1
+
+        cache_control = response.headers.get("Cache-Control", "").lower()
+        validated = "ETag" in response.headers or "Last-Modified" in response.headers
+
+        if response.status == 200 and "no-store" not in cache_control and\
+                (validated or freshness_lifetime(response.headers) > 0):
+            return StoringResponse(self, key, response)
+
+        return response
+
+    async def open(self, pool, url, data=None):
+        """
+        Requests a URL through the cache
+        :param pool: the AsyncConnectionPool to fetch from
+        :param url: the URL to request
+        :param data: the urlencoded body to POST, POST requests are never cached
+        :return: the response, its read() method is a coroutine unless it was served from the cache
+        """
+
+        if data is not None:
+            return await pool.open(url, data)
+
+        key, entry, cached = self.lookup(url)
+
+        if cached:
+            return cached
+
+        response = await pool.open(url, headers=entry.validators() if entry else None)
+
+        if response.status == 304:
+            await response.read()
+
+        return self.update(key, entry, response)
+
+    def stats(self):
+        """
+        Gets the cache counters
+        :return: a dict with the hit, miss, revalidation and eviction counts and the cache size
+        """
+
+        return {"hits": self.hits, "misses": self.misses, "revalidated": self.revalidated, "evicted": self.evicted,
+                "entries": len(self.entries), "size": self.total_size}
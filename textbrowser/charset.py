@@ -0,0 +1,136 @@
+import codecs
+import re
+
+DEFAULT_CHARSET = "utf-8"
+
+# The number of bytes looked at for a <meta> charset declaration before decoding starts
+SNIFF_SIZE = 4096
+
+BOMS = [
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+]
+
+# Labels that browsers treat as a superset encoding
+CHARSET_ALIASES = {
+    "iso-8859-1": "cp1252",
+    "latin1": "cp1252",
+    "latin-1": "cp1252",
+    "us-ascii": "cp1252",
+    "ascii": "cp1252",
+    "gb2312": "gbk",
+    "x-sjis": "shift_jis",
+}
+
+CONTENT_TYPE_CHARSET = re.compile(r"""charset\s*=\s*["']?\s*([\w.:-]+)""", re.IGNORECASE)
+
+META_CHARSET = re.compile(rb"""<meta[^>]*?charset\s*=\s*["']?\s*([\w.:-]+)""", re.IGNORECASE)
+
+
+def normalize_charset(label):
+    """
+    Resolves a charset label to a Python codec name
+    :param label: the charset label
+    :return: the codec name, or None if the charset is unknown
+    """
+
+    label = label.strip().lower()
+    label = CHARSET_ALIASES.get(label, label)
+
+    try:
+        return codecs.lookup(label).name
+    except LookupError:
+        return None
+
+
+def charset_from_headers(headers):
+    """
+    Gets the charset declared in the Content-Type header
+    :param headers: the response headers
+    :return: the codec name, or None if there is none or it is unknown
+    """
+
+    match = CONTENT_TYPE_CHARSET.search(headers.get("Content-Type", ""))
+    return normalize_charset(match.group(1)) if match else None
+
+
+def sniff_charset(data):
+    """
+    Looks for a byte order mark or a <meta> charset declaration at the start of a document
+    :param data: the first bytes of the document
+    :return: the codec name and whether it comes from a byte order mark, or None if nothing was found
+    """
+
+    for bom, charset in BOMS:
+        if data.startswith(bom):
+            return charset, True
+
+    match = META_CHARSET.search(data)
+
+    if match:
+        charset = normalize_charset(match.group(1).decode("ascii", errors="replace"))
+
+        # A declaration that could be read as ASCII can't be right about UTF-16
+        if charset and charset.startswith("utf-16"):
+            charset = "utf-8"
+
+        if charset:
+            return charset, False
+
+    return None
+
+
+class StreamDecoder(object):
+    """
+    Decodes a document as its bytes arrive, picking the charset from the byte order mark,
+    the Content-Type header or a <meta> declaration near the start, in that order.
+    Every byte is decoded exactly once, so a declaration after the sniffed prefix is ignored.
+    """
+
+    def __init__(self, charset=None, sniff_size=SNIFF_SIZE):
+        """
+        Initializes this StreamDecoder object
+        :param charset: the charset from the Content-Type header, or None
+        :param sniff_size: the number of bytes to look at before decoding starts
+        """
+
+        self.charset, self.sniff_size = charset, sniff_size
+
+        # With a header charset only a byte order mark can change it, so there is no need to wait long
+        self.needed = len(codecs.BOM_UTF8) if charset else sniff_size
+        self.buffer = b""
+        self.decoder = None
+
+    def start(self):
+        """
+        Picks the charset from the buffered bytes and creates the incremental decoder
+        """
+
+        sniffed = sniff_charset(self.buffer)
+
+        if sniffed and (sniffed[1] or not self.charset):
+            self.charset = sniffed[0]
+        elif not self.charset:
+            self.charset = DEFAULT_CHARSET
+
+        self.decoder = codecs.getincrementaldecoder(self.charset)(errors="replace")
+
+    def decode(self, data, final=False):
+        """
+        Decodes the next chunk of the document
+        :param data: the bytes
+        :param final: whether this is the last chunk
+        :return: the decoded text, empty while the start of the document is being sniffed
+        """
+
+        if self.decoder is None:
+            self.buffer += data
+
+            if len(self.buffer) < self.needed and not final:
+                return ""
+
+            self.start()
+            data, self.buffer = self.buffer, b""
+
+        return self.decoder.decode(data, final)
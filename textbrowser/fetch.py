@@ -0,0 +1,98 @@
+import zlib
+
+MAX_REDIRECTS = 10
+
+REDIRECT_STATUSES = [301, 302, 303, 307, 308]
+
+# Brotli would need an external module, so only the encodings zlib can decode are advertised
+DEFAULT_HEADERS = {"User-Agent": "text-browser", "Connection": "keep-alive", "Accept-Encoding": "gzip, deflate"}
+
+
+class ContentDecoder(object):
+    """
+    An incremental decoder for compressed response bodies.
+    """
+
+    def __init__(self, content_encoding):
+        """
+        Initializes this ContentDecoder object
+        :param content_encoding: the Content-Encoding header of the response
+        """
+
+        # The encodings are listed in the order they were applied
+        self.encodings = [encoding.strip().lower() for encoding in content_encoding.split(",")
+                          if encoding.strip().lower() not in ["", "identity"]]
+        self.encodings.reverse()
+
+        for encoding in self.encodings:
+            if encoding not in ["gzip", "x-gzip", "deflate"]:
+                raise ValueError("Unsupported content encoding: %s" % encoding)
+
+        self.decompressors = [self.new_decompressor(encoding) for encoding in self.encodings]
+
+        # Some servers send raw deflate data instead of the zlib format, which shows in the first bytes
+        self.started = [False] * len(self.encodings)
+
+    @staticmethod
+    def new_decompressor(encoding, raw=False):
+        """
+        Creates a decompressor
+        :param encoding: the content encoding
+        :param raw: whether deflate data comes without the zlib header
+        :return: the zlib decompress object
+        """
+
+        if encoding in ["gzip", "x-gzip"]:
+            return zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+        return zlib.decompressobj(-zlib.MAX_WBITS if raw else zlib.MAX_WBITS)
+
+    def decompress(self, data):
+        """
+        Decodes the next chunk of the body
+        :param data: the bytes as received
+        :return: the decoded bytes
+        """
+
+        for i, encoding in enumerate(self.encodings):
+            if not data:
+                break
+
+            decompressor = self.decompressors[i]
+
+            try:
+                decoded = decompressor.decompress(data)
+            except zlib.error:
+                if encoding != "deflate" or self.started[i]:
+                    raise
+
+                self.decompressors[i] = decompressor = self.new_decompressor(encoding, True)
+                decoded = decompressor.decompress(data)
+
+            self.started[i] = True
+
+            # A gzip body may consist of several members
+            while decompressor.eof and decompressor.unused_data:
+                unused_data = decompressor.unused_data
+                self.decompressors[i] = decompressor = self.new_decompressor(encoding)
+                decoded += decompressor.decompress(unused_data)
+
+            data = decoded
+
+        return data
+
+    def flush(self):
+        """
+        Decodes what is left of the body
+        :return: the decoded bytes
+        """
+
+        data = b""
+
+        for i, decompressor in enumerate(self.decompressors):
+            if data:
+                data = decompressor.decompress(data)
+
+            data += decompressor.flush()
+
+        return data
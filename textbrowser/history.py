@@ -0,0 +1,211 @@
+import sys
+
+from textbrowser.parser import NO_ATTRIBUTES
+
+
+def estimate_size(elements):
+    """
+    Estimates how much memory an element tree takes
+    :param elements: the top-level elements
+    :return: the size in bytes
+    """
+
+    size = 0
+    stack = list(elements)
+
+    while stack:
+        element = stack.pop()
+        size += sys.getsizeof(element)
+
+        if element.is_text:
+            size += sys.getsizeof(element.text)
+        else:
+            if element.attributes is not NO_ATTRIBUTES:
+                size += sys.getsizeof(element.attributes)
+                size += sum(sys.getsizeof(value) for value in element.attributes.values())
+
+            if element.inner_elements:
+                size += sys.getsizeof(element.inner_elements)
+                stack.extend(element.inner_elements)
+
+    return size
+
+
+def estimate_index_size(element_index, elements_counted):
+    """
+    Estimates how much memory an ElementIndex takes
+    :param element_index: the ElementIndex
+    :param elements_counted: whether the indexed element tree is already counted
+    :return: the size in bytes
+    """
+
+    size = sys.getsizeof(element_index.names) + sys.getsizeof(element_index.ids)
+    size += sys.getsizeof(element_index.targets) + sys.getsizeof(element_index.form_inputs)
+
+    for elements in element_index.names.values():
+        size += sys.getsizeof(elements)
+
+        # Every tag element is indexed, so the tree is its tag elements along with their text children
+        if not elements_counted:
+            for element in elements:
+                size += sys.getsizeof(element)
+
+                if element.attributes is not NO_ATTRIBUTES:
+                    size += sys.getsizeof(element.attributes)
+                    size += sum(sys.getsizeof(value) for value in element.attributes.values())
+
+                if element.inner_elements:
+                    size += sys.getsizeof(element.inner_elements)
+                    size += sum(sys.getsizeof(inner) + sys.getsizeof(inner.text)
+                                for inner in element.inner_elements if inner.is_text)
+
+    return size
+
+
+class HistoryEntry(object):
+    """
+    A visited page, along with what is needed to show it again without loading it.
+    """
+
+    def __init__(self, url, rendered=None, hyperlinks=None, forms=None, elements=None, line_index=None,
+                 element_index=None, current_form=None, truncated=None, transfer_size=0, decoded_size=0):
+        """
+        Initializes this HistoryEntry object
+        :param url: the URL of the page
+        :param rendered: the rendered page
+        :param hyperlinks: the hyperlinks of the page
+        :param forms: the forms of the page
+        :param elements: the element tree of the page, if it is kept
+        :param line_index: the LineIndex of the rendered page, if it is kept
+        :param element_index: the ElementIndex of the page, if it is kept
+        :param current_form: the form that was open when the page was left, if any
+        :param truncated: why the page was truncated, None if it is complete
+        :param transfer_size: the number of bytes transferred for the page
+        :param decoded_size: the number of bytes the body decoded to
+        """
+
+        self.url, self.rendered, self.hyperlinks, self.forms, self.elements, self.line_index = \
+            url, rendered, hyperlinks, forms, elements, line_index
+        self.element_index, self.current_form, self.truncated = element_index, current_form, truncated
+        self.transfer_size, self.decoded_size = transfer_size, decoded_size
+
+        self.size = 0
+
+        if rendered is not None:
+            self.size += sys.getsizeof(rendered) + sum(sys.getsizeof(hyperlink) for hyperlink in hyperlinks)
+
+        if elements is not None:
+            self.size += estimate_size(elements)
+
+        if line_index is not None:
+            self.size += line_index.size()
+
+        if element_index is not None:
+            self.size += estimate_index_size(element_index, elements is not None)
+
+    def is_loaded(self):
+        """
+        Checks whether the page can be shown without loading it again
+        :return: whether the page is kept
+        """
+
+        return self.rendered is not None
+
+    def drop(self):
+        """
+        Drops the kept page, only the URL is remembered
+        """
+
+        self.rendered, self.hyperlinks, self.forms, self.elements, self.line_index = None, None, None, None, None
+        self.element_index, self.current_form = None, None
+        self.size = 0
+
+
+class History(object):
+    """
+    A bounded back/forward history.
+    Pages are kept within a memory budget, the ones farthest from the current page are dropped first.
+    """
+
+    def __init__(self, max_entries=100, memory_budget=32 * 1024 * 1024, keep_elements=False):
+        """
+        Initializes this History object
+        :param max_entries: the maximum number of remembered URLs
+        :param memory_budget: the maximum size of the kept pages in bytes
+        :param keep_elements: whether to keep the element trees of the pages as well
+        """
+
+        self.max_entries, self.memory_budget, self.keep_elements = max_entries, memory_budget, keep_elements
+        self.entries = []
+        self.index = -1
+
+    def visit(self, entry):
+        """
+        Adds a newly visited page, dropping the forward history
+        :param entry: the HistoryEntry
+        """
+
+        del self.entries[self.index + 1:]
+        self.entries.append(entry)
+
+        if len(self.entries) > self.max_entries:
+            del self.entries[0]
+
+        self.index = len(self.entries) - 1
+        self.evict()
+
+    def replace(self, entry):
+        """
+        Replaces the current page, e.g. after loading a dropped one again
+        :param entry: the HistoryEntry
+        """
+
+        self.entries[self.index] = entry
+        self.evict()
+
+    def back(self):
+        """
+        Moves back in the history
+        :return: the previous HistoryEntry, or None if there is none
+        """
+
+        if self.index <= 0:
+            return None
+
+        self.index -= 1
+        return self.entries[self.index]
+
+    def forward(self):
+        """
+        Moves forward in the history
+        :return: the next HistoryEntry, or None if there is none
+        """
+
+        if self.index >= len(self.entries) - 1:
+            return None
+
+        self.index += 1
+        return self.entries[self.index]
+
+    def size(self):
+        """
+        Gets the size of the kept pages
+        :return: the size in bytes
+        """
+
+        return sum(entry.size for entry in self.entries)
+
+    def evict(self):
+        """
+        Drops the pages farthest from the current one until the kept ones fit into the memory budget
+        """
+
+        total = self.size()
+        by_distance = sorted(range(len(self.entries)), key=lambda i: abs(i - self.index), reverse=True)
+
+        for i in by_distance:
+            if total <= self.memory_budget or i == self.index:
+                break
+
+            total -= self.entries[i].size
+            self.entries[i].drop()
@@ -0,0 +1,204 @@
+import collections
+import cProfile
+import time
+import tracemalloc
+
+# The phases of a navigation, in the order they happen
+PHASES = ["fetch", "read", "decode", "tree-load", "parse", "render", "print"]
+
+
+def count_nodes(elements):
+    """
+    Counts the elements of a tree
+    :param elements: the top-level elements
+    :return: the number of elements
+    """
+
+    count = 0
+    stack = list(elements)
+
+    while stack:
+        element = stack.pop()
+        count += 1
+        stack.extend(element.inner_elements)
+
+    return count
+
+
+class NavigationStats(object):
+    """
+    The time, bytes and elements that went into each phase of loading a page.
+    """
+
+    def __init__(self, url):
+        """
+        Initializes this NavigationStats object
+        :param url: the URL of the page
+        """
+
+        self.url = url
+        self.status = None
+
+        # Phase name -> [seconds, bytes, elements]
+        self.phases = collections.OrderedDict()
+
+        self.seconds = 0.0
+        self.peak_memory = None
+
+    def add(self, phase, seconds, size=0, nodes=0):
+        """
+        Adds to the counters of a phase
+        :param phase: the phase name
+        :param seconds: the wall time spent
+        :param size: the number of bytes handled
+        :param nodes: the number of elements handled
+        """
+
+        counters = self.phases.get(phase)
+
+        if counters is None:
+            counters = self.phases[phase] = [0.0, 0, 0]
+
+        counters[0] += seconds
+        counters[1] += size
+        counters[2] += nodes
+
+    def report(self):
+        """
+        Formats these stats for the terminal
+        :return: a list of lines
+        """
+
+        lines = ["%s (%s, %.1f ms)" % (self.url, self.status, self.seconds * 1000)]
+
+        for phase in sorted(self.phases, key=lambda name: PHASES.index(name) if name in PHASES else len(PHASES)):
+            seconds, size, nodes = self.phases[phase]
+            line = "  %-10s %9.1f ms" % (phase, seconds * 1000)
+
+            if size:
+                line += " %10d bytes" % size
+
+            if nodes:
+                line += " %10d elements" % nodes
+
+            lines.append(line)
+
+        if self.peak_memory is not None:
+            lines.append("  %-10s %9d bytes" % ("peak", self.peak_memory))
+
+        return lines
+
+
+class Instrumentation(object):
+    """
+    Measures the phases of every navigation.
+    The browser calls lap() at the end of each phase, so the time between two laps goes to the phase just ended.
+    """
+
+    def __init__(self, memory=False, profile=None, max_navigations=20):
+        """
+        Initializes this Instrumentation object
+        :param memory: whether to trace the peak memory of every navigation with tracemalloc
+        :param profile: a path to write the cProfile stats of the last navigation to, or None
+        :param max_navigations: the number of navigations to keep the stats of
+        """
+
+        self.memory, self.profile = memory, profile
+        self.navigations = collections.deque(maxlen=max_navigations)
+        self.current = None
+        self.started = self.mark = 0.0
+
+        # Called with the NavigationStats of every finished navigation
+        self.hooks = []
+
+        self.profiler = None
+        self.tracing = False
+
+    def add_hook(self, hook):
+        """
+        Adds a function to call after every navigation
+        :param hook: a function taking the NavigationStats
+        """
+
+        self.hooks.append(hook)
+
+    def begin(self, url):
+        """
+        Starts measuring a navigation
+        :param url: the URL being loaded
+        :return: the NavigationStats being recorded
+        """
+
+        if self.current:
+            self.end("interrupted")
+
+        self.current = NavigationStats(url)
+
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.tracing = True
+
+        if self.memory:
+            tracemalloc.reset_peak()
+
+        if self.profile:
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+
+        self.started = self.mark = time.perf_counter()
+        return self.current
+
+    def lap(self, phase, size=0, nodes=0):
+        """
+        Ends a phase
+        :param phase: the phase name
+        :param size: the number of bytes handled
+        :param nodes: the number of elements handled
+        """
+
+        now = time.perf_counter()
+
+        if self.current:
+            self.current.add(phase, now - self.mark, size, nodes)
+
+        self.mark = now
+
+    def end(self, status="ok", navigation=None):
+        """
+        Finishes measuring the navigation
+        :param status: how the navigation ended
+        :param navigation: the NavigationStats returned by begin(), nothing is done if another one is being recorded
+        """
+
+        if self.current is None or navigation is not None and navigation is not self.current:
+            return
+
+        navigation, self.current = self.current, None
+
+        navigation.seconds = time.perf_counter() - self.started
+        navigation.status = status
+
+        if self.profiler:
+            self.profiler.disable()
+            self.profiler.dump_stats(self.profile)
+            self.profiler = None
+
+        if tracemalloc.is_tracing():
+            navigation.peak_memory = tracemalloc.get_traced_memory()[1]
+
+            if self.tracing:
+                tracemalloc.stop()
+                self.tracing = False
+
+        self.navigations.append(navigation)
+
+        for hook in self.hooks:
+            hook(navigation)
+
+    def last(self):
+        """
+        Gets the stats of the last finished navigation
+        :return: the NavigationStats, or None if there is none
+        """
+
+        return self.navigations[-1] if self.navigations else None
@@ -0,0 +1,160 @@
+import re
+import shutil
+import unicodedata
+
+ESCAPE_SEQUENCE = re.compile("\x1b(?:\\[[0-9;]*[A-Za-z]|c)")
+
+
+def display_width(text):
+    """
+    Measures how many terminal columns given text takes
+    :param text: the text to measure, it may contain ANSI escape sequences
+    :return: the display width
+    """
+
+    if "\x1b" in text:
+        text = ESCAPE_SEQUENCE.sub("", text)
+
+    if text.isascii():
+        return len(text)
+
+    width = 0
+
+    for char in text:
+        if unicodedata.combining(char):
+            continue
+
+        width += 2 if unicodedata.east_asian_width(char) in ("W", "F") else 1
+
+    return width
+
+
+class Layout(object):
+    """
+    A layout that fits text runs into lines of a given width.
+    """
+
+    def __init__(self, width=None):
+        """
+        Initializes this Layout object
+        :param width: the line width, defaults to the width of the terminal
+        """
+
+        if width is None:
+            width = shutil.get_terminal_size().columns
+
+        self.width = width
+
+    def wrap(self, text, column):
+        """
+        Breaks a text run into lines
+        :param text: the text to break
+        :param column: the column the text starts at
+        :return: the text with the line breaks inserted
+        """
+
+        pass
+
+
+class CharWrapLayout(Layout):
+    """
+    A layout that breaks the text after every width characters, even in the middle of a word.
+    """
+
+    def wrap(self, text, column):
+        """
+        Breaks a text run into lines
+        :param text: the text to break
+        :param column: the column the text starts at, ignored
+        :return: the text with the line breaks inserted
+        """
+
+        # Every line break starts a new piece which counts the break itself as its first character
+        pieces = text.split("\n")
+        pieces[1:] = ["\n" + piece for piece in pieces[1:]]
+        width = self.width
+
+        return "".join("\n".join(piece[i:i + width] for i in range(0, len(piece), width)) for piece in pieces)
+
+
+class WordWrapLayout(Layout):
+    """
+    A layout that breaks the text between words, continuing from the current column.
+    """
+
+    WORDS = re.compile(r"\S+|[^\S\n]+|\n")
+
+    def wrap(self, text, column):
+        """
+        Breaks a text run into lines
+        :param text: the text to break
+        :param column: the column the text starts at
+        :return: the text with the line breaks inserted
+        """
+
+        width = self.width
+
+        # Most runs fit on the current line
+        if "\n" not in text and column + display_width(text) <= width:
+            return text
+
+        lines = []
+
+        for word in self.WORDS.findall(text):
+            if word == "\n":
+                lines.append(word)
+                column = 0
+                continue
+
+            word_width = display_width(word)
+
+            if column + word_width <= width:
+                lines.append(word)
+                column += word_width
+            elif word.isspace():
+                # Spaces at the end of a line are replaced with the line break
+                lines.append("\n")
+                column = 0
+            else:
+                if column:
+                    # Spaces at the end of a line are replaced with the line break
+                    if lines and lines[-1].isspace():
+                        lines[-1] = "\n"
+                    else:
+                        lines.append("\n")
+
+                    column = 0
+
+                if word_width > width:
+                    word, column = self.break_word(word)
+                else:
+                    column = word_width
+
+                lines.append(word)
+
+        return "".join(lines)
+
+    def break_word(self, word):
+        """
+        Breaks a word that is longer than a line
+        :param word: the word to break
+        :return: the broken word and the column it ends at
+        """
+
+        pieces = []
+        column = 0
+
+        for char in word:
+            char_width = display_width(char)
+
+            if column + char_width > self.width:
+                pieces.append("\n")
+                column = 0
+
+            pieces.append(char)
+            column += char_width
+
+        return "".join(pieces), column
+
+
+LAYOUTS = {"word": WordWrapLayout, "char": CharWrapLayout}
@@ -0,0 +1,87 @@
+import shutil
+
+
+class Pager(object):
+    """
+    Shows a page a screen at a time.
+    The browser lays the page out only as far as it was viewed, plus a lookahead.
+    """
+
+    def __init__(self, height=None, lookahead=None):
+        """
+        Initializes this Pager object
+        :param height: the number of lines on a screen, defaults to the height of the terminal
+        :param lookahead: the number of lines to lay out past the screen, defaults to the height
+        """
+
+        if height is None:
+            # Leave room for the status line and the prompt
+            height = max(1, shutil.get_terminal_size().lines - 2)
+
+        if lookahead is None:
+            lookahead = height
+
+        self.height, self.lookahead = height, lookahead
+        self.reset()
+
+    def reset(self):
+        """
+        Forgets the lines of the previous page
+        """
+
+        self.lines = []
+        self.partial = ""
+        self.top = 0
+
+    def needed(self):
+        """
+        Gets the number of lines that must be laid out to show the current screen
+        :return: the number of lines
+        """
+
+        return self.top + self.height + self.lookahead
+
+    def collect(self, output, final=False):
+        """
+        Takes the rendered pieces out of the browser output and breaks them into lines
+        :param output: the list of rendered pieces, it is emptied
+        :param final: whether the page is completely rendered
+        """
+
+        lines = (self.partial + "".join(output)).split("\n")
+        del output[:]
+
+        self.partial = lines.pop()
+        self.lines += lines
+
+        if final and self.partial:
+            self.lines.append(self.partial)
+            self.partial = ""
+
+    def has_next(self):
+        """
+        Checks whether there are lines below the current screen, the lookahead must be collected
+        :return: whether there is a next screen
+        """
+
+        return len(self.lines) > self.top + self.height
+
+    def screen(self):
+        """
+        Gets the lines of the current screen
+        :return: the text of the screen
+        """
+
+        return "\n".join(self.lines[self.top:self.top + self.height])
+
+    def status(self, more):
+        """
+        Gets the status line of the current screen
+        :param more: whether the page goes on below the screen
+        :return: the status line
+        """
+
+        last = min(self.top + self.height, len(self.lines))
+        hint = "Enter for more" if more else "end"
+
+        return "\x1b[7m-- Lines %d-%d (%s) --\x1b[27m" % (min(self.top + 1, last), last, hint)
@@ -0,0 +1,329 @@
+import concurrent.futures
+import copyreg
+import gc
+import io
+import os
+import pickle
+import sys
+import types
+
+from textbrowser.parser import NO_ATTRIBUTES, TOKENIZERS, HTMLElement, HTMLParser, HTMLTag, TagElement, TextElement
+
+# Smaller segments take longer to send to a process than to parse
+MIN_SEGMENT_SIZE = 256 * 1024
+
+# Pickling a tree recurses a few times for every level of nesting,
+# a fragment nested deeper than this allows is parsed again by the main process instead
+PICKLE_RECURSION_LIMIT = 10000
+
+
+def no_attributes():
+    return NO_ATTRIBUTES
+
+
+def reduce_attributes(attributes):
+    # The shared empty attributes are the only mapping proxies in a tree, and must stay shared
+    return no_attributes, ()
+
+
+def reduce_tag_element(element):
+    return TagElement, (element.name, element.attributes, element.inner_elements)
+
+
+def reduce_text_element(element):
+    return TextElement, (element.text,)
+
+
+# Elements are rebuilt by calling their class, which is much faster than setting their slots one by one
+DISPATCH_TABLE = copyreg.dispatch_table.copy()
+DISPATCH_TABLE.update({
+    types.MappingProxyType: reduce_attributes,
+    TagElement: reduce_tag_element,
+    TextElement: reduce_text_element,
+})
+
+
+def split_points(text, count):
+    """
+    Finds where to split a document into segments, every segment but the first starts with a '<'
+    :param text: the document text
+    :param count: the number of segments wanted
+    :return: the start of every segment, there may be fewer than asked for
+    """
+
+    points = [0]
+
+    for i in range(1, count):
+        position = text.find("<", max(len(text) * i // count, points[-1] + 1))
+
+        if position == -1:
+            break
+
+        points.append(position)
+
+    return points
+
+
+def is_tag_start(tokenizer, name):
+    """
+    Checks whether a tokenizer is in the state a new one is in after reading a '<'.
+    That is the usual state at a '<', but not inside of a comment, or after a '!' in a tag.
+    :param tokenizer: the tokenizer
+    :param name: the name of its kind, one of TOKENIZERS
+    :return: whether a segment starting with the '<' can be tokenized by a new tokenizer
+    """
+
+    start = TOKENIZERS[name]()
+    list(start.feed("<"))
+
+    return vars(tokenizer) == vars(start)
+
+
+class FragmentParser(HTMLParser):
+    """
+    A parser for a segment of a document, as if the segment started inside of elements opened before it.
+    The closing tags of those elements and the parse errors are kept among the top-level elements, in order,
+    for the process building the whole tree to handle.
+    """
+
+    # Tag names never contain whitespace, so no closing tag can close the root
+    ROOT_NAME = " "
+
+    def __init__(self, tokenizer="slice"):
+        """
+        Initializes this FragmentParser object
+        :param tokenizer: the name of the tokenizer to use, one of TOKENIZERS
+        """
+
+        super().__init__(tokenizer)
+
+        self.root = TagElement(self.ROOT_NAME, NO_ATTRIBUTES, [])
+        self.current_element = self.root
+        self.inner_elements = self.root.inner_elements
+
+    def unexpected_closing_tag(self, token):
+        """
+        Keeps a closing tag that doesn't close the current element, or the error it would be reported with
+        :param token: the closing HTMLTag
+        """
+
+        if self.current_element is self.root:
+            self.root.inner_elements.append(token)
+        else:
+            self.root.inner_elements.append("Error: unexpected closing tag for %s %s" %
+                                            (self.current_element.name, token.name))
+
+    def open_elements(self):
+        """
+        Gets the elements that are still open
+        :return: a list of the elements, the outermost one first
+        """
+
+        if self.current_element is self.root:
+            return []
+
+        return self.prev_elements[1:] + [self.current_element]
+
+
+def nesting_depth(elements):
+    """
+    Measures how deeply elements are nested, counting the elements that were opened by the parser
+    :param elements: the top-level elements, other items are skipped
+    :return: the number of opened elements on the longest path down the tree
+    """
+
+    depth = 0
+    stack = [(element, 1) for element in elements if isinstance(element, TagElement)]
+
+    while stack:
+        element, level = stack.pop()
+
+        # Only the elements with a list of inner elements were opened, the empty ones share a tuple
+        if isinstance(element.inner_elements, list):
+            depth = max(depth, level)
+            stack.extend((inner_element, level + 1) for inner_element in element.inner_elements
+                         if not inner_element.is_text)
+
+    return depth
+
+
+def parse_segment(text, tokenizer="slice", last=False, nesting=False):
+    """
+    Parses a segment of a document, meant to run in a worker process.
+    The segment is tokenized as if it started the document, which gives the same tokens as the whole document
+    does unless the segment before it ends in an unusual state.
+    :param text: the segment text
+    :param tokenizer: the name of the tokenizer to use, one of TOKENIZERS
+    :param last: whether it is the last segment of the document
+    :param nesting: whether to measure how deeply the elements of the segment are nested
+    :return: the pickled fragment, see stitch(), the number of tokens in it and its nesting depth, 0 unless measured,
+             or None if it is nested too deeply to be pickled
+    """
+
+    parser = FragmentParser(tokenizer)
+    error = None
+
+    # The tree is built up to the error before it is raised, as it is when the whole document is parsed in one go
+    try:
+        parser.build(parser.tokenizer.feed(text))
+
+        if not last:
+            # The next segment starts with a '<', which ends the text or the tag being read
+            parser.build(parser.tokenizer.feed("<"))
+    except Exception as ex:
+        error = ex
+
+    carried = None
+
+    if not last and error is None and not is_tag_start(parser.tokenizer, tokenizer):
+        carried = parser.tokenizer
+
+    buffer = io.BytesIO()
+    pickler = pickle.Pickler(buffer, pickle.HIGHEST_PROTOCOL)
+    pickler.dispatch_table = DISPATCH_TABLE
+
+    recursion_limit = sys.getrecursionlimit()
+    sys.setrecursionlimit(max(recursion_limit, PICKLE_RECURSION_LIMIT))
+
+    try:
+        pickler.dump((parser.root.inner_elements, parser.open_elements(), parser.ignored_element, carried, error))
+    except RecursionError:
+        return None
+    finally:
+        sys.setrecursionlimit(recursion_limit)
+
+    depth = nesting_depth(parser.root.inner_elements) if nesting else 0
+
+    return buffer.getvalue(), parser.token_count, depth
+
+
+def stitch(parser, fragment):
+    """
+    Adds a fragment parsed by a worker to the tree being built
+    :param parser: the HTMLParser building the tree
+    :param fragment: the pickled fragment
+    :return: the tokenizer the next segment has to be tokenized with if it isn't a new one, otherwise None,
+             and the exception parsing the segment failed with, if it did
+    """
+
+    # Nothing but the elements is allocated while loading, so the garbage collector would only slow it down
+    collecting = gc.isenabled()
+    gc.disable()
+
+    try:
+        items, open_elements, ignored_element, carried, error = pickle.loads(fragment)
+    finally:
+        if collecting:
+            gc.enable()
+
+    for item in items:
+        if isinstance(item, HTMLElement):
+            parser.inner_elements.append(item)
+        elif isinstance(item, HTMLTag):
+            # A closing tag of an element opened before the segment
+            parser.build([item])
+        else:
+            print(item)
+
+    for element in open_elements:
+        parser.prev_elements.append(parser.current_element)
+        parser.current_element = element
+        parser.inner_elements = element.inner_elements
+
+    parser.ignored_element = ignored_element
+
+    return carried, error
+
+
+def parse_parallel(text, processes=None, tokenizer="slice", executor=None, min_segment_size=MIN_SEGMENT_SIZE,
+                   parser=None):
+    """
+    Parses given text, splitting it into segments that are parsed in a process pool.
+    The fragments are stitched together in document order, and a segment that doesn't start in the state its
+    worker assumed is parsed again here, so the tree is the same as the one of HTMLParser.parse().
+    The limits of the parser apply, a segment that may go over them is parsed again here to stop at the same token.
+    There is no index, HTMLParser is meant for that.
+    :param text: the text to be parsed
+    :param processes: the number of segments to parse at once, defaults to the number of CPUs
+    :param tokenizer: the name of the tokenizer to use, one of TOKENIZERS
+    :param executor: a ProcessPoolExecutor to use, or None to start one
+    :param min_segment_size: the minimum size of a segment in characters
+    :param parser: a new HTMLParser with the same tokenizer to build the tree with, or None to use one without limits
+    :return: a list of elements
+    """
+
+    if processes is None:
+        processes = os.cpu_count() or 1
+
+    if parser is None:
+        parser = HTMLParser(tokenizer)
+
+    count = min(processes, len(text) // max(min_segment_size, 1))
+
+    if count <= 1:
+        return parser.feed(text) + parser.close()
+
+    points = split_points(text, count) + [len(text)]
+    segments = [text[points[i]:points[i + 1]] for i in range(len(points) - 1)]
+
+    own_executor = executor is None
+
+    if own_executor:
+        executor = concurrent.futures.ProcessPoolExecutor(len(segments))
+
+    futures = []
+    max_tokens = parser.max_tokens if parser.max_tokens is not None else float("inf")
+    max_depth = parser.max_depth if parser.max_depth is not None else float("inf")
+
+    try:
+        futures = [executor.submit(parse_segment, segment, tokenizer, i == len(segments) - 1,
+                                   parser.max_depth is not None)
+                   for i, segment in enumerate(segments)]
+
+        # The tokenizer of the previous segment, if that one ended in a state a new tokenizer isn't in
+        carried = None
+
+        # The tree is stitched together while the later segments are still being parsed
+        for i, future in enumerate(futures):
+            result = future.result()
+            last = i == len(segments) - 1
+
+            if carried is None and parser.ignored_element is None and result is not None:
+                fragment, token_count, depth = result
+
+                if parser.token_count + token_count <= max_tokens and len(parser.prev_elements) + depth <= max_depth:
+                    # The closing tags of the elements opened before the segment are counted by the worker already
+                    parser_token_count = parser.token_count
+                    carried, error = stitch(parser, fragment)
+                    parser.token_count = parser_token_count + token_count
+
+                    if error is not None:
+                        raise error
+
+                    continue
+
+            # The segment doesn't start in the state its worker assumed, or may go over a limit, so it is parsed here
+            if carried is None:
+                carried, segment = TOKENIZERS[tokenizer](), segments[i]
+            else:
+                # Its '<' was read along with the previous segment
+                segment = segments[i][1:]
+
+            parser.build(carried.feed(segment))
+
+            if not last:
+                parser.build(carried.feed("<"))
+
+            if parser.truncated:
+                break
+
+            if last or is_tag_start(carried, tokenizer):
+                carried = None
+
+        return parser.close()
+    finally:
+        if own_executor:
+            executor.shutdown(cancel_futures=True)
+        else:
+            for future in futures:
+                future.cancel()
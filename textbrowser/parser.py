@@ -1,16 +1,30 @@
 import html
+import re
+import sys
+import types
 
 EMPTY_ELEMENTS = ["area", "base", "br", "col", "hr", "img", "input", "link", "meta", "param", "li", "hr",
                   "source", "track", "wbr"]
 
 IGNORED_ELEMENTS = ["script", "style", "svg", "iframe"]
 
+FORM_INPUT_ELEMENTS = ["input", "select", "textarea", "button"]
+
+# Changed whenever the parser builds a different tree from the same text, so that stored trees aren't used anymore
+PARSER_VERSION = 1
+
+# Shared by all the attribute-less tags and childless elements, so they must never be modified
+NO_ATTRIBUTES = types.MappingProxyType({})
+NO_ELEMENTS = ()
+
 
 class Token(object):
     """
     A token for the parser.
     """
 
+    __slots__ = ()
+
     def __init__(self, *args, **kwargs):
         pass
 
@@ -24,6 +38,8 @@ class TextToken(Token):
     A token for raw text.
     """
 
+    __slots__ = ("text",)
+
     def __init__(self, text, *args, **kwargs):
         """
         Initialized this TextToken object
@@ -51,6 +67,14 @@ class HTMLTag(Token):
     An HTML tag token.
     """
 
+    __slots__ = ("name", "is_closed", "is_closing", "attributes")
+
+    NAME = re.compile(r"\s*(\S*)")
+
+    # A name, optionally followed by a double-quoted, single-quoted or unquoted value.
+    # An unterminated quoted value runs until the end of the tag.
+    ATTRIBUTE = re.compile(r"""([^\s=/]+)(?:\s*=\s*(?:"([^"]*)"?|'([^']*)'?|(\S*)))?""")
+
     def __init__(self, name, is_closed, is_closing, attributes, *args, **kwargs):
         """
         Initializes this HTMLTag object
@@ -72,207 +96,636 @@ class HTMLTag(Token):
         :return: the parsed HTMLTag
         """
 
-        is_closed = False
-        is_closing = False
-        attributes = {}
-
         text = text.strip()
 
-        if text.startswith("/"):
-            is_closing = True
-            text = text[1:]
+        # Work on indices into the stripped text instead of slicing it again
+        is_closing = text.startswith("/")
+        start = 1 if is_closing else 0
 
-        if text.endswith("/"):
-            is_closed = True
-            text = text[:-1]
+        is_closed = len(text) > start and text.endswith("/")
+        end = len(text) - 1 if is_closed else len(text)
 
-        tag_name = text.split(" ")[0].strip().lower().replace("\t", "")
+        name_match = cls.NAME.match(text, start, end)
+        tag_name = name_match.group(1).lower()
 
-        if " " in text:
-            text = text[text.index(" ") + 1:]
-        else:
-            text = ""
-
-        key = ""
-        value = ""
-        value_started = False
-        escape_character = None
-
-        for i, char in enumerate(text):
-            if not value_started:
-                if char == "=":
-                    value_started = True
-                elif not char == " ":
-                    key += char
-                else:
-                    key = ""
-                    if key:
-                        attributes[key.strip().lower()] = key.strip().lower()
-                        key = ""
-            else:
-                if i == len(text) - 1 and not escape_character:
-                    value += char
+        attributes = {}
 
-                if char == escape_character or (escape_character is None and char in [" ", "/"]) or i == len(text) - 1:
-                    attributes[key.strip().lower()] = html.unescape(value)
-                    key = ""
-                    value = ""
-                    value_started = False
-                    escape_character = None
+        for match in cls.ATTRIBUTE.finditer(text, name_match.end(), end):
+            key = sys.intern(match.group(1).lower())
 
-                elif char in ["'", "\""]:
-                    escape_character = char
+            # Boolean attributes have no value, the attribute name stands for it
+            if match.lastindex == 1:
+                attributes[key] = key
+            else:
+                value = match.group(match.lastindex)
 
-                else:
-                    value += char
+                if "&" in value:
+                    value = html.unescape(value)
 
-        return cls(tag_name, is_closed, is_closing, attributes)
+                attributes[key] = value
+
+        # Tag names repeat all over a page, so every element shares the same string object
+        return cls(sys.intern(tag_name), is_closed, is_closing, attributes or NO_ATTRIBUTES)
 
     def __repr__(self):
         return "<HTMLTag %s is_closed: %r, is_closing: %r, attributes: %r>" % (self.name, self.is_closed,
-                                                                               self.is_closing, self.attributes)
+                                                                               self.is_closing, dict(self.attributes))
 
 
 class HTMLElement(object):
     """
-    An HTML element.
+    An HTML element, either a TextElement or a TagElement.
+    It can't be created directly anymore, create() takes the arguments its constructor used to.
     """
 
-    def __init__(self, is_text, name="", text="", attributes=None, inner_elements=None):
+    __slots__ = ()
+
+    # Defaults shared by all the elements that don't have their own
+    is_text = False
+    name = ""
+    text = ""
+    attributes = NO_ATTRIBUTES
+    inner_elements = NO_ELEMENTS
+
+    @staticmethod
+    def create(is_text, name="", text="", attributes=None, inner_elements=None):
         """
-        Initializes this HTMLElement object
-        :param is_text: whether this element is a text one
-        :param name: the name of this element
+        Creates an element
+        :param is_text: whether the element is a text one
+        :param name: the name of the element
         :param text: the inner text
-        :param attributes: the attributes of this element
-        :param inner_elements: the inner elements of this element
+        :param attributes: the attributes of the element
+        :param inner_elements: the inner elements of the element
+        :return: the TextElement or the TagElement
         """
 
-        if not attributes:
-            attributes = {}
-
-        if not inner_elements:
-            inner_elements = []
+        if is_text:
+            return TextElement(text)
 
-        self.is_text, self.name, self.text, self.attributes, self.inner_elements =\
-            is_text, name, text, attributes, inner_elements
+        return TagElement(name, attributes if attributes else {}, inner_elements if inner_elements else [])
 
     def __repr__(self):
         if self.is_text:
             return "<HTMLElement text: %s>" % self.text
         else:
             return "<HTMLElement name: %s, attributes: %r, inner_elements: %r>" %\
-                   (self.name, self.attributes, self.inner_elements)
+                   (self.name, dict(self.attributes), self.inner_elements)
 
 
-class HTMLParser(object):
+class TextElement(HTMLElement):
     """
-    An HTML parser that extracts the HTML elements from input text.
+    An HTML text element.
+    """
+
+    __slots__ = ("text",)
+
+    is_text = True
 
+    def __init__(self, text):
+        """
+        Initializes this TextElement object
+        :param text: the inner text
+        """
+
+        self.text = text
+
+
+class TagElement(HTMLElement):
+    """
+    An HTML element created from a tag.
     """
 
-    @staticmethod
-    def parse(text):
+    __slots__ = ("name", "attributes", "inner_elements")
+
+    def __init__(self, name, attributes=NO_ATTRIBUTES, inner_elements=NO_ELEMENTS):
         """
-        Parses given text
-        :param text: the text to be parsed
-        :return: a list of elements
+        Initializes this TagElement object
+        :param name: the name of this element
+        :param attributes: the attributes of this element
+        :param inner_elements: the inner elements of this element, a list if it can have any
         """
 
-        tag_started = False
-        comment = False
-        tag = ""
-        raw_text = ""
-        comment_text = ""
+        self.name, self.attributes, self.inner_elements = name, attributes, inner_elements
+
 
-        tokens = []
+class ElementIndex(object):
+    """
+    An index of the elements of a document, built while the tree is constructed,
+    so that elements can be found by tag name, id or form without walking the tree.
+    """
+
+    def __init__(self):
+        """
+        Initializes this ElementIndex object
+        """
+
+        # Tag name -> the elements, in document order
+        self.names = {}
+
+        # Id or anchor name -> the first element with it, and the set of those elements
+        self.ids = {}
+        self.targets = set()
+
+        # Form element -> its input elements, and the forms that are open while the tree is built
+        self.form_inputs = {}
+        self.open_forms = []
+
+    def add(self, element):
+        """
+        Adds an element to this index, in document order
+        :param element: the TagElement
+        """
+
+        name, attributes = element.name, element.attributes
+
+        if name in self.names:
+            self.names[name].append(element)
+        else:
+            self.names[name] = [element]
+
+        if attributes:
+            if "id" in attributes and attributes["id"] not in self.ids:
+                self.ids[attributes["id"]] = element
+                self.targets.add(element)
+
+            if name == "a" and "name" in attributes and attributes["name"] not in self.ids:
+                self.ids[attributes["name"]] = element
+                self.targets.add(element)
+
+        if name == "form":
+            self.form_inputs[element] = []
+        elif name in FORM_INPUT_ELEMENTS and self.open_forms:
+            self.form_inputs[self.open_forms[-1]].append(element)
+
+    def open(self, element):
+        """
+        Marks an element as open, its inner elements follow
+        :param element: the TagElement
+        """
+
+        if element.name == "form":
+            self.open_forms.append(element)
+
+    def close(self, element):
+        """
+        Marks an open element as closed
+        :param element: the TagElement
+        """
+
+        if element.name == "form" and self.open_forms:
+            self.open_forms.pop()
+
+    def find_all(self, name, attribute=None):
+        """
+        Finds the elements with a tag name
+        :param name: the tag name
+        :param attribute: an attribute the elements must have, e.g. "href" for all a[href]
+        :return: a list of the elements, in document order
+        """
+
+        elements = self.names.get(name, [])
+
+        if attribute is None:
+            return list(elements)
+
+        return [element for element in elements if attribute in element.attributes]
+
+    def find(self, name):
+        """
+        Finds the first element with a tag name
+        :param name: the tag name
+        :return: the element, or None if there is none
+        """
+
+        elements = self.names.get(name)
+        return elements[0] if elements else None
+
+    def get_by_id(self, element_id):
+        """
+        Finds the target of an in-page anchor
+        :param element_id: the id of the element, or the name of an a element
+        :return: the element, or None if there is none
+        """
+
+        return self.ids.get(element_id)
+
+    def get_forms(self):
+        """
+        Gets all the forms
+        :return: a list of the form elements, in document order
+        """
+
+        return self.find_all("form")
+
+    def get_inputs(self, form):
+        """
+        Gets the inputs of a form, nested forms keep their own
+        :param form: the form element
+        :return: a list of the input, select, textarea and button elements
+        """
+
+        return list(self.form_inputs.get(form, []))
+
+
+class Tokenizer(object):
+    """
+    A tokenizer that turns HTML text into TextTokens and HTMLTags.
+    """
+
+    def __init__(self):
+        """
+        Initializes this Tokenizer object
+        """
+
+        self.tag_started = False
+        self.comment = False
+        self.tag = ""
+        self.raw_text = ""
+
+    def feed(self, text):
+        """
+        Tokenizes given text, lazily
+        :param text: the text to tokenize
+        :return: a generator of tokens
+        """
+
+        pass
+
+
+class CharTokenizer(Tokenizer):
+    """
+    The original tokenizer that walks the text one character at a time.
+    """
+
+    def __init__(self):
+        """
+        Initializes this CharTokenizer object
+        """
+
+        super().__init__()
+        self.comment_text = ""
+
+    def feed(self, text):
+        """
+        Tokenizes given text, lazily
+        :param text: the text to tokenize
+        :return: a generator of tokens
+        """
 
         # Handle CRLF
         text = text.replace("\r", "")
 
         for char in text:
-            if not tag_started:
+            if not self.tag_started:
                 # Tag start
                 if char == "<":
-                    tag_started = True
+                    self.tag_started = True
 
-                    if raw_text.strip():
-                        tokens.append(TextToken.parse(raw_text))
+                    if self.raw_text.strip():
+                        yield TextToken.parse(self.raw_text)
 
-                    raw_text = ""
-                elif comment:
-                    comment_text += char
+                    self.raw_text = ""
+                elif self.comment:
+                    self.comment_text += char
 
-                    if (comment_text.startswith("DOCTYPE") and comment_text.endswith(">")) or\
-                            comment_text.endswith("-->"):
-                        comment_text = ""
-                        comment = False
+                    if (self.comment_text.startswith("DOCTYPE") and self.comment_text.endswith(">")) or\
+                            self.comment_text.endswith("-->"):
+                        self.comment_text = ""
+                        self.comment = False
                 else:
-                    raw_text += char
+                    self.raw_text += char
             else:
-                if len(raw_text) == 0 and char == "!":
-                    comment = True
-                    tag_started = False
+                if len(self.raw_text) == 0 and char == "!":
+                    self.comment = True
+                    self.tag_started = False
                 elif char == ">":
-                    tag = tag.replace("\n", " ")
+                    tag = self.tag.replace("\n", " ")
 
                     if tag.strip()[0] not in ["!", "?"]:
-                        tokens.append(HTMLTag.parse(tag))
+                        yield HTMLTag.parse(tag)
 
-                    tag = ""
-                    tag_started = False
+                    self.tag = ""
+                    self.tag_started = False
                 elif char == "<":
-                    tag = ""
+                    self.tag = ""
                 else:
-                    tag += char
+                    self.tag += char
+
+
+class SliceTokenizer(Tokenizer):
+    """
+    A tokenizer that scans the text by slices, jumping between delimiters with str.find.
+    It produces exactly the same tokens as the CharTokenizer.
+    """
+
+    TAG_DELIMITERS = re.compile("[<>!]")
+
+    # Raw tag -> its token, for the tags without attributes, which repeat all over a page.
+    # Shared by all the tokenizers, so that a tokenizer carries no state but the one of its position.
+    SIMPLE_TAGS = {}
+    MAX_SIMPLE_TAGS = 1024
+
+    def __init__(self):
+        """
+        Initializes this SliceTokenizer object
+        """
+
+        super().__init__()
+
+        # Only the start and the end of a comment decide where it stops, so the middle is never kept
+        self.comment_head = ""
+        self.comment_tail = ""
+
+    def feed(self, text):
+        """
+        Tokenizes given text, lazily
+        :param text: the text to tokenize
+        :return: a generator of tokens
+        """
+
+        # Handle CRLF
+        text = text.replace("\r", "")
+
+        position = 0
+        length = len(text)
+
+        while position < length:
+            if self.tag_started:
+                match = self.TAG_DELIMITERS.search(text, position)
 
-        elements = []
+                if not match:
+                    self.tag += text[position:]
+                    break
 
-        current_element = None
+                end = match.start()
+                char = text[end]
 
-        prev_elements = []
-        inner_elements = elements
-        ignored_element = None
+                if char == "!":
+                    self.tag += text[position:end]
+                    self.comment = True
+                    self.tag_started = False
+                elif char == ">":
+                    raw_tag = self.tag + text[position:end]
+                    token = self.SIMPLE_TAGS.get(raw_tag)
 
-        for token in tokens:
-            if isinstance(token, HTMLTag):
-                if token.is_closing and token.name not in EMPTY_ELEMENTS:
-                    if ignored_element:
-                        if token.name == ignored_element:
-                            ignored_element = None
+                    if token is not None:
+                        # Parsing a short tag costs more than finding it, so a known one isn't parsed again
+                        yield token
                     else:
-                        if current_element:
-                            last_open_tag = current_element.name
-                        else:
-                            last_open_tag = None
+                        tag = raw_tag.replace("\n", " ")
 
-                        if not token.name == last_open_tag:
-                            print("Error: unexpected closing tag for", current_element.name, token.name)
-                            continue
+                        if tag.strip()[0] not in ["!", "?"]:
+                            token = HTMLTag.parse(tag)
 
-                        current_element = prev_elements.pop()
+                            if token.attributes is NO_ATTRIBUTES and len(self.SIMPLE_TAGS) < self.MAX_SIMPLE_TAGS:
+                                self.SIMPLE_TAGS[raw_tag] = token
 
-                        if current_element:
-                            inner_elements = current_element.inner_elements
-                        else:
-                            inner_elements = elements
+                            yield token
+
+                    self.tag = ""
+                    self.tag_started = False
                 else:
-                    element = HTMLElement(False, name=token.name, attributes=token.attributes)
+                    self.tag = ""
 
-                    if ignored_element is None:
-                        if element.name not in IGNORED_ELEMENTS:
-                            inner_elements.append(element)
+                position = end + 1
+            elif self.comment:
+                stop = text.find("<", position)
 
-                            if not token.is_closed and token.name not in EMPTY_ELEMENTS:
-                                prev_elements.append(current_element)
-                                current_element = element
-                                inner_elements = current_element.inner_elements
-                        else:
-                            ignored_element = element.name
-            elif not ignored_element:
-                element = HTMLElement(True, text=token.text)
-                inner_elements.append(element)
+                if stop == -1:
+                    stop = length
+
+                segment = text[position:stop]
+                combined = self.comment_tail + segment
+                head = (self.comment_head + segment)[:7]
+                end = combined.find("-->")
+
+                if end != -1:
+                    end += 3 - len(self.comment_tail)
+
+                if head == "DOCTYPE":
+                    doctype_end = segment.find(">")
+
+                    if doctype_end != -1 and (end == -1 or doctype_end < end):
+                        end = doctype_end + 1
+
+                if end != -1:
+                    self.comment_head = ""
+                    self.comment_tail = ""
+                    self.comment = False
+                    position += end
+                    continue
+
+                self.comment_head = head
+                self.comment_tail = combined[-2:]
+
+                if stop < length:
+                    self.tag_started = True
+
+                position = stop + 1
+            else:
+                stop = text.find("<", position)
+
+                if stop == -1:
+                    self.raw_text += text[position:]
+                    break
+
+                raw_text = self.raw_text + text[position:stop]
+
+                if raw_text.strip():
+                    yield TextToken.parse(raw_text)
+
+                self.raw_text = ""
+                self.tag_started = True
+                position = stop + 1
+
+
+TOKENIZERS = {"slice": SliceTokenizer, "char": CharTokenizer}
+
+
+class HTMLParser(object):
+    """
+    An HTML parser that extracts the HTML elements from input text.
+    Text can be given all at once with parse() or in chunks with feed() and close().
+    """
 
-        if prev_elements:
+    def __init__(self, tokenizer="slice", index=None, max_tokens=None, max_depth=None):
+        """
+        Initializes this HTMLParser object
+        :param tokenizer: the name of the tokenizer to use, one of TOKENIZERS
+        :param index: an ElementIndex to fill while the tree is built, or None
+        :param max_tokens: the number of tokens after which parsing stops, or None
+        :param max_depth: the nesting depth at which parsing stops, or None
+        """
+
+        self.tokenizer = TOKENIZERS[tokenizer]()
+        self.index = index
+        self.max_tokens, self.max_depth = max_tokens, max_depth
+
+        # Why parsing stopped early, None while it goes on
+        self.truncated = None
+        self.token_count = 0
+
+        # Top-level elements that weren't returned yet, the last one may still be open
+        self.elements = []
+
+        self.current_element = None
+        self.prev_elements = []
+        self.inner_elements = self.elements
+        self.ignored_element = None
+
+    @staticmethod
+    def parse(text, tokenizer="slice", index=None, max_tokens=None, max_depth=None):
+        """
+        Parses given text
+        :param text: the text to be parsed
+        :param tokenizer: the name of the tokenizer to use, one of TOKENIZERS
+        :param index: an ElementIndex to fill while the tree is built, or None
+        :param max_tokens: the number of tokens after which parsing stops, or None
+        :param max_depth: the nesting depth at which parsing stops, or None
+        :return: a list of elements
+        """
+
+        parser = HTMLParser(tokenizer, index, max_tokens, max_depth)
+        return parser.feed(text) + parser.close()
+
+    @staticmethod
+    def iter_tokens(text, tokenizer="slice"):
+        """
+        Tokenizes given text without building the element tree
+        :param text: the text to be tokenized
+        :param tokenizer: the name of the tokenizer to use, one of TOKENIZERS
+        :return: a generator of tokens
+        """
+
+        return TOKENIZERS[tokenizer]().feed(text)
+
+    def feed(self, text):
+        """
+        Parses the next chunk of text, tags may be split across chunks.
+        The elements inside of the open ones are reached with open_elements(), so a page wrapped in a single
+        element can be shown before it is complete.
+        :param text: the chunk to be parsed
+        :return: a list of the top-level elements finished by this chunk
+        """
+
+        self.build(self.tokenizer.feed(text))
+
+        if self.current_element:
+            finished = len(self.elements) - 1
+        else:
+            finished = len(self.elements)
+
+        elements = self.elements[:finished]
+        del self.elements[:finished]
+
+        return elements
+
+    def open_elements(self):
+        """
+        Gets the elements that are still open, every one of their inner elements is complete but the next open one
+        :return: a list of the elements, the outermost one first
+        """
+
+        if self.current_element is None:
+            return []
+
+        return self.prev_elements[1:] + [self.current_element]
+
+    def close(self):
+        """
+        Finishes parsing
+        :return: a list of the remaining top-level elements, including the unclosed ones
+        """
+
+        if self.prev_elements and not self.truncated:
             print("Error: some tags weren't closed!")
+
+        elements = self.elements[:]
+        del self.elements[:]
+
         return elements
+
+    def unexpected_closing_tag(self, token):
+        """
+        Reports a closing tag that doesn't close the current element, the tag is ignored
+        :param token: the closing HTMLTag
+        """
+
+        print("Error: unexpected closing tag for", self.current_element.name, token.name)
+
+    def build(self, tokens):
+        """
+        Adds given tokens to the element tree, consuming them one by one
+        :param tokens: an iterable of the tokens to build the tree from
+        """
+
+        if self.truncated:
+            return
+
+        # The limits are checked for every token, against a local count
+        token_count = self.token_count
+        max_tokens = self.max_tokens if self.max_tokens is not None else float("inf")
+        max_depth = self.max_depth if self.max_depth is not None else float("inf")
+
+        # The count is kept even if building fails, for a caller that goes on from the error
+        try:
+            for token in tokens:
+                token_count += 1
+
+                if token_count > max_tokens:
+                    self.truncated = "more than %d tokens" % self.max_tokens
+                    break
+
+                if isinstance(token, HTMLTag):
+                    if token.is_closing and token.name not in EMPTY_ELEMENTS:
+                        if self.ignored_element:
+                            if token.name == self.ignored_element:
+                                self.ignored_element = None
+                        else:
+                            if self.current_element:
+                                last_open_tag = self.current_element.name
+                            else:
+                                last_open_tag = None
+
+                            if not token.name == last_open_tag:
+                                self.unexpected_closing_tag(token)
+                                continue
+
+                            if self.index is not None:
+                                self.index.close(self.current_element)
+
+                            self.current_element = self.prev_elements.pop()
+
+                            if self.current_element:
+                                self.inner_elements = self.current_element.inner_elements
+                            else:
+                                self.inner_elements = self.elements
+                    elif self.ignored_element is None:
+                        if token.name not in IGNORED_ELEMENTS:
+                            if not token.is_closed and token.name not in EMPTY_ELEMENTS:
+                                if len(self.prev_elements) >= max_depth:
+                                    self.truncated = "more than %d nested elements" % self.max_depth
+                                    break
+
+                                element = TagElement(token.name, token.attributes, [])
+                                self.inner_elements.append(element)
+
+                                if self.index is not None:
+                                    self.index.add(element)
+                                    self.index.open(element)
+
+                                self.prev_elements.append(self.current_element)
+                                self.current_element = element
+                                self.inner_elements = self.current_element.inner_elements
+                            else:
+                                element = TagElement(token.name, token.attributes)
+                                self.inner_elements.append(element)
+
+                                if self.index is not None:
+                                    self.index.add(element)
+                        else:
+                            self.ignored_element = token.name
+                elif not self.ignored_element:
+                    self.inner_elements.append(TextElement(token.text))
+        finally:
+            self.token_count = token_count
@@ -0,0 +1,223 @@
+import asyncio
+import inspect
+import io
+import urllib.parse
+
+
+class PrefetchedResponse(object):
+    """
+    A response whose body was fetched ahead of time.
+    """
+
+    def __init__(self, url, headers, body):
+        """
+        Initializes this PrefetchedResponse object
+        :param url: the URL of the response, after the redirects
+        :param headers: the response headers
+        :param body: the body bytes
+        """
+
+        self.url, self.headers = url, headers
+        self.status = 200
+        self.reason = "OK"
+        self.body = io.BytesIO(body)
+
+    def geturl(self):
+        """
+        Gets the URL of this response, after the redirects
+        :return: the URL
+        """
+
+        return self.url
+
+    def read(self, amt=None):
+        """
+        Reads the body of this response
+        :param amt: the maximum number of bytes to read, everything if None
+        :return: the bytes read, empty once the body was read completely
+        """
+
+        return self.body.read(amt)
+
+    def close(self):
+        """
+        Closes this response
+        """
+
+        self.body.close()
+
+
+def strip_fragment(url):
+    """
+    Removes the fragment from a URL
+    :param url: the URL
+    :return: the URL without the fragment
+    """
+
+    return urllib.parse.urldefrag(url)[0]
+
+
+class Prefetcher(object):
+    """
+    Fetches the hyperlinks of the current page in the background, so that following one doesn't wait for the network.
+    Only same-origin GET hyperlinks are prefetched, within a concurrency and a bandwidth budget.
+    """
+
+    def __init__(self, max_links=4, max_concurrency=2, max_page_size=512 * 1024, max_total_size=2 * 1024 * 1024):
+        """
+        Initializes this Prefetcher object
+        :param max_links: the maximum number of hyperlinks to prefetch for a page
+        :param max_concurrency: the maximum number of concurrent prefetches
+        :param max_page_size: the maximum size of a prefetched page in bytes, bigger ones are dropped
+        :param max_total_size: the maximum number of bytes prefetched for a page
+        """
+
+        self.max_links, self.max_concurrency = max_links, max_concurrency
+        self.max_page_size, self.max_total_size = max_page_size, max_total_size
+
+        # URL -> the task fetching it
+        self.tasks = {}
+        self.fetched_size = 0
+
+        self.started = 0
+        self.hits = 0
+        self.misses = 0
+        self.cancelled = 0
+
+    def candidates(self, page_url, hyperlinks, forms):
+        """
+        Picks the hyperlinks worth prefetching
+        :param page_url: the URL of the current page
+        :param hyperlinks: the resolved hyperlinks of the page, in page order
+        :param forms: the forms of the page
+        :return: a list of the URLs to prefetch
+        """
+
+        origin = urllib.parse.urlsplit(page_url)[:2]
+        skipped = {strip_fragment(page_url)}
+        skipped.update(strip_fragment(form.action) for form in forms)
+
+        urls = []
+
+        for hyperlink in hyperlinks:
+            url = strip_fragment(hyperlink)
+
+            if url in skipped or urllib.parse.urlsplit(url)[:2] != origin:
+                continue
+
+            skipped.add(url)
+            urls.append(url)
+
+            if len(urls) == self.max_links:
+                break
+
+        return urls
+
+    def start(self, page_url, hyperlinks, forms, open_url):
+        """
+        Starts prefetching the hyperlinks of a page, cancelling the previous prefetches
+        :param page_url: the URL of the page
+        :param hyperlinks: the resolved hyperlinks of the page
+        :param forms: the forms of the page, their actions are never prefetched
+        :param open_url: a coroutine function that opens a URL and returns the response
+        """
+
+        self.cancel()
+        self.fetched_size = 0
+
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        for url in self.candidates(page_url, hyperlinks, forms):
+            self.tasks[url] = asyncio.ensure_future(self.prefetch(url, open_url, semaphore))
+            self.started += 1
+
+    async def prefetch(self, url, open_url, semaphore):
+        """
+        Prefetches a URL
+        :param url: the URL
+        :param open_url: a coroutine function that opens a URL and returns the response
+        :param semaphore: the semaphore limiting the concurrent prefetches
+        :return: the PrefetchedResponse, or None if the page is over the budget
+        """
+
+        async with semaphore:
+            response = await open_url(url)
+
+            try:
+                chunks = []
+                size = 0
+
+                while True:
+                    chunk = response.read(16384)
+
+                    if inspect.isawaitable(chunk):
+                        chunk = await chunk
+
+                    if not chunk:
+                        break
+
+                    size += len(chunk)
+                    self.fetched_size += len(chunk)
+
+                    if size > self.max_page_size or self.fetched_size > self.max_total_size:
+                        return None
+
+                    chunks.append(chunk)
+            finally:
+                response.close()
+
+        return PrefetchedResponse(response.geturl(), response.headers, b"".join(chunks))
+
+    async def take(self, url):
+        """
+        Takes the prefetched response of a URL, waiting for it if it is still being fetched
+        :param url: the URL
+        :return: the PrefetchedResponse, or None if the URL wasn't prefetched
+        """
+
+        task = self.tasks.pop(strip_fragment(url), None)
+
+        if task is None:
+            self.misses += 1
+            return None
+
+        try:
+            response = await asyncio.shield(task)
+        except asyncio.CancelledError:
+            task.cancel()
+            raise
+        except Exception:
+            response = None
+
+        if response is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+
+        return response
+
+    def cancel(self):
+        """
+        Cancels the prefetches that weren't taken
+        """
+
+        for task in self.tasks.values():
+            if not task.done():
+                task.cancel()
+                self.cancelled += 1
+            elif not task.cancelled():
+                # Failed prefetches don't matter, but their exceptions must be retrieved
+                task.exception()
+
+        self.tasks = {}
+
+    def stats(self):
+        """
+        Gets the prefetch counters
+        :return: a dict with the number of started, cancelled and taken prefetches, and the hit rate
+        """
+
+        taken = self.hits + self.misses
+
+        return {"started": self.started, "cancelled": self.cancelled, "hits": self.hits, "misses": self.misses,
+                "hit_rate": self.hits / taken if taken else 0.0}
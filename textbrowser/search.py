@@ -0,0 +1,197 @@
+import array
+import bisect
+import collections
+import itertools
+import re
+import sys
+
+from textbrowser.layout import ESCAPE_SEQUENCE
+
+# The number of patterns whose matches are remembered
+MAX_PATTERNS = 8
+
+
+def strip_escapes(text):
+    """
+    Removes the terminal escape sequences from rendered text
+    :param text: the rendered text
+    :return: the plain text
+    """
+
+    return ESCAPE_SEQUENCE.sub("", text)
+
+
+class LineIndex(object):
+    """
+    The plain text of a rendered page, line by line, along with the lines of its hyperlinks and forms.
+    It is built once as the page is rendered, and the matches of a pattern are only searched for in the lines
+    added since the last search with it.
+    """
+
+    def __init__(self, hyperlink_lines=None, form_lines=None):
+        """
+        Initializes this LineIndex object
+        :param hyperlink_lines: the line of every hyperlink, in hyperlink index order
+        :param form_lines: the first and the last line of every form, in form index order, the last one is None
+                           while the form is open
+        """
+
+        self.hyperlink_lines = hyperlink_lines if hyperlink_lines is not None else []
+        self.form_lines = form_lines if form_lines is not None else []
+
+        # The text is kept in blocks of whole lines, with the first line number of each block
+        # and the offset of every line in it
+        self.blocks = []
+        self.block_lines = []
+        self.line_count = 0
+        self.partial = ""
+
+        # Pattern -> [matching line numbers, number of blocks searched], the least recently used first
+        self.matches = collections.OrderedDict()
+
+    def feed(self, text, final=False):
+        """
+        Adds rendered text, a line is only indexed once it is complete
+        :param text: the rendered text, with escape sequences
+        :param final: whether the page is completely rendered
+        """
+
+        text = self.partial + text
+        line_break = text.rfind("\n")
+
+        if final:
+            self.partial = ""
+        else:
+            self.partial = text[line_break + 1:]
+            text = text[:line_break + 1]
+
+        if text:
+            self.add(strip_escapes(text))
+
+    def add_lines(self, lines):
+        """
+        Adds complete rendered lines
+        :param lines: the lines, with escape sequences and without line breaks
+        """
+
+        if lines:
+            self.add(strip_escapes("\n".join(lines)) + "\n")
+
+    def add(self, text):
+        """
+        Adds a block of plain text
+        :param text: the text, ending with a line break unless it is the end of the page
+        """
+
+        lines = text.split("\n")
+
+        if text.endswith("\n"):
+            lines.pop()
+
+        offsets = array.array("I", [0])
+        offsets.extend(itertools.accumulate(len(line) + 1 for line in lines))
+
+        self.blocks.append((text, offsets))
+        self.block_lines.append(self.line_count)
+        self.line_count += len(lines)
+
+    def line(self, number):
+        """
+        Gets the plain text of a line
+        :param number: the line number
+        :return: the text
+        """
+
+        block = bisect.bisect_right(self.block_lines, number) - 1
+        text, offsets = self.blocks[block]
+        line = number - self.block_lines[block]
+
+        return text[offsets[line]:offsets[line + 1] - 1]
+
+    def search(self, pattern):
+        """
+        Finds the lines a pattern is on, it is case sensitive only if it has uppercase letters
+        :param pattern: the text to look for
+        :return: the sorted line numbers
+        """
+
+        entry = self.matches.get(pattern)
+
+        if entry is None:
+            entry = self.matches[pattern] = [[], 0]
+
+            if len(self.matches) > MAX_PATTERNS:
+                self.matches.popitem(last=False)
+        else:
+            self.matches.move_to_end(pattern)
+
+        lines, searched = entry
+
+        if searched < len(self.blocks):
+            flags = 0 if pattern != pattern.lower() else re.IGNORECASE
+            regex = re.compile(re.escape(pattern), flags)
+
+            for block in range(searched, len(self.blocks)):
+                text, offsets = self.blocks[block]
+                first_line = self.block_lines[block]
+                match = regex.search(text)
+
+                while match:
+                    line = bisect.bisect_right(offsets, match.start()) - 1
+                    lines.append(first_line + line)
+
+                    # Only the first match on a line counts
+                    match = regex.search(text, offsets[line + 1])
+
+            entry[1] = len(self.blocks)
+
+        return lines
+
+    def find(self, pattern, start=0):
+        """
+        Finds the first line a pattern is on, starting from a line
+        :param pattern: the text to look for
+        :param start: the first line to look at
+        :return: the line number, or None if the pattern isn't on the indexed lines
+        """
+
+        lines = self.search(pattern)
+        i = bisect.bisect_left(lines, start)
+
+        return lines[i] if i < len(lines) else None
+
+    def hyperlinks_on(self, line):
+        """
+        Gets the hyperlinks on a line
+        :param line: the line number
+        :return: a range of hyperlink indices
+        """
+
+        return range(bisect.bisect_left(self.hyperlink_lines, line), bisect.bisect_right(self.hyperlink_lines, line))
+
+    def forms_on(self, line):
+        """
+        Gets the forms a line is part of
+        :param line: the line number
+        :return: a list of form indices, the outermost form first
+        """
+
+        forms = []
+
+        for i, (first, last) in enumerate(self.form_lines):
+            # The forms are in the order they start in
+            if first > line:
+                break
+
+            if last is None or line <= last:
+                forms.append(i)
+
+        return forms
+
+    def size(self):
+        """
+        Estimates how much memory this index takes
+        :return: the size in bytes
+        """
+
+        return sum(sys.getsizeof(text) + sys.getsizeof(offsets) for text, offsets in self.blocks)
@@ -0,0 +1,392 @@
+import array
+import collections
+import hashlib
+import mmap
+import os
+import struct
+import sys
+
+from textbrowser.parser import NO_ATTRIBUTES, NO_ELEMENTS, PARSER_VERSION, TagElement, TextElement
+
+FORMAT_VERSION = 2
+
+# The magic, the format version, a byte order mark, the node, attribute, top-level element and string counts
+# and the decoded size of the body the tree was parsed from
+HEADER = struct.Struct("=4sIIIIIIQ")
+MAGIC = b"TBTR"
+BYTE_ORDER_MARK = 0x01020304
+
+# Node kinds
+TEXT_NODE = 0
+OPEN_NODE = 1
+VOID_NODE = 2
+
+# Every node is (kind, string index of its name or text, attribute count, inner element count)
+NODE_FIELDS = 4
+
+
+def tree_key(body, headers=None):
+    """
+    Gets the cache key of a page body
+    :param body: the raw body bytes
+    :param headers: the response headers, the ones that change how the body is decoded are part of the key
+    :return: a hashlib object, the body may still be added to it with update()
+    """
+
+    key = hashlib.sha256()
+
+    # The trees of an older parser may differ from the ones it builds now
+    key.update(b"parser %d\n" % PARSER_VERSION)
+
+    if headers is not None:
+        for name in ["Content-Encoding", "Content-Type"]:
+            key.update(headers.get(name, "").encode("utf-8", errors="replace") + b"\n")
+
+    key.update(body)
+    return key
+
+
+def encode_tree(elements, decoded_size=0):
+    """
+    Encodes an element tree as flat arrays
+    :param elements: the top-level elements
+    :param decoded_size: the size of the decoded body the tree was parsed from, in bytes
+    :return: the encoded bytes
+    """
+
+    nodes = array.array("I")
+    attributes = array.array("I")
+    tops = array.array("I")
+    strings = {}
+
+    def string_index(text):
+        index = strings.get(text)
+
+        if index is None:
+            index = strings[text] = len(strings)
+
+        return index
+
+    # The nodes are stored in document order, so the inner elements of a node follow it
+    for top_element in elements:
+        tops.append(len(nodes) // NODE_FIELDS)
+        tops.append(len(attributes) // 2)
+
+        stack = [top_element]
+
+        while stack:
+            element = stack.pop()
+
+            if element.is_text:
+                nodes.extend((TEXT_NODE, string_index(element.text), 0, 0))
+                continue
+
+            kind = VOID_NODE if element.inner_elements is NO_ELEMENTS else OPEN_NODE
+            nodes.extend((kind, string_index(element.name), len(element.attributes), len(element.inner_elements)))
+
+            for name, value in element.attributes.items():
+                attributes.append(string_index(name))
+                attributes.append(string_index(value))
+
+            stack.extend(reversed(element.inner_elements))
+
+    encoded = [text.encode("utf-8", errors="surrogatepass") for text in strings]
+    offsets = array.array("I", [0])
+
+    for data in encoded:
+        offsets.append(offsets[-1] + len(data))
+
+    header = HEADER.pack(MAGIC, FORMAT_VERSION, BYTE_ORDER_MARK, len(nodes) // NODE_FIELDS, len(attributes) // 2,
+                         len(tops) // 2, len(strings), decoded_size)
+
+    return b"".join([header, nodes.tobytes(), attributes.tobytes(), tops.tobytes(), offsets.tobytes()] + encoded)
+
+
+class StoredTree(object):
+    """
+    An element tree read from its flat encoding.
+    The arrays are used in place and the strings are decoded only when an element needs them.
+    """
+
+    def __init__(self, buffer):
+        """
+        Initializes this StoredTree object
+        :param buffer: the encoded bytes, e.g. a memory-mapped file
+        """
+
+        magic, version, byte_order, node_count, attribute_count, top_count, string_count, self.decoded_size = \
+            HEADER.unpack_from(buffer)
+
+        if magic != MAGIC or version != FORMAT_VERSION or byte_order != BYTE_ORDER_MARK:
+            raise ValueError("Not a parse tree of this format")
+
+        self.buffer = memoryview(buffer)
+        position = HEADER.size
+
+        def section(count):
+            nonlocal position
+            view = self.buffer[position:position + count * 4].cast("I")
+            position += count * 4
+            return view
+
+        self.nodes = section(node_count * NODE_FIELDS)
+        self.attributes = section(attribute_count * 2)
+        self.tops = section(top_count * 2)
+        self.offsets = section(string_count + 1)
+        self.string_data = self.buffer[position:]
+
+        self.strings = [None] * string_count
+
+        # Why building stopped early, None if it didn't, and the number of nodes built
+        self.truncated = None
+        self.node_count = 0
+
+    def __len__(self):
+        return len(self.tops) // 2
+
+    def string(self, index):
+        """
+        Gets a string from the string table
+        :param index: the string index
+        :return: the string
+        """
+
+        text = self.strings[index]
+
+        if text is None:
+            text = str(self.string_data[self.offsets[index]:self.offsets[index + 1]], "utf-8", "surrogatepass")
+            self.strings[index] = text
+
+        return text
+
+    def iter_elements(self, index=None, max_nodes=None, max_depth=None):
+        """
+        Builds the top-level elements one by one, up to the limits, like HTMLParser does
+        :param index: an ElementIndex to fill as the elements are built, or None
+        :param max_nodes: the number of nodes after which building stops, or None
+        :param max_depth: the nesting depth at which building stops, or None
+        :return: a generator of the top-level elements, the last one is incomplete if building stopped early
+        """
+
+        self.truncated = None
+        self.node_count = 0
+
+        for i in range(0, len(self.tops), 2):
+            element = self.build(self.tops[i], self.tops[i + 1], index, max_nodes, max_depth)
+
+            if element is not None:
+                yield element
+
+            if self.truncated:
+                return
+
+    def build(self, node, attribute, index=None, max_nodes=None, max_depth=None):
+        """
+        Builds the element tree of a top-level element
+        :param node: the index of its node
+        :param attribute: the index of its first attribute
+        :param index: an ElementIndex to fill, or None
+        :param max_nodes: the total number of nodes after which building stops, or None
+        :param max_depth: the nesting depth at which building stops, or None
+        :return: the element, or None if building stopped before it
+        """
+
+        nodes, attributes, string = self.nodes, self.attributes, self.string
+
+        root = None
+
+        # The open elements, with the number of inner elements each one still needs
+        stack = []
+
+        # The limits are checked for every node, against a local count
+        node_count = self.node_count
+        node_limit = max_nodes if max_nodes is not None else float("inf")
+        depth_limit = max_depth if max_depth is not None else float("inf")
+
+        while True:
+            position = node * NODE_FIELDS
+            kind, string_index, attribute_count, inner_count = nodes[position:position + NODE_FIELDS]
+            node += 1
+            node_count += 1
+
+            if node_count > node_limit:
+                self.truncated = "more than %d nodes" % max_nodes
+                break
+
+            if kind == OPEN_NODE and len(stack) >= depth_limit:
+                self.truncated = "more than %d nested elements" % max_depth
+                break
+
+            if kind == TEXT_NODE:
+                element = TextElement(string(string_index))
+            else:
+                if attribute_count:
+                    element_attributes = {}
+
+                    for i in range(attribute * 2, (attribute + attribute_count) * 2, 2):
+                        element_attributes[string(attributes[i])] = string(attributes[i + 1])
+
+                    attribute += attribute_count
+                else:
+                    element_attributes = NO_ATTRIBUTES
+
+                name = sys.intern(string(string_index))
+
+                if kind == OPEN_NODE:
+                    element = TagElement(name, element_attributes, [])
+                else:
+                    element = TagElement(name, element_attributes)
+
+                if index is not None:
+                    index.add(element)
+
+            if stack:
+                stack[-1][0].inner_elements.append(element)
+                stack[-1][1] -= 1
+            else:
+                root = element
+
+            if kind == OPEN_NODE:
+                if index is not None:
+                    index.open(element)
+
+                stack.append([element, inner_count])
+
+            # Finish the elements whose inner elements are all built
+            while stack and not stack[-1][1]:
+                finished = stack.pop()[0]
+
+                if index is not None:
+                    index.close(finished)
+
+            if not stack:
+                break
+
+        self.node_count = node_count
+        return root
+
+
+class TreeCache(object):
+    """
+    An on-disk cache of parsed element trees, keyed by the hash of the page body, with LRU eviction.
+    """
+
+    def __init__(self, directory, max_size=64 * 1024 * 1024):
+        """
+        Initializes this TreeCache object
+        :param directory: the directory to keep the trees in
+        :param max_size: the maximum total size of the stored trees in bytes
+        """
+
+        self.directory, self.max_size = directory, max_size
+        os.makedirs(directory, exist_ok=True)
+
+        # Key -> tree size, the least recently used first
+        self.entries = collections.OrderedDict()
+        self.total_size = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+
+        trees = []
+
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+
+            if name.endswith(".tree"):
+                trees.append((os.path.getmtime(path), name[:-5], os.path.getsize(path)))
+            elif name.endswith(".tmp"):
+                os.remove(path)
+
+        for _, key, size in sorted(trees):
+            self.entries[key] = size
+            self.total_size += size
+
+    def path(self, key, extension=".tree"):
+        """
+        Gets the path of a stored tree
+        :param key: the cache key
+        :param extension: the file extension
+        :return: the path
+        """
+
+        return os.path.join(self.directory, key + extension)
+
+    def load(self, key):
+        """
+        Loads a stored tree
+        :param key: the cache key, a hex digest from tree_key()
+        :return: the StoredTree, or None if there is none
+        """
+
+        if key not in self.entries:
+            self.misses += 1
+            return None
+
+        try:
+            with open(self.path(key), "rb") as f:
+                buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+            tree = StoredTree(buffer)
+        except (OSError, ValueError, struct.error):
+            self.remove(key)
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.entries.move_to_end(key)
+        os.utime(self.path(key))
+
+        return tree
+
+    def store(self, key, elements, decoded_size=0):
+        """
+        Stores a parsed tree
+        :param key: the cache key, a hex digest from tree_key()
+        :param elements: the top-level elements
+        :param decoded_size: the size of the decoded body the tree was parsed from, in bytes
+        """
+
+        data = encode_tree(elements, decoded_size)
+
+        self.remove(key)
+
+        if len(data) > self.max_size:
+            return
+
+        temp_path = self.path(key, ".tmp")
+
+        with open(temp_path, "wb") as f:
+            f.write(data)
+
+        os.replace(temp_path, self.path(key))
+
+        self.entries[key] = len(data)
+        self.total_size += len(data)
+
+        while self.total_size > self.max_size:
+            self.remove(next(iter(self.entries)))
+            self.evicted += 1
+
+    def remove(self, key):
+        """
+        Removes a stored tree
+        :param key: the cache key
+        """
+
+        self.total_size -= self.entries.pop(key, 0)
+
+        try:
+            os.remove(self.path(key))
+        except OSError:
+            pass
+
+    def stats(self):
+        """
+        Gets the cache counters
+        :return: a dict with the hit, miss and eviction counts and the cache size
+        """
+
+        return {"hits": self.hits, "misses": self.misses, "evicted": self.evicted,
+                "entries": len(self.entries), "size": self.total_size}